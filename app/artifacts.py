@@ -0,0 +1,111 @@
+import os
+import shutil
+import time
+
+# Хранилище артефактов пайплайна на общем томе.
+# Большие данные записываются один раз в колонки .npy, а между шагами по цепочке
+# и через бэкенд результатов передается только компактная ссылка. Читатели
+# открывают колонки через memory map и берут срезы без копирования.
+# Каталог пайплайна удаляется по его завершении; брошенные каталоги удаляются
+# по возрасту (ARTIFACT_TTL) при запуске следующих пайплайнов. Артефакты,
+# закрепленные кэшем шагов (pin), живут в CACHE_DIR, пока жива запись кэша.
+# NumPy импортируется только при записи и чтении колонок: очистке и проверке
+# каталогов (веб-приложение, запуск пайплайна) он не нужен.
+
+ARTIFACT_DIR = os.environ.get("ARTIFACT_DIR", "/tmp/pipeline_artifacts")
+ARTIFACT_TTL = int(os.environ.get("ARTIFACT_TTL", str(24 * 3600)))
+CACHE_DIR = "cache"
+# Отчеты (reports.py) живут дольше пайплайна и удаляются по своему сроку
+REPORTS_DIR = "reports"
+
+
+def artifact_path(ref, column=None):
+    path = os.path.join(ARTIFACT_DIR, ref["path"])
+    return os.path.join(path, f"{column}.npy") if column else path
+
+
+class ColumnWriter:
+    """Пишет колонки артефакта блоками в заранее выделенные файлы .npy"""
+
+    def __init__(self, pipeline_id, name, columns, capacity):
+        import numpy as np
+
+        self.ref = {"path": os.path.join(pipeline_id or "shared", name), "rows": 0, "columns": list(columns)}
+        os.makedirs(artifact_path(self.ref), exist_ok=True)
+        self._files = {
+            column: np.lib.format.open_memmap(artifact_path(self.ref, column), mode="w+",
+                                              dtype=dtype, shape=(max(capacity, 1),))
+            for column, dtype in columns.items()
+        }
+
+    def append(self, chunk):
+        rows = len(next(iter(chunk.values())))
+        start = self.ref["rows"]
+        for column, target in self._files.items():
+            target[start:start + rows] = chunk[column]
+        self.ref["rows"] = start + rows
+
+    def close(self):
+        """Сбрасывает данные на диск и возвращает ссылку на артефакт"""
+        for target in self._files.values():
+            target.flush()
+        self._files = {}
+        return self.ref
+
+
+def open_columns(ref, start=0, end=None):
+    """Колонки артефакта в диапазоне строк [start, end) без чтения в память"""
+    import numpy as np
+
+    end = ref["rows"] if end is None else min(end, ref["rows"])
+    return {
+        column: np.load(artifact_path(ref, column), mmap_mode="r")[start:end]
+        for column in ref["columns"]
+    }
+
+
+def exists(ref):
+    return os.path.isdir(artifact_path(ref))
+
+
+def pin(ref, owner):
+    """Переносит артефакт из каталога пайплайна под владельца в кэше (ссылка обновляется)"""
+    if ref["path"].startswith(CACHE_DIR + os.sep):
+        return ref
+    target = os.path.join(CACHE_DIR, owner, os.path.basename(ref["path"]))
+    os.makedirs(os.path.dirname(os.path.join(ARTIFACT_DIR, target)), exist_ok=True)
+    try:
+        os.replace(artifact_path(ref), os.path.join(ARTIFACT_DIR, target))
+    except OSError:
+        # Тот же результат уже закреплен параллельным пайплайном
+        shutil.rmtree(artifact_path(ref), ignore_errors=True)
+    ref["path"] = target
+    return ref
+
+
+def delete_pinned(owner):
+    shutil.rmtree(os.path.join(ARTIFACT_DIR, CACHE_DIR, owner), ignore_errors=True)
+
+
+def delete_artifacts(pipeline_id):
+    """Удаляет все артефакты пайплайна"""
+    if pipeline_id:
+        shutil.rmtree(os.path.join(ARTIFACT_DIR, pipeline_id), ignore_errors=True)
+
+
+def cleanup_expired(max_age=ARTIFACT_TTL):
+    """Удаляет каталоги пайплайнов старше max_age секунд; возвращает их число"""
+    removed = 0
+    deadline = time.time() - max_age
+    try:
+        entries = list(os.scandir(ARTIFACT_DIR))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.name not in (CACHE_DIR, REPORTS_DIR) and entry.is_dir() and entry.stat().st_mtime < deadline:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
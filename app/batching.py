@@ -0,0 +1,83 @@
+import logging
+import os
+import threading
+import time
+
+# Пакетная отправка дешевых задач (add, echo).
+# Вызовы копятся на стороне отправителя в течение короткого окна или до порога
+# размера и уходят одним сообщением run_batch. Каждый вызов заранее получает
+# собственный task_id, и воркер пишет результат под этим id, поэтому
+# AsyncResult вызывающей стороны разрешается как у обычной задачи.
+# Если пакет не удалось отправить, его вызовы помечаются в бэкенде результатов
+# как упавшие с ошибкой отправки: ожидающие их клиенты сразу получают ошибку.
+
+BATCH_WINDOW = float(os.environ.get("TASK_BATCH_WINDOW", "0.05"))
+BATCH_SIZE = int(os.environ.get("TASK_BATCH_SIZE", "200"))
+
+# Задачи, которые можно выполнять пачкой через run_batch
+BATCHABLE_TASKS = {"tasks_simple.add", "tasks_simple.echo"}
+
+logger = logging.getLogger(__name__)
+
+
+class CallBatcher:
+    """Накапливает вызовы и отправляет их пачками через задачу run_batch"""
+
+    def __init__(self, batch_task, window=BATCH_WINDOW, size=BATCH_SIZE):
+        self.batch_task = batch_task
+        self.window = window
+        self.size = size
+        self._calls = []
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="call-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, signature):
+        """Ставит вызов в пакет и сразу возвращает его AsyncResult"""
+        from celery.utils import uuid
+
+        task_id = uuid()
+        call = [task_id, signature.task, list(signature.args), dict(signature.kwargs)]
+        with self._cond:
+            self._calls.append(call)
+            if len(self._calls) == 1 or len(self._calls) >= self.size:
+                self._cond.notify_all()
+        return self.batch_task.app.AsyncResult(task_id)
+
+    def flush(self):
+        """Немедленно отправляет накопленные вызовы"""
+        with self._cond:
+            calls, self._calls = self._calls, []
+        self._send(calls)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._calls:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.window
+                while len(self._calls) < self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                calls, self._calls = self._calls[:self.size], self._calls[self.size:]
+            self._send(calls)
+
+    def _send(self, calls):
+        if not calls:
+            return
+        try:
+            self.batch_task.apply_async(args=(calls,))
+        except Exception as e:
+            logger.exception("Ошибка отправки пакета задач (%d вызовов)", len(calls))
+            self._fail(calls, e)
+
+    def _fail(self, calls, exc):
+        """Помечает вызовы неотправленного пакета упавшими, чтобы они не висели в PENDING"""
+        backend = self.batch_task.app.backend
+        for task_id, *_ in calls:
+            try:
+                backend.mark_as_failure(task_id, exc)
+            except Exception:
+                logger.exception("Не удалось записать ошибку вызова %s", task_id)
@@ -0,0 +1,54 @@
+import os
+import threading
+
+import routing
+import serialization
+
+# Приложение Celery без кода задач.
+# Веб-приложения отправляют задачи по имени (send_task, сигнатуры по имени) и не
+# импортируют tasks.py с его зависимостями (NumPy, движок, отчеты). Настройки те же,
+# что у воркеров, — create_app используют и tasks.py, и tasks_simple.py: очереди
+# (TASK_ROUTING), приоритеты планировщика и формат сообщений (SERIALIZER).
+# Клиент создается при первой отправке, а соединение с брокером Celery открывает сам,
+# когда оно понадобится.
+
+RUN_PIPELINE = "tasks.run_interactive_pipeline"
+RESUME_PIPELINE = "tasks.resume_pipeline"
+SIMPLE_TASK = "tasks_simple.{}"
+RUN_BATCH = SIMPLE_TASK.format("run_batch")
+
+_apps = {}
+_lock = threading.Lock()
+
+
+def create_app(main="tasks", priorities=False):
+    """Приложение Celery с общими настройками; priorities — приоритеты запусков пайплайнов"""
+    from celery import Celery
+
+    app = Celery(main, broker=os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0"),
+                 backend=os.environ.get("CELERY_RESULT_BACKEND", "redis://localhost:6379/0"))
+    # Очереди и подтверждение задач (TASK_ROUTING)
+    routing.configure(app)
+    if priorities:
+        # Приоритеты сообщений для запусков из планировщика
+        import scheduler
+        scheduler.configure(app)
+    # Формат сообщений и результатов (SERIALIZER)
+    serialization.configure(app)
+    return app
+
+
+def get_app(priorities=False):
+    """Общий для процесса клиент Celery (создается при первом обращении)"""
+    app = _apps.get(priorities)
+    if app is None:
+        with _lock:
+            app = _apps.get(priorities)
+            if app is None:
+                app = _apps[priorities] = create_app(priorities=priorities)
+    return app
+
+
+def send_pipeline_task(name, args, **options):
+    """Отправляет задачу пайплайна по имени; возвращает AsyncResult"""
+    return get_app(priorities=True).send_task(name, args=args, **options)
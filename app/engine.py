@@ -0,0 +1,277 @@
+import os
+
+import numpy as np
+
+import artifacts
+
+# Движок обработки данных пайплайна.
+# Набор данных колоночный (id, value, score, category) и детерминированно
+# генерируется блоками по ENGINE_CHUNK_ROWS строк из (seed, номер блока), поэтому
+# любой шаг или партиция может пройти по своему диапазону строк, не держа весь
+# набор в памяти. Подготовленный набор сохраняется артефактом (artifacts.py), и
+# следующие шаги читают его блоками через memory map. Все вычисления векторизованы
+# по блоку; между блоками переносятся только накопители (count, sum, sumsq, min,
+# max по всему набору и по категориям).
+
+ENGINE_CHUNK_ROWS = int(os.environ.get("ENGINE_CHUNK_ROWS", "262144"))
+DATASET_SEED = int(os.environ.get("DATASET_SEED", "0"))
+
+CATEGORIES = 8
+# Колонки, которые сохраняются в артефакт подготовленного набора
+COLUMNS = {"value": np.float64, "score": np.float32, "category": np.uint8}
+# Смещение среднего по категориям — то, что анализ должен найти
+CATEGORY_SHIFT = np.array([0.0, 0.0, 0.5, 0.0, 0.0, -0.3, 0.0, 0.2])
+ANOMALY_RATE = 0.001
+MISSING_RATE = 0.0005
+SENSOR_ERROR_RATE = 0.0005
+SENSOR_LIMIT = 50.0
+
+# Тип обработки из шага 1 определяет строгость очистки
+CLEANING_LEVELS = {
+    "Быстрая обработка": "basic",
+    "Детальная обработка": "strict",
+    "Экспериментальная обработка": "strict",
+}
+
+
+def dataset_spec(rows, seed=DATASET_SEED, chunk_rows=ENGINE_CHUNK_ROWS, artifact=None):
+    """Описание набора данных, которое передается между шагами вместо самих строк.
+    
+    Без artifact строки генерируются из seed, с artifact — читаются из хранилища.
+    """
+    spec = {"rows": rows, "seed": seed, "chunk_rows": chunk_rows}
+    if artifact:
+        spec["artifact"] = artifact
+    return spec
+
+
+def cleaning_level(processing_type):
+    return CLEANING_LEVELS.get(processing_type, "basic")
+
+
+def generate_chunk(spec, index):
+    """Блок index набора данных: словарь колонок NumPy"""
+    chunk_rows = spec["chunk_rows"]
+    start = index * chunk_rows
+    size = max(0, min(chunk_rows, spec["rows"] - start))
+    rng = np.random.default_rng([spec["seed"], index])
+
+    category = rng.integers(0, CATEGORIES, size, dtype=np.uint8)
+    value = rng.standard_normal(size)
+    value += CATEGORY_SHIFT[category]
+    score = rng.random(size, dtype=np.float32)
+
+    # Выбросы, пропуски и ошибки датчика
+    anomalies = rng.random(size) < ANOMALY_RATE
+    value[anomalies] += np.where(rng.random(int(anomalies.sum())) < 0.5, -8.0, 8.0)
+    value[rng.random(size) < MISSING_RATE] = np.nan
+    value[rng.random(size) < SENSOR_ERROR_RATE] = SENSOR_LIMIT * 20
+
+    return {
+        "id": np.arange(start, start + size, dtype=np.int64),
+        "value": value,
+        "score": score,
+        "category": category,
+    }
+
+
+def iter_chunks(spec, start=0, end=None):
+    """Блоки, покрывающие строки [start, end), обрезанные по границам диапазона"""
+    end = spec["rows"] if end is None else min(end, spec["rows"])
+    chunk_rows = spec["chunk_rows"]
+    if spec.get("artifact"):
+        for offset in range(start // chunk_rows * chunk_rows, end, chunk_rows):
+            yield artifacts.open_columns(spec["artifact"], max(start, offset), min(end, offset + chunk_rows))
+        return
+    for index in range(start // chunk_rows, -(-end // chunk_rows)):
+        chunk = generate_chunk(spec, index)
+        offset = index * chunk_rows
+        lo, hi = max(start - offset, 0), min(end - offset, chunk_rows)
+        if lo > 0 or hi < len(chunk["value"]):
+            chunk = {name: column[lo:hi] for name, column in chunk.items()}
+        yield chunk
+
+
+def valid_mask(chunk, level):
+    mask = np.isfinite(chunk["value"])
+    if level == "strict":
+        mask &= np.abs(chunk["value"]) < SENSOR_LIMIT
+    return mask
+
+
+def filtered_chunks(spec, level, quality, start, end, report):
+    """Строки, прошедшие очистку и фильтр качества (score не ниже 1 - quality)"""
+    total = max(1, min(end, spec["rows"]) - start)
+    done = 0
+    for chunk in iter_chunks(spec, start, end):
+        mask = valid_mask(chunk, level)
+        if quality is not None:
+            mask &= chunk["score"] >= 1 - quality
+        yield chunk["value"][mask], chunk["category"][mask]
+        done += len(chunk["value"])
+        report(done / total)
+
+
+def empty_stats():
+    return {
+        "count": 0, "sum": 0.0, "sumsq": 0.0, "min": None, "max": None,
+        "by_category": {"count": [0] * CATEGORIES, "sum": [0.0] * CATEGORIES, "sumsq": [0.0] * CATEGORIES},
+    }
+
+
+def merge_results(a, b):
+    """Объединяет накопители двух диапазонов: суммы складываются, min/max сравниваются"""
+    merged = {}
+    for key in a.keys() | b.keys():
+        if key not in a or key not in b:
+            merged[key] = a.get(key, b.get(key))
+        elif a[key] is None or b[key] is None:
+            merged[key] = a[key] if b[key] is None else b[key]
+        elif isinstance(a[key], dict):
+            merged[key] = merge_results(a[key], b[key])
+        elif isinstance(a[key], list):
+            merged[key] = [x + y for x, y in zip(a[key], b[key])]
+        elif key == "min":
+            merged[key] = min(a[key], b[key])
+        elif key == "max":
+            merged[key] = max(a[key], b[key])
+        else:
+            merged[key] = a[key] + b[key]
+    return merged
+
+
+def prepare(spec, level, start=0, end=None, report=lambda done: None, output=None):
+    """Шаг 1: генерирует набор и проверяет строки.
+    
+    Корректные строки дописываются в output (artifacts.ColumnWriter), если он задан.
+    """
+    end = spec["rows"] if end is None else min(end, spec["rows"])
+    total = max(1, end - start)
+    done = valid = 0
+    for chunk in iter_chunks(spec, start, end):
+        mask = valid_mask(chunk, level)
+        if output is not None:
+            output.append({column: chunk[column][mask] for column in COLUMNS})
+        valid += int(np.count_nonzero(mask))
+        done += len(chunk["value"])
+        report(done / total)
+    return {"rows": max(0, end - start), "valid": valid}
+
+
+def process(spec, level, quality, start=0, end=None, report=lambda done: None):
+    """Шаг 2: фильтр качества и накопление статистики по оставшимся строкам"""
+    end = spec["rows"] if end is None else end
+    stats = empty_stats()
+    for value, category in filtered_chunks(spec, level, quality, start, end, report):
+        if not len(value):
+            continue
+        chunk_stats = empty_stats()
+        chunk_stats.update({
+            "count": len(value),
+            "sum": float(value.sum()),
+            "sumsq": float(np.dot(value, value)),
+            "min": float(value.min()),
+            "max": float(value.max()),
+        })
+        by_category = chunk_stats["by_category"]
+        by_category["count"] = np.bincount(category, minlength=CATEGORIES).tolist()
+        by_category["sum"] = np.bincount(category, value, minlength=CATEGORIES).tolist()
+        by_category["sumsq"] = np.bincount(category, value * value, minlength=CATEGORIES).tolist()
+        stats = merge_results(stats, chunk_stats)
+    return stats
+
+
+def _moments(count, total, sumsq):
+    count = np.maximum(np.asarray(count, dtype=np.float64), 1)
+    mean = np.asarray(total) / count
+    std = np.sqrt(np.maximum(np.asarray(sumsq) / count - mean * mean, 1e-12))
+    return mean, std
+
+
+def summarize(stats):
+    """Итоговая статистика из накопителей"""
+    mean, std = _moments(stats["count"], stats["sum"], stats["sumsq"])
+    by_category = stats["by_category"]
+    category_mean, category_std = _moments(by_category["count"], by_category["sum"], by_category["sumsq"])
+    return {
+        "count": stats["count"],
+        "mean": round(float(mean), 4),
+        "std": round(float(std), 4),
+        "min": stats["min"],
+        "max": stats["max"],
+        "category_mean": [round(float(m), 4) for m in category_mean],
+        "category_std": [round(float(s), 4) for s in category_std],
+    }
+
+
+def find_insights(stats):
+    """Категории, среднее которых значимо (t > 3) отличается от типичного (медианы средних)"""
+    _, std = _moments(stats["count"], stats["sum"], stats["sumsq"])
+    by_category = stats["by_category"]
+    category_mean, _ = _moments(by_category["count"], by_category["sum"], by_category["sumsq"])
+    count = np.maximum(np.asarray(by_category["count"]), 1)
+    t = np.abs(category_mean - np.median(category_mean)) / (std / np.sqrt(count))
+    return int(((t > 3) & (np.asarray(by_category["count"]) > 1)).sum())
+
+
+def anomaly_threshold(complexity):
+    # Чем выше сложность, тем чувствительнее поиск
+    return 4.0 - 0.15 * complexity
+
+
+def analyze(spec, level, quality, stats, method, complexity, start=0, end=None, report=lambda done: None):
+    """Шаг 3: поиск аномалий выбранным методом по отфильтрованным строкам"""
+    end = spec["rows"] if end is None else end
+    mean, std = _moments(stats["count"], stats["sum"], stats["sumsq"])
+    by_category = stats["by_category"]
+    category_mean, category_std = _moments(by_category["count"], by_category["sum"], by_category["sumsq"])
+    threshold = anomaly_threshold(complexity)
+
+    anomalies = 0
+    for value, category in filtered_chunks(spec, level, quality, start, end, report):
+        flagged = flag_anomalies(value, category, method, threshold, mean, std, category_mean, category_std)
+        anomalies += int(np.count_nonzero(flagged))
+    return {"anomalies": anomalies}
+
+
+def flag_anomalies(value, category, method, threshold, mean, std, category_mean, category_std):
+    """Маска аномальных строк блока для метода анализа"""
+    global_z = np.abs(value - mean) / std
+    category_z = np.abs(value - category_mean[category]) / category_std[category]
+    if method == "Машинное обучение":
+        return category_z > threshold
+    if method == "Глубокий анализ":
+        # Резкие скачки между соседними строками тоже считаются аномалией
+        jumps = np.zeros(len(value), dtype=bool)
+        jumps[1:] = np.abs(np.diff(value)) > threshold * std * np.sqrt(2)
+        return (category_z > threshold) | jumps
+    if method == "Комбинированный подход":
+        return (global_z > 3) | (category_z > 3)
+    return global_z > 3
+
+
+def annotated_chunks(spec, level, quality, stats, method, complexity, report=lambda done: None):
+    """Отфильтрованные строки блоками с номером строки, z-оценкой и признаком аномалии (для отчетов)"""
+    mean, std = _moments(stats["count"], stats["sum"], stats["sumsq"])
+    by_category = stats["by_category"]
+    category_mean, category_std = _moments(by_category["count"], by_category["sum"], by_category["sumsq"])
+    threshold = anomaly_threshold(complexity)
+
+    offset = 0
+    total = max(1, spec["rows"])
+    for chunk in iter_chunks(spec):
+        size = len(chunk["value"])
+        mask = valid_mask(chunk, level)
+        if quality is not None:
+            mask &= chunk["score"] >= 1 - quality
+        value, category = chunk["value"][mask], chunk["category"][mask]
+        yield {
+            "id": np.arange(offset, offset + size, dtype=np.int64)[mask],
+            "value": value,
+            "score": chunk["score"][mask],
+            "category": category,
+            "z": np.abs(value - mean) / std,
+            "anomaly": flag_anomalies(value, category, method, threshold, mean, std, category_mean, category_std),
+        }
+        offset += size
+        report(offset / total)
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+
+import metrics
+import redis_pool
+
+# Идемпотентная постановка задач и пайплайнов: повторный клик или ретрай клиента не
+# запускает работу заново.
+# Ключ приходит от клиента (заголовок Idempotency-Key или поле idempotency_key) или,
+# если его нет, выводится из содержимого запроса. Первый запрос атомарно занимает ключ
+# в Redis (hash idempotency:{scope}:{digest}: state, id, record) и запускает работу;
+# одинаковые запросы, пока она идет, получают тот же task_id/pipeline_id, а после
+# завершения — сохраненный результат в течение IDEMPOTENCY_TTL. Неудачная работа
+# освобождает ключ, чтобы повтор запустил ее заново.
+# Число новых, присоединенных и повторно использованных запросов копится в
+# idempotency:stats и в метрике idempotent_submissions_total.
+
+IDEMPOTENCY = os.environ.get("IDEMPOTENCY", "true").lower() in ("1", "true", "yes")
+# Без ключа клиента выводить ключ из содержимого запроса
+IDEMPOTENCY_DERIVE_KEYS = os.environ.get("IDEMPOTENCY_DERIVE_KEYS", "true").lower() in ("1", "true", "yes")
+# Сколько секунд повторно отдается результат завершенной работы
+IDEMPOTENCY_TTL = int(os.environ.get("IDEMPOTENCY_TTL", "3600"))
+# Сколько секунд ключ держится за работой, которая еще идет
+IDEMPOTENCY_INFLIGHT_TTL = int(os.environ.get("IDEMPOTENCY_INFLIGHT_TTL", str(2 * 3600)))
+# Окно для выведенных ключей пайплайнов: одинаковые запуски подряд (двойной клик)
+# объединяются, а осознанный повторный запуск позже — нет
+IDEMPOTENCY_DERIVED_WINDOW = int(os.environ.get("IDEMPOTENCY_DERIVED_WINDOW", "10"))
+
+HEADER = "Idempotency-Key"
+FIELD = "idempotency_key"
+KEY = "idempotency:{}:{}"
+BOUND_KEY = "idempotency:id:{}"
+STATS_KEY = "idempotency:stats"
+
+# KEYS: 1 ключ запроса, 2 статистика, 3 привязка id -> ключ.
+# ARGV: 1 id, 2 запись, 3 TTL, 4 scope, 5 TTL после завершения (пусто — без привязки).
+# Возвращает nil, если ключ занят этим вызовом, иначе {state, record} занявшего
+CLAIM = redis_pool.LuaScript("""
+local state = redis.call('HGET', KEYS[1], 'state')
+if state then
+    local outcome = state == 'done' and 'reused' or 'attached'
+    redis.call('HINCRBY', KEYS[2], ARGV[4] .. ':' .. outcome, 1)
+    return {state, redis.call('HGET', KEYS[1], 'record')}
+end
+redis.call('HSET', KEYS[1], 'state', 'pending', 'id', ARGV[1], 'record', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('HINCRBY', KEYS[2], ARGV[4] .. ':new', 1)
+if ARGV[5] ~= '' then
+    redis.call('HSET', KEYS[3], 'key', KEYS[1], 'ttl', ARGV[5])
+    redis.call('EXPIRE', KEYS[3], ARGV[3])
+end
+return false
+""")
+
+# Изменение и удаление только своей записи: KEYS[1] ключ, ARGV[1] id, ARGV[2] новая запись
+UPDATE = redis_pool.LuaScript("""
+if redis.call('HGET', KEYS[1], 'id') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'record', ARGV[2])
+return 1
+""")
+
+# То же по привязке id -> ключ (работа занята с done_ttl): KEYS[1] привязка,
+# ARGV[1] id, ARGV[2] новая запись
+UPDATE_BOUND = redis_pool.LuaScript("""
+local key = redis.call('HGET', KEYS[1], 'key')
+if not key or redis.call('HGET', key, 'id') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', key, 'record', ARGV[2])
+return 1
+""")
+
+RELEASE = redis_pool.LuaScript("""
+if redis.call('HGET', KEYS[1], 'id') ~= ARGV[1] then
+    return 0
+end
+return redis.call('DEL', KEYS[1])
+""")
+
+# Завершение работы, привязанной к id: KEYS[1] привязка, ARGV[1] id, ARGV[2] 1 — успех
+FINISH = redis_pool.LuaScript("""
+local bound = redis.call('HMGET', KEYS[1], 'key', 'ttl')
+if not bound[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+if redis.call('HGET', bound[1], 'id') ~= ARGV[1] then
+    return 0
+end
+if ARGV[2] == '1' then
+    redis.call('HSET', bound[1], 'state', 'done')
+    redis.call('EXPIRE', bound[1], bound[2])
+else
+    redis.call('DEL', bound[1])
+end
+return 1
+""")
+
+
+def request_key(scope, client_key=None, payload=None, owner=None):
+    """Ключ Redis запроса или None, если дедупликация для него выключена.
+
+    owner отделяет ключи разных пользователей; payload — содержимое запроса
+    для выведенного ключа.
+    """
+    if not IDEMPOTENCY:
+        return None
+    if client_key:
+        raw = json.dumps(["client", owner, str(client_key)])
+    elif IDEMPOTENCY_DERIVE_KEYS and payload is not None:
+        raw = json.dumps(["payload", owner, payload], sort_keys=True, default=str)
+    else:
+        return None
+    return KEY.format(scope, hashlib.sha256(raw.encode()).hexdigest()[:32])
+
+
+def client_key(request):
+    """Ключ клиента из заголовка Idempotency-Key или поля idempotency_key"""
+    return request.headers.get(HEADER) or (request.get_json(silent=True) or {}).get(FIELD)
+
+
+def claim(redis_client, scope, key, owner_id, record, ttl=IDEMPOTENCY_INFLIGHT_TTL, done_ttl=None):
+    """Занимает ключ за owner_id; возвращает None или {"state", "record"} уже занявшего.
+
+    С done_ttl завершение сообщается позже через finish(owner_id, ...), и тогда
+    результат хранится done_ttl секунд.
+    """
+    keys = [key, STATS_KEY, BOUND_KEY.format(owner_id)]
+    args = [owner_id, json.dumps(record), ttl, scope, "" if done_ttl is None else done_ttl]
+    existing = CLAIM(redis_client, keys, args)
+    if existing is None:
+        metrics.observe_idempotency(scope, "new")
+        return None
+    state, raw = [item.decode() if isinstance(item, bytes) else item for item in existing]
+    metrics.observe_idempotency(scope, "reused" if state == "done" else "attached")
+    return {"state": state, "record": json.loads(raw)}
+
+
+def update(redis_client, key, owner_id, record):
+    """Обновляет запись, если ключ все еще принадлежит owner_id"""
+    return bool(UPDATE(redis_client, [key], [owner_id, json.dumps(record)]))
+
+
+def update_bound(redis_client, owner_id, record):
+    """Обновляет запись работы, занятой с done_ttl, когда ключ запроса уже неизвестен"""
+    return bool(UPDATE_BOUND(redis_client, [BOUND_KEY.format(owner_id)], [owner_id, json.dumps(record)]))
+
+
+def complete(redis_client, key, owner_id, record, ttl=IDEMPOTENCY_TTL):
+    """Сохраняет результат работы, чтобы повторы в течение ttl получили его"""
+    pipe = redis_client.pipeline()
+    pipe.hset(key, mapping={"state": "done", "id": owner_id, "record": json.dumps(record)})
+    pipe.expire(key, ttl)
+    pipe.execute()
+
+
+def release(redis_client, key, owner_id):
+    """Освобождает ключ после неудачи, если он все еще принадлежит owner_id"""
+    return bool(RELEASE(redis_client, [key], [owner_id]))
+
+
+def finish(redis_client, owner_id, ok):
+    """Завершение работы, занятой с done_ttl: успех сохраняет результат, неудача освобождает ключ"""
+    return bool(FINISH(redis_client, [BOUND_KEY.format(owner_id)], [owner_id, 1 if ok else 0]))
+
+
+def stats(redis_client):
+    """Счетчики по scope: new, attached, reused"""
+    result = {}
+    for field, value in redis_client.hgetall(STATS_KEY).items():
+        field = field.decode() if isinstance(field, bytes) else field
+        scope, _, outcome = field.rpartition(":")
+        result.setdefault(scope, {"new": 0, "attached": 0, "reused": 0})[outcome] = int(value)
+    return result
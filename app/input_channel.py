@@ -0,0 +1,74 @@
+import time
+import uuid
+
+from redis_pool import LuaScript
+import serialization
+
+# Канал пользовательского ввода между веб-приложением и воркерами.
+# Веб-приложение кладет ответ в список user_input:{task_id} (RPUSH),
+# а воркер блокируется на BLPOP с оставшимся таймаутом вместо опроса GET + sleep.
+# У каждого запроса blocking-задачи свой идентификатор (new_prompt_id) и свой
+# список: TIMED_OUT от sweeper или ответ, опоздавшие к прошлому запросу задачи,
+# остаются в его списке и не читаются как ответ на следующий.
+# Составные операции выполняются Lua-скриптами: запись с TTL атомарна, а ответ,
+# пришедший в момент таймаута, забирается, а не удаляется вместе с ключом.
+# Значения кодируются в формате SERIALIZER (см. serialization).
+
+INPUT_KEY = "user_input:{}"
+# Страховка от ключей без читателя: ввод кладется только для запроса, который еще
+# ждет в реестре (prompt_registry), и забирается сразу
+INPUT_TTL = 300
+DISCONNECTED = "DISCONNECTED"
+TIMED_OUT = "TIMEOUT"
+
+
+def input_key(task_id):
+    return INPUT_KEY.format(task_id)
+
+
+def new_prompt_id(task_id):
+    """Идентификатор очередного запроса ввода задачи (клиент отвечает по нему)"""
+    return f"{task_id}.{uuid.uuid4().hex[:12]}"
+
+
+PUSH_INPUT = LuaScript("""
+redis.call('RPUSH', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+""")
+
+# Последняя попытка забрать ввод перед таймаутом; ключ удаляется в любом случае
+CONSUME_INPUT = LuaScript("""
+local value = redis.call('LPOP', KEYS[1])
+redis.call('DEL', KEYS[1])
+return value
+""")
+
+
+def decode(raw):
+    return serialization.loads(raw)
+
+
+def push_input(redis_client, task_id, value, ttl=INPUT_TTL):
+    """Передает ввод ожидающей задаче (RPUSH + EXPIRE атомарно, один round-trip)"""
+    PUSH_INPUT(redis_client, [input_key(task_id)], [serialization.dumps(value), ttl])
+
+
+def pop_input(redis_client, task_id, timeout):
+    """Блокируется до получения ввода или истечения таймаута.
+
+    Возвращает (True, значение) при получении ввода и (False, None) по таймауту.
+    """
+    key = input_key(task_id)
+    deadline = time.monotonic() + timeout
+
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raw = CONSUME_INPUT(redis_client, [key])
+            return (True, decode(raw)) if raw else (False, None)
+
+        # BLPOP с таймаутом 0 ждет бесконечно, поэтому не даем ему обнулиться
+        item = redis_client.blpop([key], timeout=max(remaining, 0.01))
+        if item:
+            return True, decode(item[1])
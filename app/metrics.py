@@ -0,0 +1,275 @@
+import functools
+import inspect
+import json
+import os
+import time
+
+from celery.signals import (before_task_publish, task_received, task_prerun, task_postrun,
+                            worker_init, worker_process_shutdown)
+from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram, REGISTRY,
+                               CONTENT_TYPE_LATEST, generate_latest, start_http_server)
+
+# Метрики и трассировка воркеров и веб-приложения.
+# Время в очереди, выполнение задач, ожидание ввода пользователя и доставка
+# уведомлений пишутся в гистограммы и счетчики Prometheus. Веб-приложение отдает
+# их на /metrics, воркер — собственным HTTP-экспортером (WORKER_METRICS_PORT).
+# При нескольких процессах (prefork, несколько воркеров gunicorn) задайте
+# PROMETHEUS_MULTIPROC_DIR: процессы пишут значения в файлы, экспортер их суммирует
+# (каталог должен существовать и быть пустым при старте).
+# С TRACE_PIPELINES=true интервалы (spans) складываются в Redis по pipeline_id.
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+WORKER_METRICS_PORT = int(os.environ.get("WORKER_METRICS_PORT", "9808"))
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+TRACE_PIPELINES = os.environ.get("TRACE_PIPELINES", "false").lower() in ("1", "true", "yes")
+TRACE_REDIS_URL = os.environ.get("TRACE_REDIS_URL") or os.environ.get("CELERY_RESULT_BACKEND",
+                                                                       "redis://localhost:6379/0")
+TRACE_KEY = "trace:{}"
+TRACE_TTL = 24 * 3600
+TRACE_MAX_SPANS = 1000
+
+PUBLISHED_HEADER = "published_at"
+WAIT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+TASK_QUEUE_WAIT = Histogram("celery_task_queue_wait_seconds",
+                            "Время от отправки задачи до начала выполнения", ["task"])
+TASK_RECEIVED = Counter("celery_tasks_received_total", "Задачи, полученные воркером", ["task"])
+TASK_RUNTIME = Histogram("celery_task_runtime_seconds", "Время выполнения задачи", ["task", "state"])
+TASKS_TOTAL = Counter("celery_tasks_total", "Завершенные задачи", ["task", "state"])
+INPUT_WAIT = Histogram("pipeline_input_wait_seconds", "Ожидание ввода пользователя",
+                       ["input_type"], buckets=WAIT_BUCKETS)
+NOTIFY_ENQUEUE = Histogram("notification_enqueue_seconds", "Постановка уведомления в очередь транспорта",
+                           ["status"], buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01))
+NOTIFY_DELIVERY = Histogram("notification_batch_delivery_seconds", "Отправка пачки уведомлений", ["result"])
+NOTIFY_BATCH_SIZE = Histogram("notification_batch_events", "Событий в пачке",
+                              buckets=(1, 2, 5, 10, 20, 50, 100, 200))
+NOTIFY_LATENCY = Histogram("notification_latency_seconds",
+                           "Возраст события при пересылке клиентам (от воркера до Socket.IO)")
+HTTP_REQUESTS = Histogram("http_request_duration_seconds", "Обработка HTTP-запросов", ["endpoint", "status"])
+SOCKET_EMITS = Counter("socketio_task_updates_total", "События task_update, отправленные клиентам", ["status"])
+REDIS_ROUNDTRIP = Histogram("redis_roundtrip_seconds", "Round-trip к Redis (команда, pipeline или скрипт)",
+                            ["command"], buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                                                  0.05, 0.25, 1, 10, 60))
+ADMISSION_WAIT = Histogram("pipeline_admission_wait_seconds", "Ожидание запуска пайплайна в очереди планировщика",
+                           ["priority"], buckets=WAIT_BUCKETS)
+IDEMPOTENT_SUBMISSIONS = Counter("idempotent_submissions_total",
+                                 "Запросы с ключом идемпотентности: new, attached (к идущей работе), reused",
+                                 ["scope", "outcome"])
+PROMPTS_EXPIRED = Counter("pipeline_prompts_expired_total", "Запросы ввода, снятые sweeper по таймауту", ["mode"])
+REDIS_CONNECTIONS = Gauge("redis_pool_connections", "Соединения пула Redis", ["state"],
+                          multiprocess_mode="livesum")
+ACTIVE_SESSIONS = Gauge("socketio_active_sessions", "Подключенные клиенты Socket.IO",
+                        multiprocess_mode="livesum")
+
+_started = {}
+_trace_client = None
+
+
+def now():
+    return time.time()
+
+
+def pipeline_id_from(args, kwargs):
+    """Ищет pipeline_id в аргументах задачи (kwargs, результат предыдущего шага, токен ввода)"""
+    kwargs = kwargs or {}
+    if kwargs.get("pipeline_id"):
+        return kwargs["pipeline_id"]
+    for arg in args or ():
+        if isinstance(arg, dict) and arg.get("pipeline_id"):
+            return arg["pipeline_id"]
+        if isinstance(arg, str) and arg.count(":") >= 2:
+            return arg.rsplit(":", 2)[0]
+        if isinstance(arg, str) and len(arg) == 36 and arg.count("-") == 4:
+            return arg
+    return None
+
+
+# Трассировка
+
+def _get_trace_client():
+    global _trace_client
+    if _trace_client is None:
+        import redis_pool
+        _trace_client = redis_pool.get_client(TRACE_REDIS_URL)
+    return _trace_client
+
+
+def record_span(pipeline_id, name, start, end, **attrs):
+    """Сохраняет интервал пайплайна; ошибки трассировки не мешают работе"""
+    if not TRACE_PIPELINES or not pipeline_id:
+        return
+    span = {"name": name, "start": start, "end": end, "duration": round(end - start, 6), **attrs}
+    try:
+        key = TRACE_KEY.format(pipeline_id)
+        pipe = _get_trace_client().pipeline()
+        pipe.rpush(key, json.dumps(span))
+        pipe.ltrim(key, -TRACE_MAX_SPANS, -1)
+        pipe.expire(key, TRACE_TTL)
+        pipe.execute()
+    except Exception as e:
+        print(f"Ошибка записи трассировки: {e}")
+
+
+def load_trace(redis_client, pipeline_id):
+    spans = [json.loads(raw) for raw in redis_client.lrange(TRACE_KEY.format(pipeline_id), 0, -1)]
+    return sorted(spans, key=lambda span: span["start"])
+
+
+# Обертки для функций воркера
+
+def instrument_notification(func):
+    """Замеряет постановку уведомления в очередь"""
+    if not METRICS_ENABLED:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(task_name, result, status="success", *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(task_name, result, status, *args, **kwargs)
+        finally:
+            NOTIFY_ENQUEUE.labels(status).observe(time.perf_counter() - start)
+    return wrapper
+
+
+def instrument_input_wait(func):
+    """Замеряет ожидание ввода пользователя внутри задачи"""
+    if not METRICS_ENABLED:
+        return func
+
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        call = signature.bind(*args, **kwargs)
+        call.apply_defaults()
+        start = now()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            observe_input_wait(call.arguments.get("input_type", "text"), start,
+                               call.arguments.get("pipeline_id"))
+    return wrapper
+
+
+def observe_input_wait(input_type, started_at, pipeline_id=None):
+    end = now()
+    INPUT_WAIT.labels(input_type).observe(max(0.0, end - started_at))
+    record_span(pipeline_id, "input_wait", started_at, end, input_type=input_type)
+
+
+def observe_delivery(batch_size, seconds, ok):
+    if METRICS_ENABLED:
+        NOTIFY_DELIVERY.labels("ok" if ok else "error").observe(seconds)
+        NOTIFY_BATCH_SIZE.observe(batch_size)
+
+
+def observe_admission(job):
+    """Время от постановки пайплайна в очередь до допуска к запуску"""
+    if METRICS_ENABLED:
+        ADMISSION_WAIT.labels(str(job["priority"])).observe(max(0.0, time.time() - job["queued_at"]))
+
+
+def observe_idempotency(scope, outcome):
+    if METRICS_ENABLED:
+        IDEMPOTENT_SUBMISSIONS.labels(scope, outcome).inc()
+
+
+def observe_prompt_expired(mode):
+    if METRICS_ENABLED:
+        PROMPTS_EXPIRED.labels(mode).inc()
+
+
+def observe_redis(command, seconds):
+    if METRICS_ENABLED:
+        REDIS_ROUNDTRIP.labels(command).observe(seconds)
+
+
+def observe_event_latency(timestamp, status):
+    """Возраст события по его timestamp (ISO) в момент пересылки клиентам"""
+    if not METRICS_ENABLED:
+        return
+    SOCKET_EMITS.labels(status or "unknown").inc()
+    if timestamp:
+        from datetime import datetime
+        try:
+            NOTIFY_LATENCY.observe(max(0.0, now() - datetime.fromisoformat(timestamp).timestamp()))
+        except ValueError:
+            pass
+
+
+# Сигналы Celery
+
+@before_task_publish.connect
+def stamp_published(headers=None, **kwargs):
+    if METRICS_ENABLED and headers is not None:
+        headers.setdefault(PUBLISHED_HEADER, now())
+
+
+@task_received.connect
+def count_received(request=None, **kwargs):
+    if METRICS_ENABLED and request is not None:
+        TASK_RECEIVED.labels(request.name).inc()
+
+
+@task_prerun.connect
+def task_started(task_id=None, task=None, args=None, kwargs=None, **extra):
+    if not METRICS_ENABLED:
+        return
+    started = now()
+    _started[task_id] = (started, time.perf_counter())
+    published = getattr(task.request, PUBLISHED_HEADER, None) or (task.request.headers or {}).get(PUBLISHED_HEADER)
+    if published:
+        TASK_QUEUE_WAIT.labels(task.name).observe(max(0.0, started - published))
+        if TRACE_PIPELINES:
+            record_span(pipeline_id_from(args, kwargs), f"queue:{task.name}", published, started, task_id=task_id)
+
+
+@task_postrun.connect
+def task_finished(task_id=None, task=None, args=None, kwargs=None, state=None, **extra):
+    if not METRICS_ENABLED:
+        return
+    started = _started.pop(task_id, None)
+    if started is None:
+        return
+    state = state or "UNKNOWN"
+    TASK_RUNTIME.labels(task.name, state).observe(time.perf_counter() - started[1])
+    TASKS_TOTAL.labels(task.name, state).inc()
+    if TRACE_PIPELINES:
+        record_span(pipeline_id_from(args, kwargs), f"task:{task.name}", started[0], now(),
+                    task_id=task_id, state=state)
+
+
+# Экспорт
+
+def registry():
+    """Реестр для экспорта: в мультипроцессном режиме — сумма файлов всех процессов"""
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        collected = CollectorRegistry()
+        multiprocess.MultiProcessCollector(collected)
+        return collected
+    return REGISTRY
+
+
+def render():
+    """Тело и Content-Type ответа /metrics"""
+    return generate_latest(registry()), CONTENT_TYPE_LATEST
+
+
+@worker_init.connect
+def start_worker_exporter(**kwargs):
+    if not METRICS_ENABLED or WORKER_METRICS_PORT <= 0:
+        return
+    try:
+        start_http_server(WORKER_METRICS_PORT, registry=registry())
+    except OSError as e:
+        print(f"Экспортер метрик воркера не запущен: {e}")
+
+
+@worker_process_shutdown.connect
+def mark_process_dead(pid=None, **kwargs):
+    if METRICS_ENABLED and MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid or os.getpid())
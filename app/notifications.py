@@ -0,0 +1,302 @@
+import os
+import threading
+import time
+import atexit
+
+from metrics import observe_delivery
+from progress import PROGRESS_TICK_TASK
+import serialization
+
+# Транспорт уведомлений веб-приложению.
+# Задача только кладет событие в очередь, а фоновый поток процесса пачками
+# доставляет их: одним POST на /task_results через постоянную keep-alive сессию
+# (NOTIFY_TRANSPORT=http) или одной записью в поток Redis (NOTIFY_TRANSPORT=redis).
+# Поток читает группа потребителей из реплик Socket.IO-сервера: каждую пачку
+# получает одна реплика, выполняет побочные эффекты событий (снимок, планировщик,
+# ключи идемпотентности) и публикует пачку в канал, на который подписаны все
+# реплики, — те только рассылают ее своим клиентам (relay_stream).
+# Устаревшие тики прогресса одного пайплайна схлопываются до отправки.
+# Пачки кодируются в формате SERIALIZER (JSON или msgpack, см. serialization).
+
+NOTIFY_TRANSPORT = os.environ.get("NOTIFY_TRANSPORT", "http")
+WEB_APP_URL = os.environ.get("WEB_APP_URL", "http://web:8000")
+NOTIFY_REDIS_URL = os.environ.get("NOTIFY_REDIS_URL",
+                                  os.environ.get("CELERY_RESULT_BACKEND", "redis://localhost:6379/0"))
+NOTIFY_CHANNEL = os.environ.get("NOTIFY_CHANNEL", "task_events")
+NOTIFY_STREAM = os.environ.get("NOTIFY_STREAM", "task_events:stream")
+NOTIFY_GROUP = os.environ.get("NOTIFY_GROUP", "web")
+NOTIFY_STREAM_MAXLEN = int(os.environ.get("NOTIFY_STREAM_MAXLEN", "100000"))
+# Через сколько секунд пачку, не подтвержденную упавшей репликой, забирает другая
+NOTIFY_CLAIM_IDLE = float(os.environ.get("NOTIFY_CLAIM_IDLE", "30"))
+NOTIFY_BATCH_SIZE = int(os.environ.get("NOTIFY_BATCH_SIZE", "50"))
+NOTIFY_FLUSH_INTERVAL = float(os.environ.get("NOTIFY_FLUSH_INTERVAL", "0.2"))
+NOTIFY_MAX_QUEUE = int(os.environ.get("NOTIFY_MAX_QUEUE", "10000"))
+NOTIFY_TIMEOUT = float(os.environ.get("NOTIFY_TIMEOUT", "5"))
+
+
+def progress_pipeline(event):
+    """pipeline_id события прогресса (None для остальных событий)"""
+    if event.get("status") != "progress":
+        return None
+    progress_info = event.get("progress_info") or {}
+    return progress_info.get("pipeline_id") or event.get("pipeline_id")
+
+
+def coalesce_key(event):
+    """Ключ схлопывания: голые тики прогресса пайплайна вытесняют предыдущие.
+
+    События с собственным текстом шага не схлопываются и служат границей:
+    более поздний тик не переносится раньше них.
+    """
+    if event.get("task_name") != PROGRESS_TICK_TASK or not event.get("progress_info"):
+        return None
+    return progress_pipeline(event)
+
+
+def coalesce_events(previous, event):
+    """Заменяет устаревшее событие прогресса, сохраняя поля из его дельты"""
+    info = event.get("progress_info") or {}
+    if not info.get("delta"):
+        return event
+    previous_info = previous.get("progress_info") or {}
+    merged = dict(previous_info)
+    merged.update(info)
+    if not previous_info.get("delta"):
+        merged.pop("delta", None)
+    return dict(event, progress_info=merged)
+
+
+def encode_batch(events):
+    return serialization.dumps({"events": events})
+
+
+def decode_batch(raw):
+    """Разбирает пачку событий, полученную из канала шины или из тела запроса"""
+    return serialization.loads(raw).get("events", [])
+
+
+class NotificationTransport:
+    """Неблокирующая пакетная отправка уведомлений; доставку реализуют наследники"""
+
+    def __init__(self, batch_size=NOTIFY_BATCH_SIZE, flush_interval=NOTIFY_FLUSH_INTERVAL,
+                 max_queue=NOTIFY_MAX_QUEUE):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+
+        self._pending = []
+        self._slots = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._in_flight = 0
+        self.counters = {"enqueued": 0, "delivered": 0, "coalesced": 0, "dropped": 0}
+
+        self._thread = threading.Thread(target=self._run, name="notification-flusher", daemon=True)
+        self._thread.start()
+
+    def send(self, event):
+        """Ставит событие в очередь, не дожидаясь веб-приложения"""
+        key = coalesce_key(event)
+        with self._cond:
+            self.counters["enqueued"] += 1
+            if key is not None and key in self._slots:
+                # Заменяем еще не отправленный прогресс на более свежий
+                slot = self._slots[key]
+                self._pending[slot] = coalesce_events(self._pending[slot], event)
+                self.counters["coalesced"] += 1
+                return
+            if len(self._pending) >= self.max_queue:
+                self.counters["dropped"] += 1
+                return
+            if key is not None:
+                self._slots[key] = len(self._pending)
+            else:
+                self._slots.pop(progress_pipeline(event), None)
+            self._pending.append(event)
+            if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Ждет, пока очередь не будет отправлена (для завершения процесса и тестов)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining if remaining is not None else 0.1)
+        return True
+
+    def close(self, timeout=5):
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self.counters)
+            stats["pending"] = len(self._pending)
+        return stats
+
+    def _take_batch(self):
+        batch = self._pending[:self.batch_size]
+        self._pending = self._pending[self.batch_size:]
+        # Пересчитываем позиции схлопываемых событий после сдвига очереди
+        self._slots = {}
+        for index, event in enumerate(self._pending):
+            key = coalesce_key(event)
+            if key is not None:
+                self._slots[key] = index
+            else:
+                self._slots.pop(progress_pipeline(event), None)
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+                if len(self._pending) < self.batch_size and not self._closed:
+                    # Даем пачке набраться, но не дольше интервала
+                    self._cond.wait(self.flush_interval)
+                batch = self._take_batch()
+                self._in_flight = len(batch)
+
+            self._post(batch)
+
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def _post(self, batch):
+        start = time.perf_counter()
+        try:
+            self._deliver(batch)
+            delivered = len(batch)
+        except Exception as e:
+            print(f"Ошибка отправки уведомлений: {e}")
+            delivered = 0
+        observe_delivery(len(batch), time.perf_counter() - start, delivered > 0)
+        with self._cond:
+            self.counters["delivered"] += delivered
+            self.counters["dropped"] += len(batch) - delivered
+
+    def _deliver(self, batch):
+        raise NotImplementedError
+
+
+class HttpNotificationTransport(NotificationTransport):
+    """Доставка пачек POST-запросом на /task_results веб-приложения"""
+
+    def __init__(self, url=WEB_APP_URL, timeout=NOTIFY_TIMEOUT, **kwargs):
+        import requests
+
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        super().__init__(**kwargs)
+
+    def _deliver(self, batch):
+        if serialization.is_binary():
+            response = self.session.post(f"{self.url}/task_results", data=encode_batch(batch), timeout=self.timeout,
+                                         headers={"Content-Type": serialization.BINARY_CONTENT_TYPE})
+        else:
+            response = self.session.post(f"{self.url}/task_results", json={"events": batch}, timeout=self.timeout)
+        response.raise_for_status()
+
+    def close(self, timeout=5):
+        super().close(timeout)
+        self.session.close()
+
+
+class RedisNotificationTransport(NotificationTransport):
+    """Доставка пачек записью в поток Redis (шина событий для всех реплик)"""
+
+    def __init__(self, redis_url=NOTIFY_REDIS_URL, stream=NOTIFY_STREAM, redis_client=None,
+                 maxlen=NOTIFY_STREAM_MAXLEN, **kwargs):
+        if redis_client is None:
+            import redis_pool
+            redis_client = redis_pool.get_client(redis_url)
+        self.redis_client = redis_client
+        self.stream = stream
+        self.maxlen = maxlen
+        super().__init__(**kwargs)
+
+    def _deliver(self, batch):
+        self.redis_client.xadd(self.stream, {"batch": encode_batch(batch)}, maxlen=self.maxlen, approximate=True)
+
+
+def ensure_group(redis_client, stream=NOTIFY_STREAM, group=NOTIFY_GROUP):
+    """Создает группу потребителей потока (и сам поток), если ее еще нет"""
+    try:
+        redis_client.xgroup_create(stream, group, id="0", mkstream=True)
+    except Exception as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def relay_stream(redis_client, process, consumer, stream=NOTIFY_STREAM, group=NOTIFY_GROUP,
+                 channel=NOTIFY_CHANNEL, count=10, block=1000, claim_idle=NOTIFY_CLAIM_IDLE, stop=None):
+    """Читает поток как один из потребителей группы и пересылает пачки всем репликам.
+
+    process(events) выполняет побочные эффекты событий и возвращает события для
+    рассылки; пачка подтверждается (XACK) после публикации в канал. Пачки,
+    которые взяла и не подтвердила упавшая реплика, забираются через claim_idle.
+    """
+    ensure_group(redis_client, stream, group)
+    next_claim = 0.0
+    while stop is None or not stop.is_set():
+        entries = []
+        if time.monotonic() >= next_claim:
+            next_claim = time.monotonic() + claim_idle
+            entries = redis_client.xautoclaim(stream, group, consumer, int(claim_idle * 1000), "0-0",
+                                              count=count)[1]
+        if not entries:
+            response = redis_client.xreadgroup(group, consumer, {stream: ">"}, count=count, block=block)
+            entries = response[0][1] if response else []
+        for entry_id, fields in entries:
+            raw = fields.get(b"batch", fields.get("batch")) if fields else None
+            if raw is not None:
+                redis_client.publish(channel, encode_batch(process(decode_batch(raw))))
+            redis_client.xack(stream, group, entry_id)
+
+
+def create_transport():
+    """Создает транспорт согласно NOTIFY_TRANSPORT (http по умолчанию)"""
+    if NOTIFY_TRANSPORT == "redis":
+        return RedisNotificationTransport()
+    return HttpNotificationTransport()
+
+
+_transport = None
+_transport_pid = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """Возвращает транспорт текущего процесса (после fork создается заново)"""
+    global _transport, _transport_pid
+    pid = os.getpid()
+    if _transport is None or _transport_pid != pid:
+        with _transport_lock:
+            if _transport is None or _transport_pid != pid:
+                _transport = create_transport()
+                _transport_pid = pid
+    return _transport
+
+
+def shutdown_transport(timeout=5):
+    """Отправляет накопленные события перед завершением процесса"""
+    if _transport is not None and _transport_pid == os.getpid():
+        _transport.close(timeout)
+        print(f"Статистика уведомлений: {_transport.stats()}")
+
+
+atexit.register(shutdown_transport)
@@ -0,0 +1,93 @@
+import json
+import os
+import time
+
+from redis_pool import LuaScript
+
+# Состояние возобновляемого пайплайна в Redis.
+# Пайплайн хранится как конечный автомат: номер текущего шага, результат
+# предыдущего шага, ответы пользователя внутри шага и ожидающий запрос ввода.
+# Пока пользователь думает, ни одна задача не занимает слот воркера: ответ
+# атомарно "забирает" запрос (claim_prompt) и ставит в очередь продолжение.
+
+STATE_KEY = "pipeline_state:{}"
+STATE_TTL = int(os.environ.get("PIPELINE_STATE_TTL", str(24 * 3600)))
+
+
+def state_key(pipeline_id):
+    return STATE_KEY.format(pipeline_id)
+
+
+def new_state(pipeline_id, data_size):
+    return {
+        "pipeline_id": pipeline_id,
+        "status": "running",
+        "step": 0,
+        "prev_result": {"data_size": data_size, "pipeline_id": pipeline_id},
+        "answers": [],
+        "pending": None,
+        "updated_at": time.time(),
+    }
+
+
+def prompt_token(pipeline_id, step, index):
+    """Идентификатор запроса ввода; веб-приложение передает его вместо task_id"""
+    return f"{pipeline_id}:{step}:{index}"
+
+
+def parse_prompt_token(token):
+    pipeline_id, step, index = token.rsplit(":", 2)
+    return pipeline_id, int(step), int(index)
+
+
+def is_prompt_token(task_id):
+    # Идентификаторы задач Celery — UUID без двоеточий
+    return bool(task_id) and task_id.count(":") >= 2
+
+
+def load_state(redis_client, pipeline_id):
+    raw = redis_client.get(state_key(pipeline_id))
+    return json.loads(raw) if raw else None
+
+
+def save_state(redis_client, state):
+    state["updated_at"] = time.time()
+    redis_client.set(state_key(state["pipeline_id"]), json.dumps(state), ex=STATE_TTL)
+
+
+def delete_state(redis_client, pipeline_id):
+    redis_client.delete(state_key(pipeline_id))
+
+
+# Запись состояния, только если оно не изменилось с момента чтения
+COMPARE_AND_SET = LuaScript("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+""")
+
+
+def claim_prompt(redis_client, token):
+    """Атомарно снимает ожидающий запрос ввода.
+
+    Возвращает (state, prompt), если token совпал с ожидающим запросом, иначе (None, None):
+    повторный ответ, ответ после таймаута или устаревший token ничего не запускают.
+    Чтение и условная запись (compare-and-set) — два round-trip без WATCH.
+    """
+    pipeline_id, _, _ = parse_prompt_token(token)
+    key = state_key(pipeline_id)
+
+    while True:
+        raw = redis_client.get(key)
+        state = json.loads(raw) if raw else None
+        prompt = state and state.get("pending")
+        if not prompt or prompt.get("task_id") != token:
+            return None, None
+
+        state["pending"] = None
+        state["status"] = "running"
+        state["updated_at"] = time.time()
+        if COMPARE_AND_SET(redis_client, [key], [raw, json.dumps(state), STATE_TTL]):
+            return state, prompt
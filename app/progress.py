@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+
+# Ограничение частоты и дельта-сжатие событий прогресса пайплайна.
+# Не чаще PROGRESS_MAX_RATE обновлений в секунду на пайплайн (0 — без ограничения);
+# начало шага (0%), его конец (100%) и завершение пайплайна отправляются всегда.
+# После первого полного снимка отправляются только изменившиеся поля с пометкой delta.
+
+PROGRESS_MAX_RATE = float(os.environ.get("PROGRESS_MAX_RATE", "4"))
+PROGRESS_DELTAS = os.environ.get("PROGRESS_DELTAS", "true").lower() in ("1", "true", "yes")
+# Склеивать текст шага и числовой прогресс одного тика в одно событие
+PROGRESS_MERGE = os.environ.get("PROGRESS_MERGE", "true").lower() in ("1", "true", "yes")
+
+MAX_TRACKED_PIPELINES = 10000
+# Имя задачи у «голых» тиков прогресса без собственного текста шага: только их
+# можно отбрасывать и схлопывать, события с текстом доставляются всегда
+PROGRESS_TICK_TASK = "Прогресс пайплайна"
+
+
+class ProgressReporter:
+    """Решает, какие обновления прогресса отправлять и в каком виде"""
+
+    def __init__(self, max_rate=PROGRESS_MAX_RATE, deltas=PROGRESS_DELTAS, clock=time.monotonic):
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.deltas = deltas
+        self.clock = clock
+        self._last_sent = {}
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        self.counters = {"reported": 0, "sent": 0, "throttled": 0}
+
+    def prepare(self, progress_info, force=False):
+        """Возвращает progress_info к отправке или None, если обновление отброшено.
+
+        Первое событие пайплайна — полный снимок, дальше только изменившиеся поля.
+        """
+        pipeline_id = progress_info.get("pipeline_id")
+        finished = progress_info.get("overall_progress", 0) >= 100
+        boundary = progress_info.get("step_progress") in (0, 100) or finished
+
+        with self._lock:
+            self.counters["reported"] += 1
+            now = self.clock()
+            last = self._last_sent.get(pipeline_id)
+            if not force and not boundary and last is not None and now - last < self.min_interval:
+                self.counters["throttled"] += 1
+                return None
+
+            snapshot = self._snapshots.get(pipeline_id)
+            if not self.deltas or snapshot is None:
+                payload = dict(progress_info)
+            else:
+                payload = {key: value for key, value in progress_info.items() if snapshot.get(key) != value}
+                payload["pipeline_id"] = pipeline_id
+                payload["delta"] = True
+
+            if finished:
+                self._last_sent.pop(pipeline_id, None)
+                self._snapshots.pop(pipeline_id, None)
+            else:
+                if len(self._snapshots) >= MAX_TRACKED_PIPELINES and pipeline_id not in self._snapshots:
+                    self._last_sent.clear()
+                    self._snapshots.clear()
+                self._last_sent[pipeline_id] = now
+                self._snapshots[pipeline_id] = dict(progress_info)
+
+            self.counters["sent"] += 1
+            return payload
+
+
+def merge_progress(previous, update):
+    """Применяет обновление (полное или дельту) к известному состоянию прогресса"""
+    if not update.get("delta") or previous is None:
+        return {key: value for key, value in update.items() if key != "delta"}
+    merged = dict(previous)
+    merged.update({key: value for key, value in update.items() if key != "delta"})
+    return merged
+
+
+progress_reporter = ProgressReporter()
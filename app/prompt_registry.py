@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+import uuid
+
+import metrics
+import redis_pool
+from pipeline_state import is_prompt_token
+
+# Реестр ожидающих запросов ввода.
+# Каждый запрос ввода попадает в ZSET prompts:pending:{mode} с дедлайном в качестве
+# оценки: blocking — задача цепочки ждет на BLPOP, resumable — пайплайн остановлен
+# в Redis (token вида pipeline_id:step:index). Ответ пользователя атомарно снимает
+# запрос (resolve): ответ на уже истекший или отвеченный запрос не доставляется и не
+# оставляет ключей user_input:{task_id} без хозяина.
+# Таймауты обрабатывает один периодический sweeper вместо таймера на каждый запрос
+# (отложенной задачи resume_pipeline или собственного таймаута задачи): раз в
+# PROMPT_SWEEP_INTERVAL секунд он забирает просроченные запросы одним Lua-скриптом и
+# передает их обработчику воркера — blocking-задача получает TIMED_OUT в канал ввода,
+# resumable-пайплайн продолжается с ним. Sweeper запускается в каждом воркере tasks,
+# но проверки делает только тот, кто держит аренду prompts:sweeper; если он пропал,
+# аренда истекает через несколько интервалов и ее берет другой воркер.
+# Число ожидающих запросов, просроченных и итоги (ответ, отключение, таймаут) отдает counts.
+
+PROMPT_REGISTRY = os.environ.get("PROMPT_REGISTRY", "true").lower() in ("1", "true", "yes")
+# Период проверки дедлайнов; 0 — sweeper не запускается
+PROMPT_SWEEP_INTERVAL = float(os.environ.get("PROMPT_SWEEP_INTERVAL", "1"))
+# Сколько запросов снимать за один вызов скрипта
+PROMPT_SWEEP_BATCH = int(os.environ.get("PROMPT_SWEEP_BATCH", "500"))
+# Запас для blocking-задачи сверх таймаута: если sweeper не работает, задача
+# все равно проснется сама
+PROMPT_SWEEP_GRACE = float(os.environ.get("PROMPT_SWEEP_GRACE", "5"))
+
+BLOCKING = "blocking"
+RESUMABLE = "resumable"
+MODES = (BLOCKING, RESUMABLE)
+PENDING_KEY = "prompts:pending:{}"
+STATS_KEY = "prompts:stats"
+SWEEP_LOCK = "prompts:sweeper"
+OUTCOMES = ("answered", "disconnected", "expired")
+
+# KEYS: 1 ожидающие, 2 статистика. ARGV: 1 token, 2 итог.
+# Дедлайн запроса, если он снят этим вызовом, иначе nil (ответ, отключение или таймаут)
+RESOLVE = redis_pool.LuaScript("""
+local deadline = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not deadline then
+    return false
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HINCRBY', KEYS[2], ARGV[2], 1)
+return deadline
+""")
+
+# Возврат снятого запроса, если ввод не удалось доставить. ARGV: 1 token, 2 итог, 3 дедлайн
+RESTORE = redis_pool.LuaScript("""
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+redis.call('HINCRBY', KEYS[2], ARGV[2], -1)
+return 1
+""")
+
+# KEYS: 1 ожидающие, 2 статистика. ARGV: 1 now, 2 limit. Возвращает снятые token
+EXPIRE = redis_pool.LuaScript("""
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+    redis.call('HINCRBY', KEYS[2], 'expired', #due)
+end
+return due
+""")
+
+# KEYS: 1 аренда. ARGV: 1 владелец, 2 срок в мс. 1 — аренда у этого владельца
+LEASE = redis_pool.LuaScript("""
+local holder = redis.call('GET', KEYS[1])
+if holder and holder ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return 1
+""")
+
+
+def mode_of(token):
+    return RESUMABLE if is_prompt_token(token) else BLOCKING
+
+
+def pending_key(mode):
+    return PENDING_KEY.format(mode)
+
+
+def register(redis_client, token, timeout, now=None):
+    """Ставит запрос ввода на учет с дедлайном now + timeout"""
+    if not PROMPT_REGISTRY:
+        return
+    deadline = (now or time.time()) + timeout
+    redis_client.zadd(pending_key(mode_of(token)), {token: deadline})
+
+
+def take(redis_client, token, outcome="answered"):
+    """Снимает запрос и возвращает его дедлайн; None — запрос уже закрыт"""
+    if not PROMPT_REGISTRY:
+        return 0.0
+    deadline = RESOLVE(redis_client, [pending_key(mode_of(token)), STATS_KEY], [token, outcome])
+    return None if deadline is None else float(deadline)
+
+
+def resolve(redis_client, token, outcome="answered"):
+    """Снимает запрос; False — запрос уже закрыт, и ввод доставлять не нужно"""
+    return take(redis_client, token, outcome) is not None
+
+
+def restore(redis_client, token, deadline, outcome="answered"):
+    """Возвращает снятый запрос с прежним дедлайном (ввод не доставлен): его снимет
+    повторный ответ или sweeper по таймауту"""
+    if PROMPT_REGISTRY:
+        RESTORE(redis_client, [pending_key(mode_of(token)), STATS_KEY], [token, outcome, deadline])
+
+
+def wait_timeout(timeout):
+    """Сколько blocking-задаче ждать ввода: таймаут по дедлайну обрабатывает sweeper"""
+    return timeout + PROMPT_SWEEP_GRACE if PROMPT_REGISTRY else timeout
+
+
+def expire_due(redis_client, now=None, limit=PROMPT_SWEEP_BATCH):
+    """Снимает просроченные запросы; возвращает [(token, mode)]"""
+    now = now or time.time()
+    expired = []
+    for mode in MODES:
+        for token in EXPIRE(redis_client, [pending_key(mode), STATS_KEY], [now, limit]):
+            expired.append((token.decode() if isinstance(token, bytes) else token, mode))
+    return expired
+
+
+def sweep(redis_client, on_expired, now=None, limit=PROMPT_SWEEP_BATCH):
+    """Передает просроченные запросы on_expired(token, mode); возвращает их число.
+
+    Если обработчик упал (например, брокер недоступен), запрос возвращается в реестр
+    и будет снят на следующем проходе.
+    """
+    expired = expire_due(redis_client, now, limit)
+    for token, mode in expired:
+        try:
+            on_expired(token, mode)
+            metrics.observe_prompt_expired(mode)
+        except Exception as e:
+            print(f"Ошибка обработки таймаута ввода {token}: {e}")
+            redis_client.zadd(pending_key(mode), {token: time.time() + PROMPT_SWEEP_INTERVAL})
+    return len(expired)
+
+
+def run_sweeper(get_client, on_expired, interval=PROMPT_SWEEP_INTERVAL):
+    """Цикл sweeper: проверки делает один процесс из всех воркеров (держатель аренды)"""
+    owner = uuid.uuid4().hex
+    lease_ms = max(1, int(interval * 3000))
+    while True:
+        try:
+            redis_client = get_client()
+            if LEASE(redis_client, [SWEEP_LOCK], [owner, lease_ms]):
+                # Полная пачка — просроченных больше, снимаем их сразу
+                while sweep(redis_client, on_expired) >= PROMPT_SWEEP_BATCH:
+                    pass
+        except Exception as e:
+            print(f"Ошибка sweeper запросов ввода: {e}")
+        time.sleep(interval)
+
+
+def start_sweeper(get_client, on_expired):
+    """Запускает sweeper в фоновом потоке (если реестр включен)"""
+    if not PROMPT_REGISTRY or PROMPT_SWEEP_INTERVAL <= 0:
+        return None
+    thread = threading.Thread(target=run_sweeper, args=(get_client, on_expired), daemon=True,
+                              name="prompt-sweeper")
+    thread.start()
+    return thread
+
+
+def counts(redis_client, now=None):
+    """Ожидающие и просроченные запросы по режимам и итоги снятых запросов"""
+    now = now or time.time()
+    pipe = redis_client.pipeline(transaction=False)
+    for mode in MODES:
+        pipe.zcard(pending_key(mode))
+        pipe.zcount(pending_key(mode), "-inf", now)
+    pipe.hgetall(STATS_KEY)
+    *sizes, raw_stats = pipe.execute()
+    result = {"pending": {}, "overdue": {}}
+    for index, mode in enumerate(MODES):
+        result["pending"][mode] = int(sizes[2 * index])
+        result["overdue"][mode] = int(sizes[2 * index + 1])
+    result["total"] = sum(result["pending"].values())
+    stats = {(k.decode() if isinstance(k, bytes) else k): int(v) for k, v in raw_stats.items()}
+    result.update({outcome: stats.get(outcome, 0) for outcome in OUTCOMES})
+    return result
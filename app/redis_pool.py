@@ -0,0 +1,110 @@
+import hashlib
+import os
+import threading
+import time
+
+import redis
+
+import metrics
+
+# Общий пул соединений Redis для воркеров и веб-приложения.
+# На каждый URL в процессе создается один клиент поверх BlockingConnectionPool:
+# соединения переиспользуются между задачами и запросами, а при исчерпании пула
+# вызывающий ждет свободное соединение (REDIS_POOL_TIMEOUT) вместо открытия новых.
+# После fork (prefork-воркеры) redis-py сам пересоздает соединения в дочернем процессе.
+# Каждый round-trip (команда, pipeline, скрипт) попадает в метрику
+# redis_roundtrip_seconds, число соединений — в redis_pool_connections.
+
+REDIS_URL = os.environ.get("REDIS_URL") or os.environ.get("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
+# Блокирующее ожидание ввода (BLPOP) держит соединение: пул должен быть больше
+# числа одновременно ждущих задач
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", "256"))
+REDIS_POOL_TIMEOUT = float(os.environ.get("REDIS_POOL_TIMEOUT", "20"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def command_name(args):
+    name = args[0] if args else "UNKNOWN"
+    return (name.decode() if isinstance(name, bytes) else str(name)).upper()
+
+
+class InstrumentedPool(redis.BlockingConnectionPool):
+    """Пул, который считает открытые и занятые соединения"""
+
+    def make_connection(self):
+        connection = super().make_connection()
+        metrics.REDIS_CONNECTIONS.labels("open").inc()
+        return connection
+
+    def get_connection(self, *args, **kwargs):
+        connection = super().get_connection(*args, **kwargs)
+        metrics.REDIS_CONNECTIONS.labels("in_use").inc()
+        return connection
+
+    def release(self, connection):
+        super().release(connection)
+        metrics.REDIS_CONNECTIONS.labels("in_use").dec()
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        start = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            metrics.observe_redis("MULTI" if self.transaction else "PIPELINE", time.perf_counter() - start)
+
+
+class InstrumentedRedis(redis.Redis):
+    """Клиент, замеряющий каждый round-trip"""
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            metrics.observe_redis(command_name(args), time.perf_counter() - start)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def create_client(url=REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS):
+    """Новый клиент со своим пулом (обычно нужен get_client)"""
+    instrumented = metrics.METRICS_ENABLED
+    pool_class = InstrumentedPool if instrumented else redis.BlockingConnectionPool
+    pool = pool_class.from_url(url, max_connections=max_connections, timeout=REDIS_POOL_TIMEOUT,
+                               health_check_interval=REDIS_HEALTH_CHECK_INTERVAL, socket_keepalive=True)
+    return (InstrumentedRedis if instrumented else redis.Redis)(connection_pool=pool)
+
+
+def get_client(url=None):
+    """Общий для процесса клиент Redis для url (по умолчанию REDIS_URL)"""
+    url = url or REDIS_URL
+    client = _clients.get(url)
+    if client is None:
+        with _lock:
+            client = _clients.get(url)
+            if client is None:
+                client = _clients[url] = create_client(url)
+    return client
+
+
+class LuaScript:
+    """Lua-скрипт для атомарных составных операций.
+
+    Выполняется на любом клиенте: EVALSHA, а если скрипта еще нет в кэше Redis — EVAL.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.sha = hashlib.sha1(source.encode()).hexdigest()
+
+    def __call__(self, client, keys=(), args=()):
+        try:
+            return client.evalsha(self.sha, len(keys), *keys, *args)
+        except redis.exceptions.NoScriptError:
+            return client.eval(self.source, len(keys), *keys, *args)
@@ -0,0 +1,257 @@
+import html
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from datetime import datetime
+
+import artifacts
+
+# Отчеты пайплайна на общем томе: REPORT_DIR/{report_id}/.
+# Отчет строится потоково за один проход по набору данных блоками движка: строки
+# сразу дописываются в файл данных (CSV для детального отчета, JSON Lines для
+# технического), аномальные строки — во временный файл, гистограмма копится
+# накопителем. Затем документ report.html пишется по частям: сводка, графики (SVG),
+# таблица аномалий, прочитанная из временного файла построчно. Память не зависит от
+# размера набора, а веб-приложение отдает готовые файлы с поддержкой Range.
+# Отчет собирается в каталоге .partial и переименовывается, когда готов целиком.
+# NumPy и движок нужны только для построения отчета: веб-приложение, которое отдает
+# готовые файлы, их не импортирует.
+
+REPORT_DIR = os.environ.get("REPORT_DIR", os.path.join(artifacts.ARTIFACT_DIR, artifacts.REPORTS_DIR))
+REPORT_TTL = int(os.environ.get("REPORT_TTL", str(7 * 24 * 3600)))
+REPORT_HISTOGRAM_BINS = int(os.environ.get("REPORT_HISTOGRAM_BINS", "40"))
+
+MANIFEST = "manifest.json"
+DOCUMENT = "report.html"
+PARTIAL_SUFFIX = ".partial"
+REPORT_ID_PATTERN = re.compile(r"^RPT-[0-9A-F]{12}$")
+
+# Что входит в отчет каждого формата
+REPORT_FORMATS = {
+    "Краткий отчет": {"data": None, "anomalies": False, "technical": False},
+    "Детальный отчет": {"data": "csv", "anomalies": True, "technical": False},
+    "Презентация": {"data": None, "anomalies": False, "technical": False},
+    "Технический отчет": {"data": "jsonl", "anomalies": True, "technical": True},
+}
+
+DATA_FILES = {
+    "csv": ("data.csv", "text/csv", "id,value,score,category,z,anomaly\n", "%d,%.6g,%.4f,%d,%.3f,%d"),
+    "jsonl": ("data.jsonl", "application/x-ndjson", "",
+              '{"id": %d, "value": %.6g, "score": %.4f, "category": %d, "z": %.3f, "anomaly": %d}'),
+}
+ANOMALY_FORMAT = "%d,%.6g,%.4f,%d,%.3f"
+DOCUMENT_TYPE = "text/html; charset=utf-8"
+
+
+def new_report_id():
+    return f"RPT-{uuid.uuid4().hex[:12].upper()}"
+
+
+def report_path(report_id, name=None):
+    path = os.path.join(REPORT_DIR, report_id)
+    return os.path.join(path, name) if name else path
+
+
+def rows_of(chunk, with_anomaly=True):
+    import numpy as np
+
+    columns = [chunk["id"], chunk["value"], chunk["score"], chunk["category"], chunk["z"]]
+    if with_anomaly:
+        columns.append(chunk["anomaly"])
+    return np.column_stack(columns)
+
+
+def histogram_range(stats):
+    import engine
+
+    summary = engine.summarize(stats)
+    spread = max(summary["std"], 1e-6) * 4
+    return summary["mean"] - spread, summary["mean"] + spread
+
+
+def svg_bars(title, labels, values, width=640, height=220, color="#3b82f6"):
+    """Столбчатая диаграмма SVG без внешних библиотек"""
+    top = max(max(values, default=0), 1e-12)
+    bottom = min(min(values, default=0), 0)
+    span = top - bottom or 1
+    bar = width / max(len(values), 1)
+    zero = height - 20 - (0 - bottom) / span * (height - 40)
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" role="img">',
+             f'<title>{html.escape(title)}</title>',
+             f'<line x1="0" y1="{zero:.1f}" x2="{width}" y2="{zero:.1f}" stroke="#9ca3af"/>']
+    for i, (label, value) in enumerate(zip(labels, values)):
+        y = height - 20 - (value - bottom) / span * (height - 40)
+        parts.append(f'<rect x="{i * bar + 1:.1f}" y="{min(y, zero):.1f}" width="{max(bar - 2, 1):.1f}" '
+                     f'height="{abs(zero - y):.1f}" fill="{color}"><title>{html.escape(str(label))}: '
+                     f'{value:g}</title></rect>')
+        if len(labels) <= 12:
+            parts.append(f'<text x="{i * bar + bar / 2:.1f}" y="{height - 5}" font-size="11" '
+                         f'text-anchor="middle">{html.escape(str(label))}</text>')
+    parts.append("</svg>")
+    return "".join(parts)
+
+
+def write_document(out, meta, summary, histogram, edges, stats, options, anomalies_path, data_name):
+    """Пишет report.html частями; таблица аномалий читается из файла построчно"""
+    import engine
+
+    out.write('<!DOCTYPE html>\n<html lang="ru"><head><meta charset="utf-8">'
+              f'<title>{html.escape(meta["report_id"])}</title>'
+              '<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse}'
+              'td,th{border:1px solid #d1d5db;padding:2px 8px;text-align:right}</style></head><body>\n')
+    out.write(f'<h1>Отчет {html.escape(meta["report_id"])}</h1>\n'
+              f'<p>{html.escape(meta["format"])}, {html.escape(meta["created_at"])}</p>\n')
+
+    out.write("<h2>Сводка</h2>\n<table>\n")
+    rows = [
+        ("Метод анализа", meta["analysis_method"]),
+        ("Уровень сложности", meta["complexity_level"]),
+        ("Записей после очистки", summary["count"]),
+        ("Инсайтов", meta["insights"]),
+        ("Аномалий", meta["anomalies"]),
+        ("Среднее", summary["mean"]),
+        ("Стандартное отклонение", summary["std"]),
+        ("Минимум", summary["min"]),
+        ("Максимум", summary["max"]),
+    ]
+    for name, value in rows:
+        out.write(f'<tr><th>{html.escape(name)}</th><td>{html.escape(str(value))}</td></tr>\n')
+    out.write("</table>\n")
+
+    if meta["includes_charts"]:
+        centers = [round(float((lo + hi) / 2), 2) for lo, hi in zip(edges[:-1], edges[1:])]
+        out.write("<h2>Распределение значений</h2>\n")
+        out.write(svg_bars("Распределение значений", centers, [int(v) for v in histogram]))
+        out.write("\n<h2>Среднее по категориям</h2>\n")
+        out.write(svg_bars("Среднее по категориям", list(range(engine.CATEGORIES)), summary["category_mean"],
+                           color="#10b981"))
+        out.write("\n")
+
+    if options["technical"]:
+        by_category = stats["by_category"]
+        out.write("<h2>Статистика по категориям</h2>\n<table>\n"
+                  "<tr><th>Категория</th><th>Записей</th><th>Среднее</th><th>Отклонение</th></tr>\n")
+        for category in range(engine.CATEGORIES):
+            out.write(f"<tr><td>{category}</td><td>{by_category['count'][category]}</td>"
+                      f"<td>{summary['category_mean'][category]:.4f}</td>"
+                      f"<td>{summary['category_std'][category]:.4f}</td></tr>\n")
+        out.write("</table>\n")
+
+    if anomalies_path:
+        out.write("<h2>Аномальные записи</h2>\n<table>\n"
+                  "<tr><th>id</th><th>value</th><th>score</th><th>category</th><th>z</th></tr>\n")
+        with open(anomalies_path) as anomalies:
+            for line in anomalies:
+                cells = "".join(f"<td>{cell}</td>" for cell in line.rstrip("\n").split(","))
+                out.write(f"<tr>{cells}</tr>\n")
+        out.write("</table>\n")
+
+    if data_name:
+        out.write(f'<p>Данные: <a href="{data_name}">{data_name}</a></p>\n')
+    out.write("</body></html>\n")
+
+
+def build_report(meta, dataset, level, quality, stats, report=lambda done, stage: None):
+    """Строит отчет на диске и возвращает его манифест.
+
+    meta -- report_id, format, includes_charts, analysis_method, complexity_level,
+    insights, anomalies, pipeline_id; report(доля, этап) -- прогресс.
+    """
+    import numpy as np
+    import engine
+
+    options = REPORT_FORMATS.get(meta["format"], REPORT_FORMATS["Краткий отчет"])
+    meta = dict(meta, created_at=datetime.now().isoformat())
+    final_dir = report_path(meta["report_id"])
+    work_dir = final_dir + PARTIAL_SUFFIX
+    os.makedirs(work_dir, exist_ok=True)
+
+    data_name = content_type = None
+    data_file = anomalies_file = None
+    anomalies_path = os.path.join(work_dir, "anomalies.part") if options["anomalies"] else None
+    lo, hi = histogram_range(stats)
+    edges = np.linspace(lo, hi, REPORT_HISTOGRAM_BINS + 1)
+    histogram = np.zeros(REPORT_HISTOGRAM_BINS, dtype=np.int64)
+
+    try:
+        if options["data"]:
+            data_name, content_type, header, row_format = DATA_FILES[options["data"]]
+            data_file = open(os.path.join(work_dir, data_name), "w")
+            data_file.write(header)
+        if anomalies_path:
+            anomalies_file = open(anomalies_path, "w")
+
+        # Один проход по набору: файл данных, аномалии и гистограмма
+        chunks = engine.annotated_chunks(dataset, level, quality, stats, meta["analysis_method"],
+                                         meta["complexity_level"], lambda done: report(done * 0.8, "data"))
+        for chunk in chunks:
+            if not len(chunk["value"]):
+                continue
+            histogram += np.histogram(np.clip(chunk["value"], lo, hi), bins=edges)[0]
+            if data_file:
+                np.savetxt(data_file, rows_of(chunk), fmt=row_format)
+            if anomalies_file:
+                flagged = {name: column[chunk["anomaly"]] for name, column in chunk.items()}
+                np.savetxt(anomalies_file, rows_of(flagged, with_anomaly=False), fmt=ANOMALY_FORMAT)
+    finally:
+        for handle in (data_file, anomalies_file):
+            if handle:
+                handle.close()
+
+    report(0.8, "document")
+    with open(os.path.join(work_dir, DOCUMENT), "w") as out:
+        write_document(out, meta, engine.summarize(stats), histogram, edges, stats, options, anomalies_path,
+                       data_name)
+    if anomalies_path:
+        os.remove(anomalies_path)
+
+    files = {name: {"size": os.path.getsize(os.path.join(work_dir, name)), "content_type": kind}
+             for name, kind in ((DOCUMENT, DOCUMENT_TYPE), (data_name, content_type)) if name}
+    manifest = dict(meta, files=files)
+    with open(os.path.join(work_dir, MANIFEST), "w") as out:
+        json.dump(manifest, out, ensure_ascii=False)
+
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(work_dir, final_dir)
+    report(1.0, "done")
+    return manifest
+
+
+def load_manifest(report_id):
+    """Манифест готового отчета или None"""
+    if not REPORT_ID_PATTERN.match(report_id or ""):
+        return None
+    try:
+        with open(report_path(report_id, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def report_file(report_id, name):
+    """Путь и тип файла готового отчета или (None, None), если такого нет"""
+    manifest = load_manifest(report_id)
+    if manifest is None or name not in manifest["files"]:
+        return None, None
+    return report_path(report_id, name), manifest["files"][name]["content_type"]
+
+
+def cleanup_expired(max_age=REPORT_TTL):
+    """Удаляет отчеты (и брошенные .partial) старше max_age секунд; возвращает их число"""
+    removed = 0
+    deadline = time.time() - max_age
+    try:
+        entries = list(os.scandir(REPORT_DIR))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_dir() and entry.stat().st_mtime < deadline:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
@@ -0,0 +1,66 @@
+import os
+
+# Маршрутизация задач по очередям и настройки воркеров под тип нагрузки.
+# С TASK_ROUTING=true задачи расходятся по очередям, которые обслуживают разные воркеры:
+#   interactive — шаги блокирующего пайплайна, которые минутами ждут ввода (пул gevent;
+#                 расчеты шагов уходят в compute, см. OFFLOAD_COMPUTE в tasks);
+#   pipelines   — запуск пайплайна и продолжения возобновляемого режима;
+#   compute     — партиции данных (prefork, по процессу на ядро);
+#   simple      — короткие задачи add/echo/sleep/error.
+# Долгие задачи подтверждаются после выполнения (acks_late): при падении воркера
+# сообщение вернется в очередь, а prefetch=1 не дает воркеру набрать чужих задач.
+# Без TASK_ROUTING все идет в очередь celery, как раньше.
+
+TASK_ROUTING = os.environ.get("TASK_ROUTING", "false").lower() in ("1", "true", "yes")
+QUEUE_INTERACTIVE = os.environ.get("QUEUE_INTERACTIVE", "interactive")
+QUEUE_PIPELINES = os.environ.get("QUEUE_PIPELINES", "pipelines")
+QUEUE_COMPUTE = os.environ.get("QUEUE_COMPUTE", "compute")
+QUEUE_SIMPLE = os.environ.get("QUEUE_SIMPLE", "simple")
+
+WORKER_PREFETCH_MULTIPLIER = int(os.environ.get("WORKER_PREFETCH_MULTIPLIER", "1"))
+# Подтверждение долгой задачи откладывается, поэтому брокер Redis не должен
+# возвращать ее в очередь раньше, чем она может закончиться
+BROKER_VISIBILITY_TIMEOUT = int(os.environ.get("BROKER_VISIBILITY_TIMEOUT", str(2 * 3600)))
+
+TASK_QUEUES = {
+    "tasks.step1_data_preparation": QUEUE_INTERACTIVE,
+    "tasks.step2_data_processing": QUEUE_INTERACTIVE,
+    "tasks.step3_data_analysis": QUEUE_INTERACTIVE,
+    "tasks.step4_generate_report": QUEUE_INTERACTIVE,
+    "tasks.finish_partitioned_step": QUEUE_INTERACTIVE,
+    "tasks.run_interactive_pipeline": QUEUE_PIPELINES,
+    "tasks.resume_pipeline": QUEUE_PIPELINES,
+    "tasks.resume_partitions": QUEUE_PIPELINES,
+    "tasks.run_partition": QUEUE_COMPUTE,
+    "tasks_simple.*": QUEUE_SIMPLE,
+}
+
+# Задачи, которые держат слот дольше нескольких секунд
+LONG_TASKS = [
+    "tasks.step1_data_preparation",
+    "tasks.step2_data_processing",
+    "tasks.step3_data_analysis",
+    "tasks.step4_generate_report",
+    "tasks.finish_partitioned_step",
+    "tasks.run_partition",
+    "tasks_simple.sleep",
+]
+
+
+def task_routes():
+    return {name: {"queue": queue} for name, queue in TASK_QUEUES.items()}
+
+
+def configure(app, enabled=None):
+    """Применяет маршрутизацию и настройки подтверждения к приложению Celery"""
+    if not (TASK_ROUTING if enabled is None else enabled):
+        return app
+    app.conf.update(
+        task_routes=task_routes(),
+        task_annotations={name: {"acks_late": True} for name in LONG_TASKS},
+        task_reject_on_worker_lost=True,
+        worker_prefetch_multiplier=WORKER_PREFETCH_MULTIPLIER,
+    )
+    app.conf.broker_transport_options = {**app.conf.broker_transport_options,
+                                         "visibility_timeout": BROKER_VISIBILITY_TIMEOUT}
+    return app
@@ -0,0 +1,185 @@
+import json
+import os
+import time
+
+import redis_pool
+
+# Планировщик запуска пайплайнов: допуск по лимитам и честная очередь.
+# Активные пайплайны хранятся в ZSET scheduler:active с дедлайном аренды: больше
+# SCHEDULER_MAX_ACTIVE одновременно не запускается, у одного пользователя — не больше
+# SCHEDULER_MAX_PER_USER. Остальные ждут в ZSET scheduler:pending. Очередь честная:
+# очередной запуск пользователя получает номер раунда (max(его прошлый раунд, текущий
+# раунд) + 1), поэтому пачка из сотни запусков одного пользователя не заслоняет
+# одиночные запуски остальных. Сначала идет раунд, внутри раунда — приоритет
+# (0–9, больше — раньше). Постановка, допуск, освобождение и возврат просроченных аренд
+# (воркер упал, событие завершения потерялось) — атомарные Lua-скрипты.
+
+PIPELINE_SCHEDULER = os.environ.get("PIPELINE_SCHEDULER", "true").lower() in ("1", "true", "yes")
+SCHEDULER_MAX_ACTIVE = int(os.environ.get("SCHEDULER_MAX_ACTIVE", "100"))
+SCHEDULER_MAX_PER_USER = int(os.environ.get("SCHEDULER_MAX_PER_USER", "10"))
+# Аренда продлевается на каждом запросе ввода; без событий пайплайн считается потерянным
+SCHEDULER_LEASE = int(os.environ.get("SCHEDULER_LEASE", str(2 * 3600)))
+# Сколько первых ожидающих пайплайнов просматривать за один допуск
+SCHEDULER_SCAN = int(os.environ.get("SCHEDULER_SCAN", "200"))
+MAX_BULK_START = int(os.environ.get("MAX_BULK_START", "500"))
+
+MAX_PRIORITY = 9
+DEFAULT_PRIORITY = 5
+# Оценка в ZSET: раунд * PRIORITY_LEVELS + (MAX_PRIORITY - приоритет)
+PRIORITY_LEVELS = MAX_PRIORITY + 1
+
+KEYS = [f"scheduler:{name}" for name in
+        ("active", "pending", "owner", "user_active", "jobs", "rank", "round", "user_rank")]
+
+# Общая часть скриптов. KEYS: 1 active, 2 pending, 3 owner (pipeline -> пользователь),
+# 4 user_active (пользователь -> число активных), 5 jobs (параметры запуска),
+# 6 rank (раунд ожидающего), 7 round (текущий раунд), 8 user_rank (последний раунд
+# пользователя). ARGV: 1 now, 2 lease, 3 max_active, 4 max_per_user, 5 scan
+ADMIT_FUNCTIONS = """
+local function drop(pid)
+    local user = redis.call('HGET', KEYS[3], pid)
+    if user and redis.call('HINCRBY', KEYS[4], user, -1) <= 0 then
+        redis.call('HDEL', KEYS[4], user)
+    end
+    redis.call('HDEL', KEYS[3], pid)
+end
+
+local function admit()
+    local now = tonumber(ARGV[1])
+    local max_active, max_per_user = tonumber(ARGV[3]), tonumber(ARGV[4])
+    for _, pid in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now)) do
+        redis.call('ZREM', KEYS[1], pid)
+        drop(pid)
+    end
+
+    local admitted = {}
+    local active = redis.call('ZCARD', KEYS[1])
+    if active >= max_active then
+        return admitted
+    end
+    local round = tonumber(redis.call('GET', KEYS[7]) or '0')
+    for _, pid in ipairs(redis.call('ZRANGE', KEYS[2], 0, tonumber(ARGV[5]) - 1)) do
+        local user = redis.call('HGET', KEYS[3], pid)
+        if tonumber(redis.call('HGET', KEYS[4], user) or '0') < max_per_user then
+            redis.call('ZREM', KEYS[2], pid)
+            redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), pid)
+            redis.call('HINCRBY', KEYS[4], user, 1)
+            round = math.max(round, tonumber(redis.call('HGET', KEYS[6], pid) or '0'))
+            redis.call('HDEL', KEYS[6], pid)
+            table.insert(admitted, redis.call('HGET', KEYS[5], pid))
+            redis.call('HDEL', KEYS[5], pid)
+            active = active + 1
+            if active >= max_active then
+                break
+            end
+        end
+    end
+    redis.call('SET', KEYS[7], round)
+    return admitted
+end
+"""
+
+# ARGV[6] — пользователь, дальше тройки (pipeline_id, приоритет, параметры запуска)
+SUBMIT = redis_pool.LuaScript(ADMIT_FUNCTIONS + f"""
+local user = ARGV[6]
+local round = tonumber(redis.call('GET', KEYS[7]) or '0')
+local rank = tonumber(redis.call('HGET', KEYS[8], user) or '0')
+for i = 7, #ARGV, 3 do
+    rank = math.max(rank, round) + 1
+    redis.call('ZADD', KEYS[2], rank * {PRIORITY_LEVELS} + ({MAX_PRIORITY} - tonumber(ARGV[i + 1])), ARGV[i])
+    redis.call('HSET', KEYS[3], ARGV[i], user)
+    redis.call('HSET', KEYS[5], ARGV[i], ARGV[i + 2])
+    redis.call('HSET', KEYS[6], ARGV[i], rank)
+end
+redis.call('HSET', KEYS[8], user, rank)
+return admit()
+""")
+
+# ARGV[6] — завершившийся пайплайн; повторное освобождение ничего не меняет
+RELEASE = redis_pool.LuaScript(ADMIT_FUNCTIONS + """
+if redis.call('ZREM', KEYS[1], ARGV[6]) == 1 then
+    drop(ARGV[6])
+end
+return admit()
+""")
+
+
+def admission_args(now=None, admit=True):
+    max_active = SCHEDULER_MAX_ACTIVE if admit else 0
+    return [now or time.time(), SCHEDULER_LEASE, max_active, SCHEDULER_MAX_PER_USER, SCHEDULER_SCAN]
+
+
+def clamp_priority(priority):
+    if priority is None:
+        return DEFAULT_PRIORITY
+    return max(0, min(MAX_PRIORITY, int(priority)))
+
+
+def broker_priority(priority):
+    """Приоритет сообщения Celery: у транспорта Redis 0 — самый срочный"""
+    return MAX_PRIORITY - clamp_priority(priority)
+
+
+def configure(app):
+    """Включает приоритеты сообщений в очередях Redis"""
+    app.conf.broker_transport_options = {**app.conf.broker_transport_options,
+                                         "priority_steps": list(range(MAX_PRIORITY + 1)),
+                                         "queue_order_strategy": "priority"}
+    return app
+
+
+def decode_jobs(raw):
+    return [json.loads(item) for item in raw]
+
+
+def submit(redis_client, user, jobs):
+    """Ставит запуски пользователя в очередь; возвращает те, что можно запускать сейчас.
+
+    jobs — словари с pipeline_id, data_size и priority.
+    """
+    now = time.time()
+    args = admission_args(now) + [user]
+    for job in jobs:
+        job = dict(job, user=user, priority=clamp_priority(job.get("priority")), queued_at=now)
+        args += [job["pipeline_id"], job["priority"], json.dumps(job)]
+    return decode_jobs(SUBMIT(redis_client, KEYS, args))
+
+
+def release(redis_client, pipeline_id, admit=True):
+    """Освобождает место завершившегося пайплайна; возвращает допущенные вместо него.
+
+    С admit=False место только освобождается (пайплайн не удалось отправить воркерам).
+    """
+    return decode_jobs(RELEASE(redis_client, KEYS, admission_args(admit=admit) + [pipeline_id]))
+
+
+def renew(redis_client, pipeline_id):
+    """Продлевает аренду активного пайплайна"""
+    redis_client.zadd(KEYS[0], {pipeline_id: time.time() + SCHEDULER_LEASE}, xx=True)
+
+
+def queued(redis_client, limit):
+    """Первые limit ожидающих пайплайнов в порядке очереди"""
+    return [item.decode() if isinstance(item, bytes) else item
+            for item in redis_client.zrange(KEYS[1], 0, limit - 1)]
+
+
+def position(redis_client, pipeline_id):
+    """Место в очереди (с 1) или None, если пайплайн не ждет"""
+    rank = redis_client.zrank(KEYS[1], pipeline_id)
+    return None if rank is None else rank + 1
+
+
+def stats(redis_client):
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zcard(KEYS[0])
+    pipe.zcard(KEYS[1])
+    pipe.hgetall(KEYS[3])
+    active, pending, per_user = pipe.execute()
+    return {
+        "active": active,
+        "queued": pending,
+        "max_active": SCHEDULER_MAX_ACTIVE,
+        "max_per_user": SCHEDULER_MAX_PER_USER,
+        "active_per_user": {(k.decode() if isinstance(k, bytes) else k): int(v) for k, v in per_user.items()},
+    }
@@ -0,0 +1,77 @@
+import json
+import os
+import zlib
+
+# Формат данных между процессами: сообщения и результаты Celery, пачки уведомлений
+# (HTTP и шина Redis) и канал пользовательского ввода.
+# SERIALIZER=json (по умолчанию) — как раньше; msgpack — компактный двоичный формат,
+# дешевле в кодировании и на порядок меньше для числовых результатов шагов.
+# С SERIALIZER_COMPRESSION=zlib данные от SERIALIZER_COMPRESS_MIN байт дополнительно сжимаются.
+# Двоичные данные начинаются с нулевого байта и метки формата, а JSON с нулевого байта
+# начаться не может, поэтому читатель понимает оба формата: воркеры и веб-приложение
+# можно переключать по очереди.
+
+SERIALIZER = os.environ.get("SERIALIZER", "json").lower()
+SERIALIZER_COMPRESSION = os.environ.get("SERIALIZER_COMPRESSION", "none").lower()
+SERIALIZER_COMPRESS_MIN = int(os.environ.get("SERIALIZER_COMPRESS_MIN", "1024"))
+
+MSGPACK_MARK = b"\x00m"
+COMPRESSED_MARK = b"\x00z"
+BINARY_CONTENT_TYPE = "application/x-msgpack"
+# Имя сериализатора kombu для сжатого msgpack
+COMPRESSED_SERIALIZER = "msgpack-zlib"
+
+
+def pack(obj):
+    import msgpack
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def unpack(raw):
+    import msgpack
+    return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+
+
+def dumps(obj, serializer=None, compression=None):
+    """Кодирует объект в выбранном формате: str для JSON, bytes для msgpack"""
+    if (serializer or SERIALIZER) != "msgpack":
+        return json.dumps(obj)
+    data = pack(obj)
+    if (compression or SERIALIZER_COMPRESSION) == "zlib" and len(data) >= SERIALIZER_COMPRESS_MIN:
+        return COMPRESSED_MARK + zlib.compress(data)
+    return MSGPACK_MARK + data
+
+
+def loads(raw):
+    """Декодирует данные любого из форматов"""
+    if isinstance(raw, (bytes, bytearray, memoryview)):
+        raw = bytes(raw)
+        if raw.startswith(COMPRESSED_MARK):
+            return unpack(zlib.decompress(raw[len(COMPRESSED_MARK):]))
+        if raw.startswith(MSGPACK_MARK):
+            return unpack(raw[len(MSGPACK_MARK):])
+        raw = raw.decode()
+    return json.loads(raw)
+
+
+def is_binary():
+    return SERIALIZER == "msgpack"
+
+
+def configure(app):
+    """Формат сообщений и результатов Celery.
+
+    Принимаются все форматы, чтобы воркер понимал сообщения от еще не переключенных
+    отправителей; отправляются — в формате SERIALIZER.
+    """
+    from kombu.serialization import register
+
+    register(COMPRESSED_SERIALIZER, lambda obj: dumps(obj, "msgpack", "zlib"), loads,
+             content_type="application/x-msgpack-zlib", content_encoding="binary")
+    app.conf.accept_content = ["json", "msgpack", COMPRESSED_SERIALIZER]
+    app.conf.result_accept_content = ["json", "msgpack", COMPRESSED_SERIALIZER]
+    if SERIALIZER == "msgpack":
+        name = COMPRESSED_SERIALIZER if SERIALIZER_COMPRESSION == "zlib" else "msgpack"
+        app.conf.task_serializer = name
+        app.conf.result_serializer = name
+    return app
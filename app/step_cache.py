@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import time
+
+import artifacts
+
+# Кэш результатов детерминированных шагов пайплайна (включается STEP_CACHE=true).
+# Ключ — хэш имени шага, входных данных шага (без pipeline_id), ответов
+# пользователя и параметров генерации данных (DATASET_SEED, ENGINE_CHUNK_ROWS).
+# Записи хранятся в Redis с TTL; индекс step_cache:index (ZSET по времени
+# последнего обращения) ограничивает их число, вытесняя самые старые.
+# Артефакты, на которые ссылается кэшированный результат, переносятся из каталога
+# пайплайна в кэш. Вытесненная запись сразу перестает находиться, а ее артефакты
+# удаляются при следующей очистке не раньше чем через STEP_CACHE_GRACE секунд:
+# пайплайн, только что получивший попадание, дочитывает их через memory map.
+
+STEP_CACHE = os.environ.get("STEP_CACHE", "false").lower() in ("1", "true", "yes")
+STEP_CACHE_TTL = int(os.environ.get("STEP_CACHE_TTL", str(6 * 3600)))
+STEP_CACHE_MAX_ENTRIES = int(os.environ.get("STEP_CACHE_MAX_ENTRIES", "1000"))
+STEP_CACHE_MAX_BYTES = int(os.environ.get("STEP_CACHE_MAX_BYTES", str(1024 * 1024)))
+STEP_CACHE_GRACE = int(os.environ.get("STEP_CACHE_GRACE", "3600"))
+
+ENTRY_KEY = "step_cache:{}"
+INDEX_KEY = "step_cache:index"
+STATS_KEY = "step_cache:stats"
+# Вытесненные записи, чьи артефакты ждут удаления (ZSET по времени вытеснения)
+EVICTED_KEY = "step_cache:evicted"
+
+
+def cache_key(step_name, prev_result, inputs):
+    import engine
+
+    payload = {key: value for key, value in prev_result.items() if key != "pipeline_id"}
+    raw = json.dumps({"step": step_name, "input": payload, "inputs": inputs,
+                      "seed": engine.DATASET_SEED, "chunk_rows": engine.ENGINE_CHUNK_ROWS},
+                     sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def find_artifacts(value):
+    """Ссылки на артефакты внутри результата шага"""
+    if isinstance(value, dict):
+        if "artifact" in value and isinstance(value["artifact"], dict):
+            yield value["artifact"]
+        for item in value.values():
+            yield from find_artifacts(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from find_artifacts(item)
+
+
+class StepCache:
+    """Кэш результатов шагов в Redis с TTL и ограничением числа записей"""
+
+    def __init__(self, redis_client, ttl=STEP_CACHE_TTL, max_entries=STEP_CACHE_MAX_ENTRIES,
+                 max_bytes=STEP_CACHE_MAX_BYTES, grace=STEP_CACHE_GRACE):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.grace = grace
+
+    def get(self, key):
+        """Возвращает запись {"result", "text"} или None"""
+        raw = self.redis.get(ENTRY_KEY.format(key))
+        entry = json.loads(raw) if raw else None
+        if entry and not all(artifacts.exists(ref) for ref in find_artifacts(entry["result"])):
+            # Артефакт уже удален — запись бесполезна
+            self._remove([key])
+            entry = None
+
+        pipe = self.redis.pipeline()
+        if entry:
+            pipe.expire(ENTRY_KEY.format(key), self.ttl)
+            pipe.zadd(INDEX_KEY, {key: time.time()})
+        pipe.hincrby(STATS_KEY, "hits" if entry else "misses", 1)
+        pipe.execute()
+        return entry
+
+    def put(self, key, result, text=None):
+        """Сохраняет результат шага; его артефакты переходят в кэш"""
+        raw = json.dumps({"result": result, "text": text})
+        if len(raw) > self.max_bytes:
+            self.redis.hincrby(STATS_KEY, "skipped", 1)
+            return False
+
+        # Запись вытеснялась, но ее артефакты еще не удалены: они снова нужны
+        self.redis.zrem(EVICTED_KEY, key)
+        for ref in find_artifacts(result):
+            artifacts.pin(ref, key)
+        raw = json.dumps({"result": result, "text": text})
+
+        pipe = self.redis.pipeline()
+        pipe.set(ENTRY_KEY.format(key), raw, ex=self.ttl)
+        pipe.zadd(INDEX_KEY, {key: time.time()})
+        pipe.hincrby(STATS_KEY, "stores", 1)
+        pipe.execute()
+        self.evict()
+        return True
+
+    def evict(self):
+        """Вытесняет просроченные записи и самые старые сверх max_entries.
+
+        Артефакты вытесненных записей удаляются позже, в sweep().
+        """
+        expired = self.redis.zrangebyscore(INDEX_KEY, "-inf", time.time() - self.ttl)
+        overflow = self.redis.zcard(INDEX_KEY) - len(expired) - self.max_entries
+        if overflow > 0:
+            expired += self.redis.zrange(INDEX_KEY, len(expired), len(expired) + overflow - 1)
+        keys = [key.decode() if isinstance(key, bytes) else key for key in expired]
+        if keys:
+            self._remove(keys)
+            self.redis.hincrby(STATS_KEY, "evictions", len(keys))
+        self.sweep()
+        return len(keys)
+
+    def sweep(self):
+        """Удаляет артефакты записей, вытесненных раньше чем grace секунд назад"""
+        removed = 0
+        for key in self.redis.zrangebyscore(EVICTED_KEY, "-inf", time.time() - self.grace):
+            # Удаляет тот, кто снял ключ: параллельные очистки не делят работу дважды
+            if self.redis.zrem(EVICTED_KEY, key):
+                artifacts.delete_pinned(key.decode() if isinstance(key, bytes) else key)
+                removed += 1
+        return removed
+
+    def _remove(self, keys):
+        pipe = self.redis.pipeline()
+        pipe.delete(*[ENTRY_KEY.format(key) for key in keys])
+        pipe.zrem(INDEX_KEY, *keys)
+        pipe.zadd(EVICTED_KEY, {key: time.time() for key in keys})
+        pipe.execute()
+
+    def stats(self):
+        raw = self.redis.hgetall(STATS_KEY)
+        stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "skipped": 0}
+        stats.update({(k.decode() if isinstance(k, bytes) else k): int(v) for k, v in raw.items()})
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["entries"] = self.redis.zcard(INDEX_KEY)
+        return stats
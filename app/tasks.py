@@ -1,24 +1,58 @@
-from celery import Celery, chain
+from celery import chain, chord, group
+from celery.signals import worker_process_shutdown, worker_ready
 import os
 import time
-import random
-import requests
-import json
+import functools
 from datetime import datetime
+from input_channel import new_prompt_id, pop_input, push_input, DISCONNECTED, TIMED_OUT
+from notifications import get_transport, shutdown_transport
+from pipeline_state import new_state, save_state, claim_prompt, prompt_token
+from progress import progress_reporter, PROGRESS_MERGE, PROGRESS_TICK_TASK
+import artifacts
+import metrics
+import prompt_registry
+import reports
+from step_cache import StepCache, STEP_CACHE, cache_key
+import celery_client
+import redis_pool
+from routing import TASK_ROUTING
 
 broker_url = os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0")
 backend_url = os.environ.get("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
 
-app = Celery('tasks', broker=broker_url, backend=backend_url)
+# Очереди, приоритеты запусков и формат сообщений — общие с веб-приложением (celery_client)
+app = celery_client.create_app('tasks', priorities=True)
+# Движок (NumPy) импортируется в шагах при первом использовании: воркер готов к работе
+# быстрее, а задачи, которым он не нужен (запуск пайплайна), его не загружают
 
-# URL веб-приложения для отправки уведомлений
-WEB_APP_URL = os.environ.get("WEB_APP_URL", "http://web:8000")
+# Режим пайплайна: blocking — цепочка задач, ждущих ввода внутри воркера;
+# resumable — конечный автомат в Redis, воркер свободен, пока пользователь думает
+PIPELINE_MODE = os.environ.get("PIPELINE_MODE", "blocking")
+TOTAL_STEPS = 4
+INPUT_TIMEOUT = 300
+# Множитель длительности имитируемой работы шагов (для бенчмарков)
+PIPELINE_TIME_SCALE = float(os.environ.get("PIPELINE_TIME_SCALE", "1"))
+# Параллельная обработка: шаги 2 и 3 делят данные на партиции, которые выполняет
+# группа задач, а колбэк хорда продолжает шаг с объединенным результатом.
+# 1 — без разбиения; в партиции не меньше PARTITION_MIN_SIZE записей
+PIPELINE_PARTITIONS = int(os.environ.get("PIPELINE_PARTITIONS", "1"))
+PARTITION_MIN_SIZE = int(os.environ.get("PARTITION_MIN_SIZE", "10000"))
+PARTITION_PROGRESS_KEY = "partition_progress:{}:{}"
+# С маршрутизацией блокирующие шаги идут в пул gevent, где расчет NumPy не отдает
+# управление остальным зеленым потокам (ожидание ввода, sweeper, отправка
+# уведомлений). Поэтому тяжелая работа шага всегда уходит задачей run_partition
+# в очередь compute (prefork), даже одной партицией; шаг только ждет ее результат
+OFFLOAD_COMPUTE = os.environ.get(
+    "OFFLOAD_COMPUTE", str(TASK_ROUTING and PIPELINE_MODE == "blocking")).lower() in ("1", "true", "yes")
 
-def send_notification(task_name, result, status="success", error=None, request_input=None, progress_info=None):
+@metrics.instrument_notification
+def send_notification(task_name, result, status="success", error=None, request_input=None, progress_info=None,
+                      pipeline_id=None):
     """Отправляет уведомление веб-приложению о результате задачи"""
     try:
         data = {
             "task_name": task_name,
+            "pipeline_id": pipeline_id,
             "result": result,
             "status": status,
             "timestamp": datetime.now().isoformat(),
@@ -26,12 +60,24 @@ def send_notification(task_name, result, status="success", error=None, request_i
             "request_input": request_input,
             "progress_info": progress_info
         }
-        requests.post(f"{WEB_APP_URL}/task_result", json=data, timeout=5)
+        # Не блокируемся на веб-приложении: событие уйдет пачкой из фонового потока
+        # (HTTP или шина Redis, см. NOTIFY_TRANSPORT)
+        get_transport().send(data)
     except Exception as e:
         print(f"Ошибка отправки уведомления: {e}")
 
-def update_pipeline_progress(current_step, total_steps, step_progress=0, pipeline_id=None):
-    """Обновляет общий прогресс пайплайна"""
+@worker_process_shutdown.connect
+def flush_notifications(**kwargs):
+    """Дописывает накопленные уведомления при остановке процесса воркера"""
+    shutdown_transport()
+
+def update_pipeline_progress(current_step, total_steps, step_progress=0, pipeline_id=None, task_name=None, text=None):
+    """Обновляет общий прогресс пайплайна.
+    
+    Текст шага (text) отправляется в том же событии. Частоту и состав полей
+    определяет progress_reporter: промежуточные тики могут быть отброшены,
+    но текст отброшенного тика уходит отдельным событием.
+    """
     overall_progress = ((current_step - 1) + (step_progress / 100)) / total_steps * 100
     
     progress_info = {
@@ -42,54 +88,70 @@ def update_pipeline_progress(current_step, total_steps, step_progress=0, pipelin
         "overall_progress": min(100, max(0, overall_progress))
     }
     
-    send_notification("Прогресс пайплайна", 
-                     f"Шаг {current_step}/{total_steps} - {step_progress}%", 
-                     "progress", 
-                     progress_info=progress_info)
-
-def wait_for_user_input(task_id, prompt, input_type="text", options=None, timeout=300):
-    """Ждет пользовательского ввода через Redis с таймаутом"""
-    import redis
+    payload = progress_reporter.prepare(progress_info)
+    if payload is None:
+        if text is not None:
+            send_notification(task_name, text, "progress", pipeline_id=pipeline_id)
+        return
     
-    redis_client = redis.Redis.from_url(backend_url)
-    input_key = f"user_input:{task_id}"
-    start_time = time.time()
+    if text is None:
+        task_name = PROGRESS_TICK_TASK
+        text = f"Шаг {current_step}/{total_steps} - {step_progress}%"
     
-    # Отправляем запрос на ввод
+    send_notification(task_name, text, "progress", progress_info=payload, pipeline_id=pipeline_id)
+
+def get_redis_client():
+    """Возвращает общий для процесса клиент Redis (пул соединений redis_pool)"""
+    return redis_pool.get_client(backend_url)
+
+def request_user_input(task_id, prompt, input_type="text", options=None, timeout=INPUT_TIMEOUT, pipeline_id=None):
+    """Отправляет клиенту запрос на ввод"""
     input_request = {
         "prompt": prompt,
         "input_type": input_type,
         "options": options or [],
         "task_id": task_id,
+        "pipeline_id": pipeline_id,
         "timeout": timeout
     }
     
-    send_notification("Требуется ввод", prompt, "input_required", request_input=input_request)
+    send_notification("Требуется ввод", prompt, "input_required", request_input=input_request, pipeline_id=pipeline_id)
+
+def resolve_input(received, input_value, input_type="text", options=None, pipeline_id=None):
+    """Подставляет значение по умолчанию при таймауте или отключении пользователя"""
+    if not received or input_value == TIMED_OUT:
+        send_notification("Таймаут ввода", 
+                        f"Время ожидания истекло. Используются значения по умолчанию.",
+                        "timeout", pipeline_id=pipeline_id)
+        return get_default_value(input_type, options)
     
-    # Ждем ввода пользователя
-    while True:
-        user_input = redis_client.get(input_key)
-        if user_input:
-            redis_client.delete(input_key)
-            input_value = json.loads(user_input.decode())
-            
-            if input_value == "DISCONNECTED":
-                send_notification("Пользователь отключился", 
-                                "Используются значения по умолчанию", "warning")
-                return get_default_value(input_type, options)
-            
-            return input_value
-        
-        # Проверяем таймаут
-        elapsed_time = time.time() - start_time
-        if elapsed_time > timeout:
-            redis_client.delete(input_key)
-            send_notification("Таймаут ввода", 
-                            f"Время ожидания истекло. Используются значения по умолчанию.",
-                            "timeout")
-            return get_default_value(input_type, options)
-        
-        time.sleep(1)
+    if input_value == DISCONNECTED:
+        send_notification("Пользователь отключился", 
+                        "Используются значения по умолчанию", "warning", pipeline_id=pipeline_id)
+        return get_default_value(input_type, options)
+    
+    return input_value
+
+@metrics.instrument_input_wait
+def wait_for_user_input(task_id, prompt, input_type="text", options=None, timeout=INPUT_TIMEOUT, pipeline_id=None):
+    """Ждет пользовательского ввода через Redis (блокирующий BLPOP) с таймаутом"""
+    redis_client = get_redis_client()
+    # Свой канал у каждого запроса: опоздавшее значение прошлого запроса сюда не попадет
+    prompt_id = new_prompt_id(task_id)
+    
+    # Дедлайн запроса — в реестре: по таймауту sweeper пришлет TIMED_OUT в канал ввода
+    prompt_registry.register(redis_client, prompt_id, timeout)
+    
+    # Отправляем запрос на ввод
+    request_user_input(prompt_id, prompt, input_type, options, timeout, pipeline_id)
+    
+    # Ждем ввода пользователя без опроса: воркер просыпается сразу после RPUSH
+    received, input_value = pop_input(redis_client, prompt_id, prompt_registry.wait_timeout(timeout))
+    if not received:
+        # Sweeper не успел или не запущен: снимаем запрос сами
+        prompt_registry.resolve(redis_client, prompt_id, "expired")
+    
+    return resolve_input(received, input_value, input_type, options, pipeline_id)
 
 def get_default_value(input_type, options):
     """Возвращает значение по умолчанию для типа ввода"""
@@ -100,282 +162,741 @@ def get_default_value(input_type, options):
     else:
         return "Значение по умолчанию"
 
-@app.task(bind=True)
-def step1_data_preparation(self, data_size=100, pipeline_id=None):
+# Шаги пайплайна описаны генераторами: каждый запрос ввода — это `yield ask(...)`,
+# а ответ возвращается в шаг через send(). Так один и тот же шаг выполняется и в
+# блокирующей цепочке задач, и в возобновляемом режиме, где шаг останавливается
+# на запросе и проигрывается заново с уже полученными ответами.
+
+def ask(prompt, input_type="text", options=None, timeout=INPUT_TIMEOUT):
+    """Описание запроса ввода, который шаг передает через yield"""
+    return {"prompt": prompt, "input_type": input_type, "options": options or [], "timeout": timeout}
+
+def fan_out(kind, total, partitions, params, progress, text):
+    """Описание параллельной обработки, которое шаг передает через yield.
+    
+    Шаг получает обратно объединенный результат партиций. progress — диапазон
+    прогресса шага (от, до), text — шаблон текста с полем {progress}.
+    """
+    return {"fan_out": kind, "total": total, "partitions": partitions, "params": params,
+            "progress": list(progress), "text": text}
+
+def is_fan_out(request):
+    return "fan_out" in request
+
+def inputs_ready():
+    """Отметка, которую шаг передает через yield после последнего запроса ввода.
+    
+    Здесь ответы пользователя уже известны полностью, а тяжелая работа шага еще
+    не начата: в этой точке ищется готовый результат в кэше шагов.
+    """
+    return {"inputs_ready": True}
+
+def is_inputs_ready(request):
+    return "inputs_ready" in request
+
+def use_fan_out(total, partitions):
+    """Выполнять работу шага задачами run_partition, а не в самом шаге"""
+    return partitions > 1 or (OFFLOAD_COMPUTE and total > 0)
+
+def partition_count(total):
+    """Число партиций для total записей (1 — обрабатывать в самом шаге)"""
+    import engine
+    chunks = -(-total // engine.ENGINE_CHUNK_ROWS)
+    return max(1, min(PIPELINE_PARTITIONS, total // max(1, PARTITION_MIN_SIZE), chunks))
+
+def partition_bounds(total, partitions, align=None):
+    """Границы [start, end) партиций примерно равного размера по целым блокам движка"""
+    import engine
+    align = align or engine.ENGINE_CHUNK_ROWS
+    chunks = -(-total // align)
+    size, extra = divmod(chunks, partitions)
+    bounds, start = [], 0
+    for i in range(partitions):
+        end = min(total, start + (size + (1 if i < extra else 0)) * align)
+        if end > start:
+            bounds.append((start, end))
+        start = end
+    return bounds
+
+class StepContext:
+    """Побочные эффекты шага: уведомления, прогресс и имитация работы.
+
+    Пока шаг проигрывается по сохраненным ответам (replaying), эффекты подавляются:
+    клиент их уже видел до остановки шага. Текст прогресса придерживается до
+    ближайшего progress() и уходит вместе с ним одним событием (PROGRESS_MERGE),
+    а если этот тик отброшен ограничением частоты — отдельным событием.
+    """
+    
+    def __init__(self, task_name, current_step, pipeline_id, task_id=None, total_steps=TOTAL_STEPS):
+        self.task_name = task_name
+        self.current_step = current_step
+        self.total_steps = total_steps
+        self.pipeline_id = pipeline_id
+        self.task_id = task_id
+        self.replaying = False
+        self.summary = None
+        self._pending_text = None
+    
+    def notify(self, result, status="progress"):
+        if status == "success":
+            self.summary = result
+        if self.replaying:
+            return
+        self.flush()
+        if status == "progress" and PROGRESS_MERGE:
+            self._pending_text = result
+            return
+        send_notification(self.task_name, result, status, pipeline_id=self.pipeline_id)
+    
+    def progress(self, step_progress):
+        if self.replaying:
+            return
+        text, self._pending_text = self._pending_text, None
+        update_pipeline_progress(self.current_step, self.total_steps, step_progress, self.pipeline_id,
+                                 task_name=self.task_name, text=text)
+    
+    def sleep(self, seconds):
+        if not self.replaying:
+            self.flush()
+            time.sleep(seconds * PIPELINE_TIME_SCALE)
+    
+    def flush(self):
+        """Отправляет придержанный текст отдельным событием"""
+        if self._pending_text is not None:
+            text, self._pending_text = self._pending_text, None
+            send_notification(self.task_name, text, "progress", pipeline_id=self.pipeline_id)
+
+def prepare_data(ctx, prev_result):
     """Шаг 1: Подготовка данных с прогресс баром"""
-    task_name = "Подготовка данных"
-    task_id = self.request.id
-    current_step = 1
-    total_steps = 4
+    import engine
+    data_size = prev_result.get("data_size", 100)
+    pipeline_id = prev_result.get("pipeline_id")
     
-    try:
-        update_pipeline_progress(current_step, total_steps, 0, pipeline_id)
-        
-        send_notification(task_name, "Начинаем подготовку данных...", "progress")
-        time.sleep(2)
-        update_pipeline_progress(current_step, total_steps, 20, pipeline_id)
-        
-        # Запрашиваем у пользователя тип обработки
-        processing_type = wait_for_user_input(
-            task_id, 
-            "Выберите тип обработки данных:",
-            "select",
-            ["Быстрая обработка", "Детальная обработка", "Экспериментальная обработка"]
-        )
-        
-        send_notification(task_name, f"Выбран тип обработки: {processing_type}", "progress")
-        update_pipeline_progress(current_step, total_steps, 40, pipeline_id)
-        
-        # Обрабатываем данные согласно выбору
-        processing_time = {"Быстрая обработка": 3, "Детальная обработка": 5, "Экспериментальная обработка": 7}
-        duration = processing_time.get(processing_type, 3)
-        
-        for i in range(duration):
-            time.sleep(1)
-            step_progress = 40 + ((i + 1) / duration) * 60
-            progress = ((i + 1) / duration) * 100
-            send_notification(task_name, f"Обработка: {progress:.0f}%", "progress")
-            update_pipeline_progress(current_step, total_steps, step_progress, pipeline_id)
-        
-        result = f"Подготовлено {data_size} записей с типом '{processing_type}'"
-        send_notification(task_name, result, "success")
-        update_pipeline_progress(current_step, total_steps, 100, pipeline_id)
-        
-        return {
-            "data_size": data_size, 
-            "processing_type": processing_type,
-            "status": "prepared",
-            "pipeline_id": pipeline_id
-        }
+    ctx.progress(0)
+    ctx.notify("Начинаем подготовку данных...")
+    ctx.progress(20)
+    
+    # Запрашиваем у пользователя тип обработки
+    processing_type = yield ask(
+        "Выберите тип обработки данных:",
+        "select",
+        ["Быстрая обработка", "Детальная обработка", "Экспериментальная обработка"]
+    )
+    yield inputs_ready()
+    
+    ctx.notify(f"Выбран тип обработки: {processing_type}")
+    ctx.progress(40)
+    
+    # Генерируем набор данных блоками и проверяем строки согласно выбору
+    # (запись идет в один файл по порядку, поэтому партиция всегда одна)
+    params = {"dataset": engine.dataset_spec(data_size), "level": engine.cleaning_level(processing_type),
+              "pipeline_id": pipeline_id}
+    if use_fan_out(data_size, 1):
+        summary = yield fan_out("prepare", data_size, 1, params, (40, 100), "Обработка: {progress:.0f}%")
+    else:
+        def report(done):
+            ctx.notify(f"Обработка: {done * 100:.0f}%")
+            ctx.progress(40 + done * 60)
         
-    except Exception as e:
-        send_notification(task_name, str(e), "error", str(e))
-        raise
+        summary = prepare_partition(0, data_size, params, report)
+    # Дальше по цепочке передается ссылка на сохраненный набор, а не сами строки
+    dataset = engine.dataset_spec(summary["valid"], artifact=summary["artifact"])
+    
+    result = f"Подготовлено {data_size} записей с типом '{processing_type}' ({summary['valid']} корректных)"
+    ctx.notify(result, "success")
+    ctx.progress(100)
+    
+    return {
+        "data_size": data_size, 
+        "processing_type": processing_type,
+        "status": "prepared",
+        "valid": summary["valid"],
+        "dataset": dataset,
+        "pipeline_id": pipeline_id
+    }
 
-@app.task(bind=True)
-def step2_data_processing(self, prev_result):
+def process_data(ctx, prev_result):
     """Шаг 2: Обработка данных с прогресс баром"""
-    task_name = "Обработка данных"
-    task_id = self.request.id
-    current_step = 2
-    total_steps = 4
+    import engine
+    data_size = prev_result.get("data_size", 0)
+    processing_type = prev_result.get("processing_type", "Быстрая обработка")
     pipeline_id = prev_result.get("pipeline_id")
     
+    dataset = prev_result.get("dataset") or engine.dataset_spec(data_size)
+    level = engine.cleaning_level(processing_type)
+    
+    ctx.progress(0)
+    ctx.notify(f"Начинаем обработку {data_size} записей")
+    
+    # Запрашиваем коэффициент обработки
+    quality_factor = yield ask(
+        "Введите коэффициент качества обработки (0.1-1.0):",
+        "number"
+    )
+    yield inputs_ready()
+    
     try:
-        data_size = prev_result.get("data_size", 0)
-        processing_type = prev_result.get("processing_type", "Быстрая обработка")
-        
-        update_pipeline_progress(current_step, total_steps, 0, pipeline_id)
-        send_notification(task_name, f"Начинаем обработку {data_size} записей", "progress")
-        time.sleep(1)
-        
-        # Запрашиваем коэффициент обработки
-        quality_factor = wait_for_user_input(
-            task_id,
-            "Введите коэффициент качества обработки (0.1-1.0):",
-            "number"
-        )
-        
-        try:
-            quality = float(quality_factor)
-            if quality < 0.1 or quality > 1.0:
-                quality = 0.8
-        except:
+        quality = float(quality_factor)
+        if quality < 0.1 or quality > 1.0:
             quality = 0.8
-            
-        send_notification(task_name, f"Установлен коэффициент качества: {quality}", "progress")
-        update_pipeline_progress(current_step, total_steps, 25, pipeline_id)
+    except:
+        quality = 0.8
         
-        # Обработка с учетом коэффициента
-        steps = int(4 * quality) + 1
-        for i in range(steps):
-            time.sleep(1.5)
-            step_progress = 25 + ((i + 1) / steps) * 75
-            progress = ((i + 1) / steps) * 100
-            send_notification(task_name, f"Обработано {progress:.0f}% данных", "progress")
-            update_pipeline_progress(current_step, total_steps, step_progress, pipeline_id)
-        
-        processed = int(data_size * quality * random.uniform(0.9, 1.0))
-        result = f"Обработано {processed} из {data_size} записей (качество: {quality})"
-        send_notification(task_name, result, "success")
-        update_pipeline_progress(current_step, total_steps, 100, pipeline_id)
-        
-        return {
-            "processed": processed, 
-            "original": data_size,
-            "quality_factor": quality,
-            "processing_type": processing_type,
-            "pipeline_id": pipeline_id
-        }
+    ctx.notify(f"Установлен коэффициент качества: {quality}")
+    ctx.progress(25)
+    
+    # Фильтр качества: остаются строки с оценкой не ниже 1 - коэффициент
+    params = {"dataset": dataset, "level": level, "quality": quality}
+    partitions = partition_count(dataset["rows"])
+    if use_fan_out(dataset["rows"], partitions):
+        stats = yield fan_out("process", dataset["rows"], partitions, params,
+                              (25, 100), "Обработано {progress:.0f}% данных")
+    else:
+        def report(done):
+            ctx.notify(f"Обработано {done * 100:.0f}% данных")
+            ctx.progress(25 + done * 75)
         
-    except Exception as e:
-        send_notification(task_name, str(e), "error", str(e))
-        raise
+        stats = process_partition(0, dataset["rows"], params, report)
+    
+    processed = stats["count"]
+    result = f"Обработано {processed} из {data_size} записей (качество: {quality})"
+    ctx.notify(result, "success")
+    ctx.progress(100)
+    
+    return {
+        "processed": processed, 
+        "original": data_size,
+        "quality_factor": quality,
+        "processing_type": processing_type,
+        "dataset": dataset,
+        "stats": stats,
+        "pipeline_id": pipeline_id
+    }
 
-@app.task(bind=True)
-def step3_data_analysis(self, prev_result):
+def analyze_data(ctx, prev_result):
     """Шаг 3: Анализ данных с прогресс баром"""
-    task_name = "Анализ данных"
-    task_id = self.request.id
-    current_step = 3
-    total_steps = 4
+    import engine
+    processed = prev_result.get("processed", 0)
     pipeline_id = prev_result.get("pipeline_id")
+    dataset = prev_result.get("dataset") or engine.dataset_spec(prev_result.get("original", processed))
+    stats = prev_result.get("stats") or engine.empty_stats()
     
-    try:
-        processed = prev_result.get("processed", 0)
-        quality_factor = prev_result.get("quality_factor", 0.8)
-        
-        update_pipeline_progress(current_step, total_steps, 0, pipeline_id)
-        send_notification(task_name, f"Начинаем анализ {processed} записей", "progress")
-        time.sleep(1)
-        
-        # Запрашиваем метод анализа
-        analysis_method = wait_for_user_input(
-            task_id,
-            "Выберите метод анализа данных:",
-            "select",
-            ["Статистический анализ", "Машинное обучение", "Глубокий анализ", "Комбинированный подход"]
+    ctx.progress(0)
+    ctx.notify(f"Начинаем анализ {processed} записей")
+    
+    # Запрашиваем метод анализа
+    analysis_method = yield ask(
+        "Выберите метод анализа данных:",
+        "select",
+        ["Статистический анализ", "Машинное обучение", "Глубокий анализ", "Комбинированный подход"]
+    )
+    
+    ctx.notify(f"Выбран метод: {analysis_method}")
+    ctx.progress(20)
+    
+    # Если выбран продвинутый метод, запрашиваем дополнительные параметры
+    if analysis_method in ["Машинное обучение", "Глубокий анализ"]:
+        complexity = yield ask(
+            "Введите уровень сложности анализа (1-10):",
+            "number"
         )
         
-        send_notification(task_name, f"Выбран метод: {analysis_method}", "progress")
-        update_pipeline_progress(current_step, total_steps, 20, pipeline_id)
-        
-        # Если выбран продвинутый метод, запрашиваем дополнительные параметры
-        if analysis_method in ["Машинное обучение", "Глубокий анализ"]:
-            complexity = wait_for_user_input(
-                task_id,
-                "Введите уровень сложности анализа (1-10):",
-                "number"
-            )
-            
-            try:
-                complexity_level = int(complexity)
-                if complexity_level < 1 or complexity_level > 10:
-                    complexity_level = 5
-            except:
+        try:
+            complexity_level = int(complexity)
+            if complexity_level < 1 or complexity_level > 10:
                 complexity_level = 5
-                
-            send_notification(task_name, f"Уровень сложности: {complexity_level}", "progress")
-        else:
-            complexity_level = 3
-        
-        update_pipeline_progress(current_step, total_steps, 40, pipeline_id)
-        
-        # Анализ с учетом метода и сложности
-        analysis_time = complexity_level // 2 + 2
-        for i in range(analysis_time):
-            time.sleep(1.5)
-            step_progress = 40 + ((i + 1) / analysis_time) * 60
-            stage = f"Этап {i+1}/{analysis_time} анализа методом '{analysis_method}'"
-            send_notification(task_name, stage, "progress")
-            update_pipeline_progress(current_step, total_steps, step_progress, pipeline_id)
-        
-        # Результаты зависят от метода и сложности
-        base_insights = int(processed * 0.1)
-        insights = base_insights + complexity_level
-        anomalies = random.randint(0, max(1, complexity_level // 2))
-        
-        result = f"Метод '{analysis_method}': найдено {insights} инсайтов и {anomalies} аномалий"
-        send_notification(task_name, result, "success")
-        update_pipeline_progress(current_step, total_steps, 100, pipeline_id)
+        except:
+            complexity_level = 5
+            
+        ctx.notify(f"Уровень сложности: {complexity_level}")
+    else:
+        complexity_level = 3
+    yield inputs_ready()
+    
+    ctx.progress(40)
+    
+    # Анализ с учетом метода и сложности: повторный проход по отфильтрованным строкам
+    params = {
+        "dataset": dataset,
+        "level": engine.cleaning_level(prev_result.get("processing_type")),
+        "quality": prev_result.get("quality_factor", 1.0),
+        "stats": stats,
+        "method": analysis_method,
+        "complexity": complexity_level,
+    }
+    partitions = partition_count(dataset["rows"])
+    if use_fan_out(dataset["rows"], partitions):
+        found = yield fan_out("analyze", dataset["rows"], partitions, params,
+                              (40, 100), f"Анализ методом '{analysis_method}': {{progress:.0f}}%")
+    else:
+        def report(done):
+            ctx.notify(f"Анализ методом '{analysis_method}': {done * 100:.0f}%")
+            ctx.progress(40 + done * 60)
         
-        return {
+        found = analyze_partition(0, dataset["rows"], params, report)
+    
+    # Результаты зависят от метода и сложности
+    insights = engine.find_insights(stats)
+    anomalies = found["anomalies"]
+    
+    result = f"Метод '{analysis_method}': найдено {insights} инсайтов и {anomalies} аномалий"
+    ctx.notify(result, "success")
+    ctx.progress(100)
+    
+    return {
+        "insights": insights,
+        "anomalies": anomalies,
+        "processed": processed,
+        "analysis_method": analysis_method,
+        "complexity_level": complexity_level,
+        "statistics": engine.summarize(stats),
+        # Для отчета: набор данных, параметры очистки и накопители статистики
+        "dataset": dataset,
+        "processing_type": prev_result.get("processing_type"),
+        "quality_factor": prev_result.get("quality_factor", 1.0),
+        "stats": stats,
+        "pipeline_id": pipeline_id
+    }
+
+def generate_report(ctx, prev_result):
+    """Шаг 4: Генерация отчета с прогресс баром"""
+    import engine
+    insights = prev_result.get("insights", 0)
+    anomalies = prev_result.get("anomalies", 0)
+    processed = prev_result.get("processed", 0)
+    analysis_method = prev_result.get("analysis_method", "Не указан")
+    
+    ctx.progress(0)
+    ctx.notify("Подготовка к генерации отчета")
+    ctx.sleep(1)
+    
+    # Запрашиваем формат отчета
+    report_format = yield ask(
+        "Выберите формат отчета:",
+        "select",
+        ["Краткий отчет", "Детальный отчет", "Презентация", "Технический отчет"]
+    )
+    
+    ctx.notify(f"Создаем отчет в формате: {report_format}")
+    ctx.progress(30)
+    
+    # Запрашиваем включение графиков
+    include_charts = yield ask(
+        "Включить графики и диаграммы в отчет?",
+        "select",
+        ["Да, включить", "Нет, только текст"]
+    )
+    
+    ctx.progress(50)
+    
+    # Генерация отчета: данные и документ пишутся на диск потоково
+    report_id = reports.new_report_id()
+    dataset = prev_result.get("dataset") or engine.dataset_spec(processed)
+    params = {
+        "meta": {
+            "report_id": report_id,
+            "format": report_format,
+            "includes_charts": include_charts == "Да, включить",
+            "analysis_method": analysis_method,
+            "complexity_level": prev_result.get("complexity_level", 3),
             "insights": insights,
             "anomalies": anomalies,
-            "processed": processed,
-            "analysis_method": analysis_method,
-            "complexity_level": complexity_level,
-            "pipeline_id": pipeline_id
-        }
-        
+            "pipeline_id": prev_result.get("pipeline_id"),
+        },
+        "dataset": dataset,
+        "level": engine.cleaning_level(prev_result.get("processing_type")),
+        "quality": prev_result.get("quality_factor", 1.0),
+        "stats": prev_result.get("stats") or engine.empty_stats(),
+    }
+    if use_fan_out(dataset["rows"], 1):
+        manifest = yield fan_out("report", dataset["rows"], 1, params, (50, 100),
+                                 "Формирование отчета: {progress:.0f}%")
+    else:
+        stages = {"data": "Выгрузка данных", "document": "Формирование документа"}
+        current = {"stage": None}
+        
+        def report(done, stage):
+            if stage in stages and stage != current["stage"]:
+                current["stage"] = stage
+                ctx.notify(f"{stages[stage]}...")
+            ctx.progress(50 + done * 50)
+        
+        manifest = reports.build_report(params["meta"], dataset, params["level"], params["quality"],
+                                        params["stats"], report)
+    # При проигрывании шага после партиции номер отчета генерируется заново: берем записанный
+    report_id = manifest["report_id"]
+    
+    # Финальный результат
+    report_details = {
+        "report_id": report_id,
+        "format": report_format,
+        "includes_charts": include_charts == "Да, включить",
+        "total_records": processed,
+        "insights_found": insights,
+        "anomalies_detected": anomalies,
+        "analysis_method": analysis_method,
+        "completion_time": manifest["created_at"],
+        "url": f"/reports/{report_id}/{reports.DOCUMENT}",
+        "files": {name: info["size"] for name, info in manifest["files"].items()}
+    }
+    
+    result_text = f"Отчет {report_id} создан в формате '{report_format}'"
+    if include_charts == "Да, включить":
+        result_text += " с графиками"
+    result_text += f": {report_details['url']}"
+    
+    ctx.notify(result_text, "success")
+    ctx.progress(100)
+    
+    return report_details
+
+STEPS = [
+    ("Подготовка данных", prepare_data),
+    ("Обработка данных", process_data),
+    ("Анализ данных", analyze_data),
+    ("Генерация отчета", generate_report),
+]
+
+# Работа над диапазоном строк [start, end): весь набор в самом шаге или одна партиция
+
+def prepare_partition(start, end, params, report):
+    """Генерация и очистка набора с записью артефакта; возвращает сводку и ссылку на него"""
+    import engine
+    writer = artifacts.ColumnWriter(params["pipeline_id"], "prepared", engine.COLUMNS, end - start)
+    summary = engine.prepare(params["dataset"], params["level"], start, end, report, output=writer)
+    return dict(summary, artifact=writer.close())
+
+def process_partition(start, end, params, report):
+    import engine
+    return engine.process(params["dataset"], params["level"], params["quality"], start, end, report)
+
+def analyze_partition(start, end, params, report):
+    import engine
+    return engine.analyze(params["dataset"], params["level"], params["quality"], params["stats"],
+                          params["method"], params["complexity"], start, end, report)
+
+def report_partition(start, end, params, report):
+    return reports.build_report(params["meta"], params["dataset"], params["level"], params["quality"],
+                                params["stats"], lambda done, stage: report(done))
+
+PARTITION_WORK = {
+    "prepare": prepare_partition,
+    "process": process_partition,
+    "analyze": analyze_partition,
+    "report": report_partition,
+}
+
+def merge_partition_results(results):
+    """Объединяет накопители партиций"""
+    import engine
+    return functools.reduce(engine.merge_results, results)
+
+# Запись прогресса партиции и чтение прогресса всех партиций за один атомарный вызов
+PARTITION_PROGRESS = redis_pool.LuaScript("""
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return redis.call('HVALS', KEYS[1])
+""")
+
+def report_partition_progress(pipeline_id, step_index, index, fraction, request):
+    """Сводит прогресс всех партиций шага в общий progress_info"""
+    key = PARTITION_PROGRESS_KEY.format(pipeline_id, step_index)
+    values = PARTITION_PROGRESS(get_redis_client(), [key], [index, fraction, 3600])
+    done = sum(float(value) for value in values) / request["partitions"]
+    
+    low, high = request["progress"]
+    update_pipeline_progress(step_index + 1, TOTAL_STEPS, low + (high - low) * done, pipeline_id,
+                             task_name=STEPS[step_index][0], text=request["text"].format(progress=done * 100))
+
+def partition_group(pipeline_id, step_index, request):
+    bounds = partition_bounds(request["total"], request["partitions"])
+    return group(run_partition.s(pipeline_id, step_index, request, index, start, end)
+                 for index, (start, end) in enumerate(bounds))
+
+def finish_fan_out(pipeline_id, step_index, results):
+    get_redis_client().delete(PARTITION_PROGRESS_KEY.format(pipeline_id, step_index))
+    return merge_partition_results(results)
+
+# Шаги, результат которых определяется входом и ответами (отчет получает случайный номер)
+CACHEABLE_STEPS = {"Подготовка данных", "Обработка данных", "Анализ данных"}
+
+def get_step_cache(task_name):
+    """Кэш результатов для шага или None, если кэширование выключено"""
+    if STEP_CACHE and task_name in CACHEABLE_STEPS:
+        return StepCache(get_redis_client())
+    return None
+
+def finish_from_cache(ctx, entry):
+    """Завершает шаг готовым результатом: итог и 100% одним обновлением"""
+    ctx.replaying = False
+    ctx._pending_text = None
+    ctx.notify(f"{entry['text']} (из кэша)" if entry["text"] else "Результат взят из кэша", "success")
+    ctx.progress(100)
+    
+    result = entry["result"]
+    if isinstance(result, dict) and "pipeline_id" in result:
+        result["pipeline_id"] = ctx.pipeline_id
+    return result
+
+def execute_step(ctx, program, prev_result, answers=(), answer_prompt=None, cache=None):
+    """Выполняет шаг до конца или до первого запроса ввода без ответа.
+    
+    Ответы из answers проигрываются без побочных эффектов. Для новых запросов
+    вызывается answer_prompt(prompt); если его нет, шаг останавливается.
+    Возвращает ("done", результат), ("prompt", запрос) или ("fan_out", описание
+    параллельной обработки), результат которой шаг ждет следующим ответом.
+    
+    С cache готовый результат для входа шага и всех ответов ищется один раз,
+    когда шаг отмечает, что ответы собраны (inputs_ready); результат
+    завершенного шага сохраняется.
+    """
+    generator = program(ctx, prev_result)
+    ctx.replaying = bool(answers)
+    index = 0
+    inputs = []
+    
+    try:
+        prompt = next(generator)
+        while True:
+            if is_inputs_ready(prompt):
+                # Ответы собраны, работа не начата: единственный поиск в кэше
+                if cache is not None and not ctx.replaying:
+                    entry = cache.get(cache_key(ctx.task_name, prev_result, inputs))
+                    if entry:
+                        generator.close()
+                        return "done", finish_from_cache(ctx, entry)
+                prompt = generator.send(None)
+                continue
+            if index < len(answers):
+                value = answers[index]
+                index += 1
+                ctx.replaying = index < len(answers)
+            else:
+                ctx.replaying = False
+                ctx.flush()
+                if is_fan_out(prompt):
+                    return "fan_out", prompt
+                if answer_prompt is None:
+                    return "prompt", prompt
+                value = answer_prompt(prompt)
+            
+            if not is_fan_out(prompt):
+                inputs.append(value)
+            prompt = generator.send(value)
+    except StopIteration as stop:
+        ctx.flush()
+        if cache is not None:
+            cache.put(cache_key(ctx.task_name, prev_result, inputs), stop.value, ctx.summary)
+        return "done", stop.value
+
+def run_blocking_step(task, step_index, prev_result, answers=()):
+    """Выполняет шаг в задаче цепочки, ожидая ввод внутри задачи.
+    
+    Параллельная обработка заменяет задачу хордом: колбэк проигрывает шаг
+    с полученными ответами и объединенным результатом, а цепочка продолжается
+    от результата колбэка.
+    """
+    task_name, program = STEPS[step_index]
+    pipeline_id = prev_result.get("pipeline_id")
+    ctx = StepContext(task_name, step_index + 1, pipeline_id, task.request.id)
+    answers = list(answers)
+    
+    def answer_prompt(prompt):
+        value = wait_for_user_input(ctx.task_id, prompt["prompt"], prompt["input_type"], prompt["options"],
+                                    prompt["timeout"], pipeline_id=pipeline_id)
+        answers.append(value)
+        return value
+    
+    try:
+        outcome, value = execute_step(ctx, program, prev_result, tuple(answers), answer_prompt,
+                                      get_step_cache(task_name))
     except Exception as e:
-        send_notification(task_name, str(e), "error", str(e))
+        send_notification(task_name, str(e), "error", str(e), pipeline_id=pipeline_id)
         raise
+    
+    if outcome == "fan_out":
+        return task.replace(chord(partition_group(pipeline_id, step_index, value),
+                                  finish_partitioned_step.s(step_index, prev_result, answers)))
+    return value
+
+def schedule_input_timeout(token, timeout):
+    """Планирует продолжение по таймауту, если пользователь так и не ответит.
+    
+    С реестром запросов дедлайн отслеживает sweeper, без него — отложенная задача.
+    """
+    if prompt_registry.PROMPT_REGISTRY:
+        prompt_registry.register(get_redis_client(), token, timeout)
+    else:
+        resume_pipeline.apply_async((token, TIMED_OUT), countdown=timeout)
+
+def expire_prompt(token, mode):
+    """Таймаут запроса из реестра: будит blocking-задачу или продолжает пайплайн"""
+    if mode == prompt_registry.RESUMABLE:
+        resume_pipeline.delay(token, TIMED_OUT)
+    else:
+        push_input(get_redis_client(), token, TIMED_OUT)
+
+@worker_ready.connect
+def start_prompt_sweeper(**kwargs):
+    """Sweeper таймаутов ввода в основном процессе воркера"""
+    prompt_registry.start_sweeper(get_redis_client, expire_prompt)
+
+def advance_pipeline(state):
+    """Ведет возобновляемый пайплайн до следующего запроса ввода или до конца.
+    
+    Состояние сохраняется после каждого шага и при каждой остановке на вводе,
+    после чего задача завершается и освобождает слот воркера.
+    """
+    redis_client = get_redis_client()
+    pipeline_id = state["pipeline_id"]
+    
+    while state["step"] < len(STEPS):
+        task_name, program = STEPS[state["step"]]
+        ctx = StepContext(task_name, state["step"] + 1, pipeline_id)
+        
+        try:
+            outcome, value = execute_step(ctx, program, state["prev_result"], state["answers"],
+                                          cache=get_step_cache(task_name))
+        except Exception as e:
+            state["status"] = "failed"
+            save_state(redis_client, state)
+            send_notification(task_name, str(e), "error", str(e), pipeline_id=pipeline_id)
+            raise
+        
+        if outcome == "fan_out":
+            # Чекпоинт: партиции работают параллельно, колбэк хорда продолжит шаг
+            token = prompt_token(pipeline_id, state["step"], len(state["answers"]))
+            value["task_id"] = token
+            state["pending"] = value
+            state["status"] = "partitioned"
+            save_state(redis_client, state)
+            
+            chord(partition_group(pipeline_id, state["step"], value))(resume_partitions.s(token))
+            return state
+        
+        if outcome == "prompt":
+            # Чекпоинт: запоминаем запрос и отпускаем воркер до ответа пользователя
+            token = prompt_token(pipeline_id, state["step"], len(state["answers"]))
+            value["task_id"] = token
+            value["requested_at"] = time.time()
+            state["pending"] = value
+            state["status"] = "waiting"
+            save_state(redis_client, state)
+            
+            # Запрос ставится на учет до уведомления, чтобы ответ застал его ожидающим
+            schedule_input_timeout(token, value["timeout"])
+            request_user_input(token, value["prompt"], value["input_type"], value["options"],
+                               value["timeout"], pipeline_id)
+            return state
+        
+        state["prev_result"] = value
+        state["step"] += 1
+        state["answers"] = []
+        save_state(redis_client, state)
+    
+    state["status"] = "completed"
+    save_state(redis_client, state)
+    artifacts.delete_artifacts(pipeline_id)
+    send_notification("Пайплайн завершен", "Все задачи успешно выполнены!", "completed", pipeline_id=pipeline_id)
+    return state
+
+@app.task(bind=True)
+def step1_data_preparation(self, data_size=100, pipeline_id=None):
+    """Шаг 1: Подготовка данных с прогресс баром"""
+    return run_blocking_step(self, 0, {"data_size": data_size, "pipeline_id": pipeline_id})
+
+@app.task(bind=True)
+def step2_data_processing(self, prev_result):
+    """Шаг 2: Обработка данных с прогресс баром"""
+    return run_blocking_step(self, 1, prev_result)
+
+@app.task(bind=True)
+def step3_data_analysis(self, prev_result):
+    """Шаг 3: Анализ данных с прогресс баром"""
+    return run_blocking_step(self, 2, prev_result)
 
 @app.task(bind=True)
 def step4_generate_report(self, prev_result):
     """Шаг 4: Генерация отчета с прогресс баром"""
-    task_name = "Генерация отчета"
-    task_id = self.request.id
-    current_step = 4
-    total_steps = 4
-    pipeline_id = prev_result.get("pipeline_id")
+    return finish_blocking_pipeline(run_blocking_step(self, 3, prev_result), prev_result)
+
+def finish_blocking_pipeline(report_details, prev_result):
+    """Завершение блокирующего пайплайна после последнего шага"""
+    artifacts.delete_artifacts(prev_result.get("pipeline_id"))
+    send_notification("Пайплайн завершен", "Все задачи успешно выполнены!", "completed",
+                      pipeline_id=prev_result.get("pipeline_id"))
+    return report_details
+
+@app.task
+def run_partition(pipeline_id, step_index, request, index, start, end):
+    """Обрабатывает одну партицию данных шага"""
+    work = PARTITION_WORK[request["fan_out"]]
+    
+    def report(fraction):
+        report_partition_progress(pipeline_id, step_index, index, fraction, request)
     
     try:
-        insights = prev_result.get("insights", 0)
-        anomalies = prev_result.get("anomalies", 0)
-        processed = prev_result.get("processed", 0)
-        analysis_method = prev_result.get("analysis_method", "Не указан")
-        
-        update_pipeline_progress(current_step, total_steps, 0, pipeline_id)
-        send_notification(task_name, "Подготовка к генерации отчета", "progress")
-        time.sleep(1)
-        
-        # Запрашиваем формат отчета
-        report_format = wait_for_user_input(
-            task_id,
-            "Выберите формат отчета:",
-            "select",
-            ["Краткий отчет", "Детальный отчет", "Презентация", "Технический отчет"]
-        )
-        
-        send_notification(task_name, f"Создаем отчет в формате: {report_format}", "progress")
-        update_pipeline_progress(current_step, total_steps, 30, pipeline_id)
-        
-        # Запрашиваем включение графиков
-        include_charts = wait_for_user_input(
-            task_id,
-            "Включить графики и диаграммы в отчет?",
-            "select",
-            ["Да, включить", "Нет, только текст"]
-        )
-        
-        update_pipeline_progress(current_step, total_steps, 50, pipeline_id)
-        
-        # Генерация отчета
-        generation_steps = 4 if include_charts == "Да, включить" else 3
-        steps = ["Создание структуры", "Формирование данных", "Создание графиков", "Финализация"]
-        
-        for i in range(generation_steps):
-            time.sleep(1.2)
-            step_progress = 50 + ((i + 1) / generation_steps) * 50
-            send_notification(task_name, f"{steps[i]}...", "progress")
-            update_pipeline_progress(current_step, total_steps, step_progress, pipeline_id)
-        
-        # Финальный результат
-        report_id = f"RPT-{random.randint(1000, 9999)}"
-        report_details = {
-            "report_id": report_id,
-            "format": report_format,
-            "includes_charts": include_charts == "Да, включить",
-            "total_records": processed,
-            "insights_found": insights,
-            "anomalies_detected": anomalies,
-            "analysis_method": analysis_method,
-            "completion_time": datetime.now().isoformat()
-        }
-        
-        result_text = f"Отчет {report_id} создан в формате '{report_format}'"
-        if include_charts == "Да, включить":
-            result_text += " с графиками"
-        
-        send_notification(task_name, result_text, "success")
-        update_pipeline_progress(current_step, total_steps, 100, pipeline_id)
-        
-        # Завершение пайплайна
-        send_notification("Пайплайн завершен", "Все задачи успешно выполнены!", "completed")
-        
-        return report_details
-        
+        return work(start, end, request["params"], report)
     except Exception as e:
-        send_notification(task_name, str(e), "error", str(e))
+        send_notification(STEPS[step_index][0], str(e), "error", str(e), pipeline_id=pipeline_id)
         raise
 
+@app.task(bind=True)
+def finish_partitioned_step(self, results, step_index, prev_result, answers):
+    """Колбэк хорда в блокирующем режиме: доводит шаг до конца"""
+    merged = finish_fan_out(prev_result.get("pipeline_id"), step_index, results)
+    result = run_blocking_step(self, step_index, prev_result, answers + [merged])
+    if step_index == len(STEPS) - 1:
+        # Последний шаг заменен хордом: пайплайн завершает его колбэк
+        return finish_blocking_pipeline(result, prev_result)
+    return result
+
 @app.task
-def run_interactive_pipeline(data_size=100):
+def resume_partitions(results, token):
+    """Колбэк хорда в возобновляемом режиме: продолжает пайплайн"""
+    state, _ = claim_prompt(get_redis_client(), token)
+    if state is None:
+        return None
+    
+    state["answers"].append(finish_fan_out(state["pipeline_id"], state["step"], results))
+    return advance_pipeline(state)["status"]
+
+@app.task
+def resume_pipeline(token, user_input):
+    """Продолжает возобновляемый пайплайн после ответа пользователя или таймаута"""
+    state, prompt = claim_prompt(get_redis_client(), token)
+    if state is None:
+        # Запрос уже обработан: повторный ответ или таймаут после ответа
+        return None
+    
+    if "requested_at" in prompt:
+        metrics.observe_input_wait(prompt["input_type"], prompt["requested_at"], state["pipeline_id"])
+    value = resolve_input(user_input != TIMED_OUT, user_input, prompt["input_type"], prompt["options"],
+                          state["pipeline_id"])
+    state["answers"].append(value)
+    return advance_pipeline(state)["status"]
+
+@app.task
+def run_interactive_pipeline(data_size=100, pipeline_id=None):
     """Запускает интерактивный пайплайн обработки данных"""
     import uuid
-    pipeline_id = str(uuid.uuid4())
+    # Идентификатор обычно выдает веб-приложение, чтобы заранее подписать клиента
+    pipeline_id = pipeline_id or str(uuid.uuid4())
+    
+    # Отправляем уведомление о начале
+    send_notification("Интерактивный пайплайн", "Запуск интерактивного пайплайна", "start", pipeline_id=pipeline_id)
+    
+    # Инициализируем прогресс
+    update_pipeline_progress(0, TOTAL_STEPS, 0, pipeline_id)
+    
+    # Удаляем артефакты пайплайнов, которые так и не завершились
+    artifacts.cleanup_expired()
+    reports.cleanup_expired()
+    
+    if PIPELINE_MODE == "resumable":
+        # Пайплайн живет в Redis и не держит воркер, пока ждет пользователя
+        advance_pipeline(new_state(pipeline_id, data_size))
+        return pipeline_id
     
     # Создаем цепочку задач
     pipeline = chain(
@@ -385,12 +906,6 @@ def run_interactive_pipeline(data_size=100):
         step4_generate_report.s()
     )
     
-    # Отправляем уведомление о начале
-    send_notification("Интерактивный пайплайн", "Запуск интерактивного пайплайна", "start")
-    
-    # Инициализируем прогресс
-    update_pipeline_progress(0, 4, 0, pipeline_id)
-    
     # Запускаем цепочку
     result = pipeline.apply_async()
     return result.id
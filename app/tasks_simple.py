@@ -1,12 +1,12 @@
-from celery import Celery
-import os
+from celery import states
 import time
 from datetime import datetime
+import metrics  # noqa: F401  сигналы Celery и экспортер метрик воркера
+from batching import BATCHABLE_TASKS
+import celery_client
 
-broker_url = os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0")
-backend_url = os.environ.get("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
-
-app = Celery('tasks', broker=broker_url, backend=backend_url)
+# Очереди и формат сообщений — общие с веб-приложением (celery_client)
+app = celery_client.create_app('tasks')
 
 @app.task
 def add(x, y):
@@ -29,5 +29,24 @@ def error(msg):
     raise Exception(msg)
 
 
+@app.task(ignore_result=True)
+def run_batch(calls):
+    """Выполняет пачку дешевых вызовов одним сообщением.
+
+    calls -- список [task_id, имя задачи, args, kwargs]; результат каждого вызова
+    сохраняется под его собственным task_id.
+    """
+    for task_id, name, args, kwargs in calls:
+        if name not in BATCHABLE_TASKS:
+            app.backend.mark_as_failure(task_id, ValueError(f"Задача {name} не поддерживает пакетный режим"))
+            continue
+        try:
+            result = app.tasks[name].run(*args, **kwargs)
+        except Exception as e:
+            app.backend.mark_as_failure(task_id, e)
+        else:
+            app.backend.store_result(task_id, result, states.SUCCESS)
+
+
 if __name__ == "__main__":
     app.start()
\ No newline at end of file
@@ -0,0 +1,74 @@
+"""Бенчмарк пакетного режима для add/echo: задачи/сек и операции Redis на задачу.
+
+Сравнивает отдельную отправку add.delay() с CallBatcher + run_batch. Воркер
+запускается в этом же процессе. Операции Redis считаются по INFO
+total_commands_processed и доступны только с BENCH_REDIS_URL (иначе брокер memory://).
+
+    BENCH_REDIS_URL=redis://localhost:6379/15 python bench/bench_batching.py --tasks 5000
+"""
+import argparse
+import json
+import os
+import time
+
+from common import BENCH_REDIS_URL
+
+os.environ.setdefault("CELERY_BROKER_URL", BENCH_REDIS_URL or "memory://")
+os.environ.setdefault("CELERY_RESULT_BACKEND", BENCH_REDIS_URL or "cache+memory://")
+
+from celery.contrib.testing.worker import start_worker  # noqa: E402
+from celery.result import ResultSet  # noqa: E402
+
+from batching import CallBatcher  # noqa: E402
+from tasks_simple import add, app, run_batch  # noqa: E402
+
+
+def redis_commands():
+    if not BENCH_REDIS_URL:
+        return None
+    import redis
+    return redis.Redis.from_url(BENCH_REDIS_URL).info("stats")["total_commands_processed"]
+
+
+def run(mode, tasks, batcher):
+    before = redis_commands()
+    start = time.perf_counter()
+    if mode == "individual":
+        results = [add.delay(i, i) for i in range(tasks)]
+    else:
+        results = [batcher.submit(add.s(i, i)) for i in range(tasks)]
+    submitted = time.perf_counter() - start
+
+    values = ResultSet(results).join_native(timeout=300) if BENCH_REDIS_URL else \
+        [r.get(timeout=300, interval=0.01) for r in results]
+    elapsed = time.perf_counter() - start
+    assert values == [i + i for i in range(tasks)]
+
+    after = redis_commands()
+    return {
+        "mode": mode,
+        "tasks": tasks,
+        "tasks_per_sec": round(tasks / elapsed, 1),
+        "submit_us_per_task": round(submitted / tasks * 1e6, 1),
+        "redis_ops_per_task": round((after - before) / tasks, 2) if before is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    if not BENCH_REDIS_URL:
+        # memory:// по умолчанию опрашивает очередь раз в секунду
+        app.conf.broker_transport_options = {"polling_interval": 0.001}
+    batcher = CallBatcher(run_batch)
+    with start_worker(app, pool="threads", concurrency=args.concurrency,
+                      perform_ping_check=False, loglevel="WARNING"):
+        for mode in ("individual", "batched"):
+            print(json.dumps(run(mode, args.tasks, batcher), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Бенчмарк кэша шагов: время повторного прогона пайплайна с теми же данными и ответами.
+
+Пайплайн выполняется в процессе в режиме resumable, ответы на запросы ввода
+подаются сразу и всегда одинаковые. Каждый прогон без кэша считает шаги заново;
+с STEP_CACHE первый прогон заполняет кэш, а следующие берут шаги 1–3 из него.
+Redis — fakeredis или BENCH_REDIS_URL.
+
+    python bench/bench_cache.py --data-size 2000000 --runs 5
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import uuid
+
+os.environ.setdefault("CELERY_BROKER_URL", "memory://")
+os.environ.setdefault("CELERY_RESULT_BACKEND", "cache+memory://")
+os.environ.setdefault("PIPELINE_TIME_SCALE", "0")
+
+from common import make_redis  # noqa: E402
+
+import artifacts  # noqa: E402
+import tasks  # noqa: E402
+from step_cache import StepCache  # noqa: E402
+
+
+def answer_for(request_input):
+    if request_input["input_type"] == "select":
+        return request_input["options"][-1]
+    return "0.9"
+
+
+def run(cached, data_size, runs):
+    redis_client = make_redis()
+    redis_client.flushall()
+
+    def on_notification(task_name, result, status="success", error=None, request_input=None,
+                        progress_info=None, pipeline_id=None):
+        if status == "input_required":
+            # Ответ сразу: продолжение выполняется внутри текущего вызова
+            tasks.resume_pipeline.apply(args=(request_input["task_id"], answer_for(request_input)))
+
+    tasks.send_notification = on_notification
+    tasks.get_redis_client = lambda: redis_client
+    tasks.schedule_input_timeout = lambda token, timeout: None
+    tasks.PIPELINE_MODE = "resumable"
+    tasks.STEP_CACHE = cached
+
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        tasks.run_interactive_pipeline.apply(args=(data_size, str(uuid.uuid4())))
+        latencies.append(round((time.perf_counter() - start) * 1000, 1))
+
+    report = {"cache": cached, "data_size": data_size, "runs": runs,
+              "first_ms": latencies[0], "repeat_ms": latencies[1:]}
+    if cached:
+        report["stats"] = StepCache(redis_client).stats()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--data-size", type=int, default=2000000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    artifacts.ARTIFACT_DIR = os.environ.get("ARTIFACT_DIR") or tempfile.mkdtemp(prefix="artifacts-")
+    for cached in (False, True):
+        print(json.dumps(run(cached, args.data_size, args.runs), ensure_ascii=False), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Бенчмарк движка обработки: строки в секунду и пиковый RSS по шагам.
+
+Каждый шаг (prepare, process, analyze) запускается в отдельном процессе, чтобы
+пиковый RSS не смешивался между замерами. Блочная обработка (ENGINE_CHUNK_ROWS)
+сравнивается с обработкой всего набора одним блоком.
+
+    python bench/bench_engine.py --rows 10000 100000 1000000 10000000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from common import add_paths
+
+add_paths()
+
+STEPS = ("prepare", "process", "analyze")
+METHOD = "Комбинированный подход"
+
+
+def read_status(field):
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def reset_peak_rss():
+    # Linux: запись 5 в clear_refs сбрасывает VmHWM до текущего RSS
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+def child(step, rows, chunk_rows):
+    import engine
+
+    spec = engine.dataset_spec(rows, chunk_rows=chunk_rows or rows)
+    level, quality = "strict", 0.8
+    stats = engine.process(spec, level, quality) if step == "analyze" else None
+
+    reset_peak_rss()
+    baseline = read_status("VmRSS")
+    start = time.perf_counter()
+    if step == "prepare":
+        engine.prepare(spec, level)
+    elif step == "process":
+        engine.process(spec, level, quality)
+    else:
+        engine.analyze(spec, level, quality, stats, METHOD, 5)
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        "step": step,
+        "rows": rows,
+        "chunk_rows": spec["chunk_rows"],
+        "rows_per_sec": round(rows / elapsed),
+        "seconds": round(elapsed, 3),
+        "peak_rss_mb": round(read_status("VmHWM"), 1),
+        "peak_over_baseline_mb": round(read_status("VmHWM") - baseline, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000, 10000000])
+    parser.add_argument("--chunk-rows", type=int, default=None,
+                        help="размер блока (по умолчанию ENGINE_CHUNK_ROWS)")
+    parser.add_argument("--unchunked", action="store_true", help="также замерить обработку одним блоком")
+    parser.add_argument("--child", nargs=3, metavar=("STEP", "ROWS", "CHUNK_ROWS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        step, rows, chunk_rows = args.child
+        child(step, int(rows), int(chunk_rows))
+        return
+
+    import engine
+    layouts = [args.chunk_rows or engine.ENGINE_CHUNK_ROWS] + ([0] if args.unchunked else [])
+    for chunk_rows in layouts:
+        for rows in args.rows:
+            for step in STEPS:
+                out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", step, str(rows),
+                                      str(chunk_rows)], capture_output=True, text=True, check=True)
+                print(out.stdout.strip(), flush=True)
+
+
+if __name__ == "__main__":
+    main()
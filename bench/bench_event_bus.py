@@ -0,0 +1,102 @@
+"""Нагрузочный тест шины событий Redis: события/сек и сквозная задержка.
+
+Воркер пишет события в поток через RedisNotificationTransport, потребитель
+группы (как реплика web/app.py) пересылает пачки в канал, а 1 и N подписчиков
+получают их оттуда. С BENCH_REDIS_URL подписчики запускаются отдельными
+процессами, с fakeredis — потоками.
+
+    BENCH_REDIS_URL=redis://localhost:6379/15 python bench/bench_event_bus.py --events 5000 --replicas 1 4
+"""
+import argparse
+import json
+import multiprocessing
+import threading
+import time
+
+from common import BENCH_REDIS_URL, make_redis, summarize
+
+from notifications import RedisNotificationTransport, decode_batch, relay_stream
+
+CHANNEL = "bench_task_events"
+STREAM = "bench_task_events:stream"
+
+
+def subscriber(expected, results, ready):
+    """Подписчик-реплика: собирает задержки до получения всех событий"""
+    client = make_redis()
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(CHANNEL)
+    pubsub.get_message(timeout=1)  # подтверждение подписки
+    ready.put(True)
+    latencies = []
+    first = None
+    deadline = time.time() + 60
+    while len(latencies) < expected and time.time() < deadline:
+        message = pubsub.get_message(timeout=1)
+        if message is None or message["type"] != "message":
+            continue
+        now = time.time()
+        for event in decode_batch(message["data"]):
+            first = first or now
+            latencies.append(now - event["sent_at"])
+    results.put({"received": len(latencies), "latencies": latencies,
+                 "window": (time.time() - first) if first else 0})
+
+
+def run(replicas, events):
+    use_processes = bool(BENCH_REDIS_URL)
+    queue_cls = multiprocessing.Queue if use_processes else __import__("queue").Queue
+    worker_cls = multiprocessing.Process if use_processes else threading.Thread
+    results, ready = queue_cls(), queue_cls()
+
+    workers = [worker_cls(target=subscriber, args=(events, results, ready), daemon=True)
+               for _ in range(replicas)]
+    for w in workers:
+        w.start()
+    for _ in workers:
+        ready.get(timeout=10)
+
+    stop = threading.Event()
+    relay_client = make_redis()
+    relay_client.delete(STREAM)
+    relay = threading.Thread(target=relay_stream, daemon=True,
+                             args=(relay_client, lambda events: events, "bench"),
+                             kwargs={"stream": STREAM, "channel": CHANNEL, "block": 100, "stop": stop})
+    relay.start()
+
+    transport = RedisNotificationTransport(redis_client=make_redis(), stream=STREAM)
+    start = time.time()
+    for i in range(events):
+        transport.send({"task_name": "bench", "result": i, "status": "success", "sent_at": time.time()})
+    transport.flush(timeout=60)
+    publish_elapsed = time.time() - start
+
+    reports = [results.get(timeout=60) for _ in workers]
+    transport.close()
+    stop.set()
+    relay.join(timeout=5)
+    latencies = [lat for r in reports for lat in r["latencies"]]
+    report = summarize(latencies)
+    report.update({
+        "replicas": replicas,
+        "events": events,
+        "publish_events_per_sec": round(events / publish_elapsed, 1),
+        "received_per_replica": [r["received"] for r in reports],
+        "fanout_events_per_sec": round(sum(r["received"] for r in reports) / max(publish_elapsed, 1e-9), 1),
+        "transport": transport.stats(),
+    })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--replicas", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    for replicas in args.replicas:
+        print(json.dumps(run(replicas, args.events), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Бенчмарк передачи данных между шагами: результат целиком в бэкенде или ссылка на артефакт.
+
+Один переход цепочки: шаг сохраняет результат в бэкенд результатов Celery
+(сериализация JSON + SET), следующий шаг читает его (GET + десериализация) и
+проходит по колонкам. inline — колонки списками внутри результата; reference —
+колонки записаны в artifacts.py, в результате только ссылка, чтение через memory map.
+Бэкенд — BENCH_REDIS_URL или fakeredis; объем в Redis — размер значения ключа.
+
+    python bench/bench_handoff.py --rows 1000 10000 100000 1000000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import uuid
+
+from common import make_redis, summarize
+
+import artifacts  # noqa: E402
+import engine  # noqa: E402
+import numpy as np  # noqa: E402
+from celery import Celery  # noqa: E402
+from celery import states  # noqa: E402
+
+
+def make_backend():
+    app = Celery("bench_handoff", broker="memory://", backend="redis://localhost:6379/0")
+    backend = app.backend
+    backend.__dict__["client"] = make_redis()
+    return backend
+
+
+def produce(mode, pipeline_id, rows):
+    spec = engine.dataset_spec(rows)
+    if mode == "inline":
+        columns = {name: [] for name in engine.COLUMNS}
+        for chunk in engine.iter_chunks(spec):
+            for name in engine.COLUMNS:
+                columns[name].extend(chunk[name].tolist())
+        return {"dataset": columns}
+    writer = artifacts.ColumnWriter(pipeline_id, "prepared", engine.COLUMNS, rows)
+    for chunk in engine.iter_chunks(spec):
+        writer.append({name: chunk[name] for name in engine.COLUMNS})
+    return {"dataset": engine.dataset_spec(rows, artifact=writer.close())}
+
+
+def consume(mode, result):
+    if mode == "inline":
+        return float(np.asarray(result["dataset"]["value"], dtype=np.float64).sum())
+    total = 0.0
+    for chunk in engine.iter_chunks(result["dataset"]):
+        total += float(chunk["value"].sum())
+    return total
+
+
+def run(backend, mode, rows, repeats):
+    redis_client = backend.client
+    hops, sizes = [], []
+    for _ in range(repeats):
+        pipeline_id = str(uuid.uuid4())
+        task_id = str(uuid.uuid4())
+        payload = produce(mode, pipeline_id, rows)
+
+        start = time.perf_counter()
+        backend.store_result(task_id, payload, states.SUCCESS)
+        result = backend.get_task_meta(task_id)["result"]
+        consume(mode, result)
+        hops.append(time.perf_counter() - start)
+
+        sizes.append(redis_client.strlen(backend.get_key_for_task(task_id)))
+        redis_client.delete(backend.get_key_for_task(task_id))
+        artifacts.delete_artifacts(pipeline_id)
+
+    report = summarize(hops)
+    report.update({"mode": mode, "rows": rows, "redis_bytes": max(sizes)})
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    artifacts.ARTIFACT_DIR = os.environ.get("ARTIFACT_DIR") or tempfile.mkdtemp(prefix="artifacts-")
+    backend = make_backend()
+    for rows in args.rows:
+        for mode in ("inline", "reference"):
+            print(json.dumps(run(backend, mode, rows, args.repeats)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
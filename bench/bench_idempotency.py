@@ -0,0 +1,152 @@
+"""Бенчмарк идемпотентной постановки: одновременные повторы одного запроса.
+
+execute_task — --duplicates клиентов одновременно шлют одинаковый /execute_task
+(sleep на --sleep секунд), затем те же запросы повторяются после завершения. Считаются
+задачи, реально выполненные воркером, разные task_id в ответах и задержка ответов.
+start_pipeline — столько же одновременных /start_pipeline одного пользователя
+(двойной клик без ключа и ретраи с общим Idempotency-Key): сколько пайплайнов
+поставлено в работу.
+
+Режимы: off — IDEMPOTENCY=false, как было; on — ключи в Redis. Воркер Celery (пул
+потоков) работает в том же процессе, брокер memory://, Redis — BENCH_REDIS_URL или
+fakeredis.
+
+    python bench/bench_idempotency.py --duplicates 20 --sleep 1 --concurrency 8
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+import uuid
+
+from common import make_redis, summarize
+
+os.environ.update(CELERY_BROKER_URL="memory://", CELERY_RESULT_BACKEND="cache+memory://",
+                  WEB_ASYNC_MODE="threading")
+os.environ.setdefault("WORKER_METRICS_PORT", "0")
+os.environ.setdefault("PIPELINE_SCHEDULER", "true")
+
+import tasks_simple  # noqa: E402
+
+# Приложение воркера уже создано с cache+memory://; веб-приложениям нужен URL Redis
+# только для клиента, который сразу заменяется на fakeredis (клиент Celery веб-приложений
+# создается при первой отправке, уже с cache+memory://)
+os.environ["CELERY_RESULT_BACKEND"] = "redis://localhost:6379/0"
+import app as web_app  # noqa: E402
+import app_simple  # noqa: E402
+os.environ["CELERY_RESULT_BACKEND"] = "cache+memory://"
+
+import celery_client  # noqa: E402
+import idempotency  # noqa: E402
+from celery.contrib.testing.worker import start_worker  # noqa: E402
+from celery.signals import task_prerun  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+executed = []
+
+
+@task_prerun.connect
+def count_executed(task=None, **kwargs):
+    executed.append(task.name)
+
+
+def call(url, path, payload, headers=None):
+    data = json.dumps(payload).encode()
+    request = urllib.request.Request(url + path, data=data,
+                                     headers={"Content-Type": "application/json", **(headers or {})})
+    return json.loads(urllib.request.urlopen(request, timeout=120).read())
+
+
+def fire(url, path, payloads, headers=None):
+    """Шлет запросы одновременно (старт по барьеру); возвращает (ответы, задержки)"""
+    barrier = threading.Barrier(len(payloads))
+    responses, latencies = [None] * len(payloads), [0.0] * len(payloads)
+
+    def client(index):
+        barrier.wait()
+        start = time.perf_counter()
+        responses[index] = call(url, path, payloads[index], headers)
+        latencies[index] = time.perf_counter() - start
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(len(payloads))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return responses, latencies
+
+
+def execute_round(url, duplicates, seconds):
+    payload = {"task": "sleep", "seconds": seconds}
+    executed.clear()
+    start = time.perf_counter()
+    responses, latencies = fire(url, "/execute_task", [payload] * duplicates)
+    wall = time.perf_counter() - start
+    runs = len(executed)
+    retry, retry_latencies = fire(url, "/execute_task", [payload] * duplicates)
+    return {
+        "wall_s": round(wall, 3),
+        "tasks_executed": runs,
+        "distinct_task_ids": len({r.get("task_id") for r in responses}),
+        "ok": sum(bool(r.get("success")) for r in responses),
+        "deduplicated": sum(bool(r.get("deduplicated")) for r in responses),
+        "latency": summarize(latencies),
+        "retry_after_done": {"tasks_executed": len(executed) - runs,
+                             "deduplicated": sum(bool(r.get("deduplicated")) for r in retry),
+                             "latency": summarize(retry_latencies)},
+    }
+
+
+def pipeline_round(url, duplicates, headers):
+    user = f"bench-{uuid.uuid4().hex[:8]}"
+    responses, latencies = fire(url, "/start_pipeline", [{"data_size": 100, "user_id": user}] * duplicates,
+                                headers)
+    return {
+        "pipelines_started": len({r.get("pipeline_id") for r in responses if r.get("success")}),
+        "deduplicated": sum(bool(r.get("deduplicated")) for r in responses),
+        "latency": summarize(latencies),
+    }
+
+
+def serve(wsgi_app):
+    server = make_server("127.0.0.1", 0, wsgi_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duplicates", type=int, default=20)
+    parser.add_argument("--sleep", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    redis_client = make_redis()
+    web_app.redis_client = app_simple.redis_client = redis_client
+    simple_server, simple_url = serve(app_simple.app)
+    web_server, web_url = serve(web_app.app)
+    # Пайплайны только ставятся в очередь, которую никто не читает: считается число запусков
+    celery_client.get_app(priorities=True).conf.task_routes = {"*": {"queue": "bench_idempotency_pipelines"}}
+
+    with start_worker(tasks_simple.app, pool="threads", concurrency=args.concurrency,
+                      perform_ping_check=False, loglevel="WARNING"):
+        for mode in ("off", "on"):
+            idempotency.IDEMPOTENCY = mode == "on"
+            redis_client.flushall()
+            report = {"mode": mode, "duplicates": args.duplicates,
+                      "execute_task": execute_round(simple_url, args.duplicates, args.sleep),
+                      "start_pipeline": pipeline_round(web_url, args.duplicates, None),
+                      "start_pipeline_key": pipeline_round(web_url, args.duplicates,
+                                                           {idempotency.HEADER: uuid.uuid4().hex})}
+            report["stats"] = idempotency.stats(redis_client)
+            print(json.dumps(report, ensure_ascii=False), flush=True)
+    simple_server.shutdown()
+    web_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
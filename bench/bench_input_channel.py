@@ -0,0 +1,94 @@
+"""Бенчмарк канала пользовательского ввода: задержка submit -> resume и команды Redis.
+
+Сравнивает прежний опрос (GET + sleep(1)) с блокирующим BLPOP.
+
+    python bench/bench_input_channel.py --prompts 50 --concurrency 10
+
+По умолчанию используется fakeredis; для локального сервера задайте BENCH_REDIS_URL.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+
+from common import CommandCounter, make_redis, summarize
+
+from input_channel import input_key, pop_input, push_input
+
+
+def legacy_wait(redis_client, task_id, timeout):
+    """Прежняя реализация ожидания: GET + sleep(1) до таймаута"""
+    key = input_key(task_id)
+    start = time.time()
+    while True:
+        raw = redis_client.get(key)
+        if raw:
+            redis_client.delete(key)
+            return True, json.loads(raw)
+        if time.time() - start > timeout:
+            redis_client.delete(key)
+            return False, None
+        time.sleep(1)
+
+
+def legacy_submit(redis_client, task_id, value):
+    redis_client.set(input_key(task_id), json.dumps(value), ex=300)
+
+
+def run(mode, prompts, concurrency, timeout=30):
+    counter = CommandCounter()
+    worker_client = make_redis(counter)
+    web_client = make_redis(counter)
+    latencies = []
+    lock = threading.Lock()
+    semaphore = threading.Semaphore(concurrency)
+
+    wait = pop_input if mode == "blpop" else legacy_wait
+    submit = push_input if mode == "blpop" else legacy_submit
+
+    def one_prompt():
+        with semaphore:
+            task_id = str(uuid.uuid4())
+            submitted = {}
+
+            def user():
+                # Пользователь отвечает через случайное время
+                time.sleep(random.uniform(0.05, 0.3))
+                submitted["at"] = time.perf_counter()
+                submit(web_client, task_id, "Быстрая обработка")
+
+            threading.Thread(target=user).start()
+            received, _ = wait(worker_client, task_id, timeout)
+            resumed = time.perf_counter()
+            if received:
+                with lock:
+                    latencies.append(resumed - submitted["at"])
+
+    threads = [threading.Thread(target=one_prompt) for _ in range(prompts)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    report = summarize(latencies)
+    report["mode"] = mode
+    report["redis_commands_per_prompt"] = round(counter.count / prompts, 2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--prompts", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--mode", choices=["blpop", "poll", "both"], default="both")
+    args = parser.parse_args()
+
+    modes = ["poll", "blpop"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        print(json.dumps(run(mode, args.prompts, args.concurrency), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
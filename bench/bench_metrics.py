@@ -0,0 +1,81 @@
+"""Бенчмарк накладных расходов метрик: время на задачу и на уведомление с метриками и без.
+
+Задача echo выполняется через apply() (сигналы task_prerun/task_postrun
+срабатывают как в воркере), уведомление — через send_notification с пустым
+транспортом. Разница на вызов сравнивается с бюджетом --budget-us; при
+превышении скрипт завершается с кодом 1. С --trace интервалы пишутся в Redis
+(fakeredis или BENCH_REDIS_URL) — это одна запись в Redis на интервал, бюджет для нее задается отдельно.
+
+    python bench/bench_metrics.py --calls 20000 --budget-us 50
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("CELERY_BROKER_URL", "memory://")
+os.environ.setdefault("CELERY_RESULT_BACKEND", "cache+memory://")
+
+from common import make_redis  # noqa: E402
+
+import metrics  # noqa: E402
+import tasks  # noqa: E402
+from tasks_simple import echo  # noqa: E402
+
+# Аргумент задачи в формате pipeline_id: с --trace интервалы попадают в trace:{PIPELINE_ID}
+PIPELINE_ID = "00000000-0000-0000-0000-000000000000"
+
+
+class NullTransport:
+    def send(self, event):
+        pass
+
+
+def per_call_us(func, calls):
+    start = time.perf_counter()
+    for i in range(calls):
+        func(i)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def measure(enabled, calls, repeats):
+    metrics.METRICS_ENABLED = enabled
+    notify = tasks.send_notification if enabled else tasks.send_notification.__wrapped__
+    task_us, notify_us = [], []
+    for _ in range(repeats):
+        task_us.append(per_call_us(lambda i: echo.apply(args=(PIPELINE_ID,)), calls))
+        notify_us.append(per_call_us(lambda i: notify("bench", i, "progress", pipeline_id=PIPELINE_ID), calls))
+    return {"task_us": round(min(task_us), 2), "notify_us": round(min(notify_us), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--budget-us", type=float,
+                        default=float(os.environ.get("METRICS_OVERHEAD_BUDGET_US", "50")))
+    parser.add_argument("--trace", action="store_true", help="писать интервалы в Redis")
+    args = parser.parse_args()
+
+    tasks.get_transport = lambda: NullTransport()
+    if args.trace:
+        metrics.TRACE_PIPELINES = True
+        metrics._trace_client = make_redis()
+
+    # Прогрев: первые вызовы создают метки и кэшируют трассировщик задачи
+    measure(True, 1000, 1)
+    off = measure(False, args.calls, args.repeats)
+    on = measure(True, args.calls, args.repeats)
+    overhead = {key: round(on[key] - off[key], 2) for key in off}
+
+    report = {"calls": args.calls, "trace": args.trace, "off": off, "on": on,
+              "overhead_us": overhead, "budget_us": args.budget_us,
+              "ok": all(value <= args.budget_us for value in overhead.values())}
+    print(json.dumps(report), flush=True)
+    if not report["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Бенчмарк транспорта уведомлений: события/сек и накладные расходы задачи.
+
+Сравнивает прежний requests.post на каждое событие с пакетным транспортом
+(keep-alive сессия, фоновый поток, схлопывание прогресса). Веб-приложение
+заменено локальным HTTP-сервером, который только считает события.
+
+    python bench/bench_notifications.py --pipelines 4 --ticks 200
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common import add_paths
+
+add_paths()
+
+from notifications import HttpNotificationTransport  # noqa: E402
+
+
+class Sink(BaseHTTPRequestHandler):
+    received = 0
+    requests = 0
+    lock = threading.Lock()
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        data = json.loads(body)
+        with Sink.lock:
+            Sink.requests += 1
+            Sink.received += len(data["events"]) if "events" in data else 1
+        payload = b'{"success": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_events(pipeline, ticks):
+    """Поток событий одного шага: текст прогресса + прогресс пайплайна на каждый тик"""
+    for i in range(ticks):
+        yield {"task_name": "Обработка данных", "result": f"{i}%", "status": "progress"}
+        yield {"task_name": "Прогресс пайплайна", "result": f"{i}%", "status": "progress",
+               "progress_info": {"pipeline_id": pipeline, "current_step": 2, "total_steps": 4,
+                                 "step_progress": i, "overall_progress": 25 + i / 4}}
+
+
+def run(mode, url, pipelines, ticks):
+    import requests
+
+    Sink.received = Sink.requests = 0
+    transport = HttpNotificationTransport(url) if mode == "batched" else None
+    task_time = []
+    lock = threading.Lock()
+
+    def task(pipeline):
+        spent = 0.0
+        for event in make_events(pipeline, ticks):
+            t0 = time.perf_counter()
+            if transport:
+                transport.send(event)
+            else:
+                requests.post(f"{url}/task_result", json=event, timeout=5)
+            spent += time.perf_counter() - t0
+        with lock:
+            task_time.append(spent)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=task, args=(f"p{i}",)) for i in range(pipelines)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if transport:
+        transport.flush(timeout=30)
+    elapsed = time.perf_counter() - start
+
+    total = pipelines * ticks * 2
+    report = {
+        "mode": mode,
+        "events": total,
+        "events_per_sec": round(total / elapsed, 1),
+        "task_overhead_us_per_event": round(sum(task_time) / total * 1e6, 2),
+        "http_requests": Sink.requests,
+        "events_received": Sink.received,
+    }
+    if transport:
+        report["counters"] = transport.stats()
+        transport.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pipelines", type=int, default=4)
+    parser.add_argument("--ticks", type=int, default=200)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Sink)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    for mode in ("per-event", "batched"):
+        print(json.dumps(run(mode, url, args.pipelines, args.ticks), ensure_ascii=False))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Бенчмарк масштабирования: время пайплайна в зависимости от числа воркеров и партиций.
+
+Пайплайн с большим data_size выполняется настоящим воркером Celery в том же
+процессе (пул потоков, concurrency = число воркеров); запросы ввода получают ответ
+сразу. При PIPELINE_PARTITIONS > 1 шаги 2 и 3 раздают партиции группе задач;
+шаги 1 и 4 и запросы ввода остаются последовательными. Потоки пула делят один
+процесс: NumPy отпускает GIL на большей части вычислений, но ускорение ограничено
+числом ядер машины.
+Брокер — BENCH_REDIS_URL или memory://, Redis пайплайна — fakeredis или BENCH_REDIS_URL.
+
+    python bench/bench_partitions.py --data-size 1000000 --workers 1 2 4 8 --partitions 1 2 4 8
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+
+from common import BENCH_REDIS_URL, make_redis
+
+os.environ.setdefault("CELERY_BROKER_URL", BENCH_REDIS_URL or "memory://")
+os.environ.setdefault("CELERY_RESULT_BACKEND", BENCH_REDIS_URL or "cache+memory://")
+os.environ.setdefault("PIPELINE_TIME_SCALE", "0.2")
+
+import tasks  # noqa: E402
+from celery.contrib.testing.worker import start_worker  # noqa: E402
+
+# memory:// по умолчанию опрашивает очереди раз в секунду
+tasks.app.conf.broker_transport_options = {"polling_interval": 0.01}
+
+
+def answer_for(request_input):
+    if request_input["input_type"] == "select":
+        return request_input["options"][0]
+    return "1"
+
+
+def run(mode, data_size, workers, partitions):
+    redis_client = make_redis()
+    done = threading.Event()
+    errors = []
+
+    def on_notification(task_name, result, status="success", error=None, request_input=None,
+                        progress_info=None, pipeline_id=None):
+        if status == "input_required":
+            token = request_input["task_id"]
+            if mode == "resumable":
+                tasks.resume_pipeline.delay(token, answer_for(request_input))
+            else:
+                from input_channel import push_input
+                push_input(redis_client, token, answer_for(request_input))
+        elif status == "completed":
+            done.set()
+        elif status == "error":
+            errors.append(result)
+            done.set()
+
+    tasks.send_notification = on_notification
+    tasks.get_redis_client = lambda: redis_client
+    tasks.schedule_input_timeout = lambda token, timeout: None
+    tasks.PIPELINE_MODE = mode
+    tasks.PIPELINE_PARTITIONS = partitions
+    tasks.PARTITION_MIN_SIZE = 1
+
+    # В блокирующем режиме шаг, ждущий ввода, занимает один из слотов
+    with start_worker(tasks.app, pool="threads", concurrency=workers, perform_ping_check=False,
+                      loglevel="WARNING"):
+        start = time.perf_counter()
+        tasks.run_interactive_pipeline.delay(data_size, str(uuid.uuid4()))
+        done.wait(timeout=600)
+        elapsed = time.perf_counter() - start
+
+    return {
+        "mode": mode,
+        "data_size": data_size,
+        "workers": workers,
+        "partitions": partitions,
+        "ok": done.is_set() and not errors,
+        "wall_s": round(elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--data-size", type=int, default=1000000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--partitions", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--mode", choices=["resumable", "blocking"], default="resumable")
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        for partitions in args.partitions:
+            print(json.dumps(run(args.mode, args.data_size, workers, partitions), ensure_ascii=False),
+                  flush=True)
+
+
+if __name__ == "__main__":
+    main()
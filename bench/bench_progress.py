@@ -0,0 +1,132 @@
+"""Бенчмарк событий прогресса: сколько событий и байт уходит клиенту за пайплайн.
+
+Пайплайны выполняются в процессе в режиме resumable, запросы ввода получают
+ответ сразу. Уведомления проходят через настоящий пакетный транспорт, доставка
+подменена записью пакетов. Сравниваются прежнее поведение (каждый тик — полный
+снимок, текст шага отдельным событием) и ограничение частоты + дельты.
+Клиент собирает прогресс через merge_progress; проверяется, что каждый
+пайплайн в итоге дошел до 100%.
+
+    python bench/bench_progress.py --pipelines 8 --time-scale 0.05
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+
+os.environ.setdefault("CELERY_BROKER_URL", "memory://")
+os.environ.setdefault("CELERY_RESULT_BACKEND", "cache+memory://")
+
+from common import make_redis, summarize  # noqa: E402
+
+import tasks  # noqa: E402
+from notifications import NotificationTransport, encode_batch  # noqa: E402
+from progress import ProgressReporter, merge_progress  # noqa: E402
+
+
+class RecordingTransport(NotificationTransport):
+    """Пакетный транспорт, который вместо отправки запоминает пакеты"""
+
+    def __init__(self, **kwargs):
+        self.batches = []
+        super().__init__(**kwargs)
+
+    def _deliver(self, batch):
+        self.batches.append((time.perf_counter(), encode_batch(batch), batch))
+
+
+def answer_for(request_input):
+    if request_input["input_type"] == "select":
+        return request_input["options"][0]
+    return "0.5"
+
+
+def run(label, reporter, merge, pipelines, time_scale):
+    redis_client = make_redis()
+    transport = RecordingTransport()
+    send_notification = tasks.send_notification
+    sent = []
+
+    def on_notification(task_name, result, status="success", error=None, request_input=None,
+                        progress_info=None, pipeline_id=None):
+        sent.append(status)
+        send_notification(task_name, result, status, error, request_input, progress_info, pipeline_id)
+        if status == "input_required":
+            threading.Thread(target=tasks.resume_pipeline.apply,
+                             args=((request_input["task_id"], answer_for(request_input)),),
+                             daemon=True).start()
+
+    tasks.get_transport = lambda: transport
+    tasks.send_notification = on_notification
+    tasks.get_redis_client = lambda: redis_client
+    tasks.schedule_input_timeout = lambda token, timeout: None
+    tasks.progress_reporter = reporter
+    tasks.PROGRESS_MERGE = merge
+    tasks.PIPELINE_TIME_SCALE = time_scale
+    tasks.PIPELINE_MODE = "resumable"
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=tasks.run_interactive_pipeline.apply, args=((100, str(uuid.uuid4())),))
+               for _ in range(pipelines)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 600
+    while sent.count("completed") < pipelines and time.monotonic() < deadline:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    transport.close()
+    tasks.send_notification = send_notification
+
+    # Клиент: собираем прогресс по пайплайнам и интервалы между обновлениями
+    state, last_seen, gaps = {}, {}, []
+    events = 0
+    for at, _, batch in transport.batches:
+        for event in batch:
+            events += 1
+            info = event.get("progress_info")
+            if not info:
+                continue
+            pipeline_id = info["pipeline_id"]
+            state[pipeline_id] = merge_progress(state.get(pipeline_id), info)
+            if pipeline_id in last_seen:
+                gaps.append(at - last_seen[pipeline_id])
+            last_seen[pipeline_id] = at
+
+    stats = transport.stats()
+    report = {"label": label, "pipelines": pipelines, "completed": sent.count("completed")}
+    report.update({
+        "events_sent": len(sent),
+        "events_delivered": events,
+        "events_per_pipeline": round(events / pipelines, 1),
+        "bytes_delivered": sum(len(raw) for _, raw, _ in transport.batches),
+        "throttled": reporter.counters["throttled"],
+        "coalesced": stats.get("coalesced", 0),
+        "final_progress_ok": all(s.get("overall_progress", 0) >= 100 for s in state.values()),
+        "wall_s": round(elapsed, 2),
+        "progress_gap": summarize(gaps),
+    })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pipelines", type=int, default=8)
+    parser.add_argument("--time-scale", type=float, default=0.05)
+    parser.add_argument("--max-rate", type=float, default=4)
+    args = parser.parse_args()
+
+    legacy = run("legacy", ProgressReporter(max_rate=0, deltas=False), False, args.pipelines, args.time_scale)
+    print(json.dumps(legacy, ensure_ascii=False))
+    current = run("throttled+delta", ProgressReporter(max_rate=args.max_rate, deltas=True), True,
+                  args.pipelines, args.time_scale)
+    print(json.dumps(current, ensure_ascii=False))
+    print(json.dumps({
+        "events_reduction_pct": round(100 * (1 - current["events_delivered"] / legacy["events_delivered"]), 1),
+        "bytes_reduction_pct": round(100 * (1 - current["bytes_delivered"] / legacy["bytes_delivered"]), 1),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Бенчмарк таймаутов ввода: отложенная задача на каждый запрос vs реестр со sweeper.
+
+--prompts возобновляемых пайплайнов одновременно ждут ввода с таймаутом --timeout
+секунд, и никто не отвечает. countdown — как было: на каждый запрос
+resume_pipeline.apply_async(countdown=...), воркер держит все отложенные задачи в
+памяти до срока. registry — дедлайны в ZSET prompts:pending:resumable, один поток
+sweeper раз в --interval секунд снимает просроченные и ставит продолжения.
+
+Считается опоздание продолжения относительно дедлайна (p50/p99), память Python
+(tracemalloc), занятая ожидающими запросами, команды Redis на запрос (постановка,
+проверки sweeper и продолжение) и
+сколько ответов, пришедших после таймаута, все равно было бы доставлено. С fakeredis
+ZSET реестра живет в этом же процессе и попадает в замер памяти; с BENCH_REDIS_URL —
+только память воркера.
+
+Воркер Celery (пул потоков) работает в том же процессе, брокер memory://, Redis —
+BENCH_REDIS_URL или fakeredis. Шаги пайплайна не выполняются: замеряется только
+путь таймаута до advance_pipeline.
+
+    python bench/bench_prompts.py --prompts 2000 --timeout 10 --interval 0.5
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+from common import CommandCounter, make_redis, summarize
+
+os.environ.update(CELERY_BROKER_URL="memory://", CELERY_RESULT_BACKEND="cache+memory://")
+os.environ.setdefault("WORKER_METRICS_PORT", "0")
+
+import prompt_registry  # noqa: E402
+import tasks  # noqa: E402
+from celery.contrib.testing.worker import start_worker  # noqa: E402
+from pipeline_state import new_state, prompt_token, save_state  # noqa: E402
+
+
+def prepare(redis_client, prompts, timeout, run):
+    """Состояния пайплайнов, остановленных на запросе ввода; возвращает {token: дедлайн}"""
+    deadlines = {}
+    for index in range(prompts):
+        state = new_state(f"bench-{run}-{index}", 100)
+        token = prompt_token(state["pipeline_id"], 0, 0)
+        state["pending"] = {"task_id": token, "prompt": "?", "input_type": "text", "options": [],
+                            "timeout": timeout}
+        state["status"] = "waiting"
+        save_state(redis_client, state)
+        deadlines[token] = None
+    return deadlines
+
+
+def run_mode(mode, args, redis_client, counter, run):
+    prompt_registry.PROMPT_REGISTRY = mode == "registry"
+    deadlines = prepare(redis_client, args.prompts, args.timeout, run)
+    resumed = {}
+    done = threading.Event()
+
+    def advance(state):
+        token = prompt_token(state["pipeline_id"], 0, 0)
+        if token not in deadlines:
+            return state
+        resumed[token] = time.time()
+        if len(resumed) == len(deadlines):
+            done.set()
+        return state
+
+    tasks.advance_pipeline = advance
+    if mode == "registry":
+        threading.Thread(target=prompt_registry.run_sweeper,
+                         args=(lambda: redis_client, tasks.expire_prompt, args.interval), daemon=True).start()
+    counter.count, counter.by_command = 0, {}
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for token in deadlines:
+        deadlines[token] = time.time() + args.timeout
+        tasks.schedule_input_timeout(token, args.timeout)
+    # Воркер успевает получить отложенные задачи задолго до срока
+    time.sleep(args.timeout / 2)
+    held = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    done.wait(args.timeout * 4 + args.interval * 4)
+    lateness = [max(0.0, resumed[token] - deadlines[token]) for token in resumed]
+    commands = counter.count
+
+    # Ответ пользователя после таймаута: дошел бы он до задачи
+    late_answers = sum(prompt_registry.resolve(redis_client, token) for token in deadlines)
+    return {
+        "mode": mode,
+        "prompts": args.prompts,
+        "resumed": len(resumed),
+        "lateness": summarize(lateness),
+        "held_kb": round(held / 1024, 1),
+        "held_bytes_per_prompt": round(held / args.prompts),
+        "redis_commands_per_prompt": round(commands / args.prompts, 2),
+        "late_answers_delivered": late_answers,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--prompts", type=int, default=2000)
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--interval", type=float, default=0.5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    counter = CommandCounter()
+    redis_client = make_redis(counter)
+    tasks.get_redis_client = lambda: redis_client
+    tasks.send_notification = lambda *a, **kw: None
+    tasks.app.conf.broker_transport_options = {"polling_interval": 0.01}
+    # С prefetch 1 брокер memory:// после простоя отдает сообщения по одному за цикл опроса
+    tasks.app.conf.worker_prefetch_multiplier = 64
+    for run, mode in enumerate(("countdown", "registry")):
+        # Свой воркер на каждый режим: отложенные задачи прошлого режима не мешают
+        with start_worker(tasks.app, pool="threads", concurrency=args.concurrency,
+                          perform_ping_check=False, loglevel="WARNING"):
+            print(json.dumps(run_mode(mode, args, redis_client, counter, run), ensure_ascii=False), flush=True)
+
+
+if __name__ == "__main__":
+    main()
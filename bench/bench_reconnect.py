@@ -0,0 +1,183 @@
+"""Бенчмарк переподключения: время до актуального состояния пайплайна и трафик на клиента.
+
+web/app.py работает в этом процессе (Werkzeug, потоки; Redis — fakeredis или
+BENCH_REDIS_URL). Поток-источник шлет события одного пайплайна в /task_results
+каждые --interval секунд, как воркер с троттлингом прогресса. --clients клиентов
+Socket.IO в цикле подключаются, подписываются на пайплайн, держат соединение
+--hold секунд и отключаются.
+
+Без снимков (PIPELINE_SNAPSHOTS=false) клиент узнает состояние только со следующим
+событием прогресса, и то лишь изменившиеся поля. Со снимками состояние приходит
+сообщением snapshot сразу после подписки. replay_bytes — сколько занял бы повтор
+всех прошлых событий пайплайна на момент подключения.
+
+    python bench/bench_reconnect.py --clients 50 --cycles 5 --interval 1
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+import uuid
+from datetime import datetime
+
+from common import make_redis, summarize
+
+os.environ.setdefault("CELERY_BROKER_URL", "memory://")
+os.environ.setdefault("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
+os.environ.setdefault("WEB_ASYNC_MODE", "threading")
+os.environ.setdefault("WORKER_METRICS_PORT", "0")
+
+import app as web_app  # noqa: E402
+import snapshots  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+
+def size(payload):
+    return len(json.dumps(payload, ensure_ascii=False).encode())
+
+
+def post_events(url, events):
+    request = urllib.request.Request(f"{url}/task_results", data=json.dumps({"events": events}).encode(),
+                                     headers={"Content-Type": "application/json"})
+    urllib.request.urlopen(request, timeout=30).read()
+
+
+class Source:
+    """Шлет события пайплайна: шаги с прогрессом, запросы ввода и результаты"""
+
+    def __init__(self, url, pipeline_id, interval):
+        self.url = url
+        self.pipeline_id = pipeline_id
+        self.interval = interval
+        self.sent_bytes = 0
+        self.stopped = threading.Event()
+
+    def event(self, task_name, result, status, **extra):
+        return {"task_name": task_name, "pipeline_id": self.pipeline_id, "result": result, "status": status,
+                "timestamp": datetime.now().isoformat(), **extra}
+
+    def ticks(self):
+        yield self.event("Интерактивный пайплайн", "Запуск интерактивного пайплайна", "start")
+        first = True
+        while True:
+            for step in range(1, 5):
+                name = f"Шаг {step}"
+                for percent in range(0, 101, 10):
+                    info = {"pipeline_id": self.pipeline_id, "current_step": step, "step_progress": percent,
+                            "overall_progress": (step - 1 + percent / 100) * 25}
+                    if first:
+                        info["total_steps"] = 4
+                        first = False
+                    else:
+                        info["delta"] = True
+                    yield self.event(name, f"{name}: {percent}%", "progress", progress_info=info)
+                    if percent == 50:
+                        yield self.event("Требуется ввод", "Выберите параметр", "input_required", request_input={
+                            "prompt": "Выберите параметр", "input_type": "select", "options": ["a", "b", "c"],
+                            "task_id": f"{self.pipeline_id}:{step}:0", "pipeline_id": self.pipeline_id,
+                            "timeout": 300})
+                yield self.event(name, f"{name} завершен: обработано 100000 записей", "success")
+
+    def run(self):
+        for event in self.ticks():
+            if self.stopped.wait(self.interval):
+                return
+            self.sent_bytes += size(event)
+            post_events(self.url, [event])
+
+
+async def client_loop(url, pipeline_id, cycles, hold, source, stats):
+    import socketio
+
+    for _ in range(cycles):
+        sio = socketio.AsyncClient(reconnection=False)
+        ready = asyncio.Event()
+        received = {"bytes": 0, "snapshot_bytes": 0}
+
+        @sio.on("snapshot")
+        async def on_snapshot(data):
+            received["bytes"] += size(data)
+            received["snapshot_bytes"] = size(data)
+            ready.set()
+
+        @sio.on("task_update")
+        async def on_update(data):
+            received["bytes"] += size(data)
+            if data.get("progress_info"):
+                ready.set()
+
+        start = time.perf_counter()
+        replay_bytes = source.sent_bytes
+        await sio.connect(url, transports=["websocket"], wait_timeout=30)
+        await sio.emit("subscribe", {"pipeline_id": pipeline_id})
+        try:
+            await asyncio.wait_for(ready.wait(), 60)
+            stats["state"].append(time.perf_counter() - start)
+        except asyncio.TimeoutError:
+            stats["missed"] += 1
+        await asyncio.sleep(hold)
+        await sio.disconnect()
+
+        stats["bytes"].append(received["bytes"])
+        stats["snapshot_bytes"].append(received["snapshot_bytes"])
+        stats["replay_bytes"].append(replay_bytes)
+
+
+async def drive(url, pipeline_id, clients, cycles, hold, source):
+    stats = {"state": [], "bytes": [], "snapshot_bytes": [], "replay_bytes": [], "missed": 0}
+    await asyncio.gather(*(client_loop(url, pipeline_id, cycles, hold, source, stats) for _ in range(clients)))
+    return stats
+
+
+def run(enabled, url, clients, cycles, hold, interval):
+    snapshots.PIPELINE_SNAPSHOTS = enabled
+    pipeline_id = str(uuid.uuid4())
+    source = Source(url, pipeline_id, interval)
+    feeder = threading.Thread(target=source.run, daemon=True)
+    feeder.start()
+    # Пайплайн успевает пройти несколько событий до первых подключений
+    time.sleep(interval * 3)
+    stats = asyncio.run(drive(url, pipeline_id, clients, cycles, hold, source))
+    source.stopped.set()
+    feeder.join()
+
+    mean = lambda values: round(sum(values) / max(len(values), 1))  # noqa: E731
+    report = summarize(stats["state"])
+    report.update({
+        "snapshots": enabled,
+        "clients": clients,
+        "reconnects": clients * cycles,
+        "missed": stats["missed"],
+        "bytes_per_connection": mean(stats["bytes"]),
+        "snapshot_bytes": mean(stats["snapshot_bytes"]),
+        "replay_bytes": mean(stats["replay_bytes"]),
+    })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--hold", type=float, default=2.0, help="секунд на соединение")
+    parser.add_argument("--interval", type=float, default=1.0, help="секунд между событиями")
+    args = parser.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    web_app.redis_client = make_redis()
+    server = make_server("127.0.0.1", 0, web_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    for enabled in (False, True):
+        print(json.dumps(run(enabled, url, args.clients, args.cycles, args.hold, args.interval),
+                         ensure_ascii=False), flush=True)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Микробенчмарк Redis: запросы ввода в секунду и round-trip на запрос при параллельных пайплайнах.
+
+Один цикл — путь ответа на запрос ввода: запись состояния с ожидающим запросом,
+передача ответа (push_input), получение ответа воркером (pop_input) и снятие запроса
+(claim_prompt). --concurrency потоков крутят циклы параллельно.
+
+per-prompt — прежний путь: новый клиент на каждый запрос, RPUSH и EXPIRE без атомарности,
+снятие запроса через WATCH/MULTI. pooled — общий пул redis_pool и Lua-скрипты.
+Стоимость подключения видна только с настоящим Redis (BENCH_REDIS_URL); с fakeredis
+сравниваются число round-trip и накладные расходы клиента.
+
+    BENCH_REDIS_URL=redis://localhost:6379/15 python bench/bench_redis_pool.py --prompts 5000 --concurrency 32
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+
+from common import BENCH_REDIS_URL, make_redis, summarize
+
+import redis  # noqa: E402
+import redis_pool  # noqa: E402
+from input_channel import input_key, pop_input, push_input  # noqa: E402
+from pipeline_state import STATE_TTL, claim_prompt, new_state, prompt_token, save_state, state_key  # noqa: E402
+
+
+class RoundTrips:
+    """Считает round-trip клиента: отдельные команды и выполнение pipeline"""
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def add(self):
+        with self.lock:
+            self.count += 1
+
+    def attach(self, client):
+        execute_command, pipeline = client.execute_command, client.pipeline
+
+        def counted_command(*args, **options):
+            self.add()
+            return execute_command(*args, **options)
+
+        def counted_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            execute, immediate = pipe.execute, pipe.immediate_execute_command
+
+            def counted_execute(*a, **k):
+                self.add()
+                return execute(*a, **k)
+
+            def counted_immediate(*a, **k):
+                self.add()
+                return immediate(*a, **k)
+
+            pipe.execute, pipe.immediate_execute_command = counted_execute, counted_immediate
+            return pipe
+
+        client.execute_command, client.pipeline = counted_command, counted_pipeline
+        return client
+
+
+def new_client():
+    if BENCH_REDIS_URL:
+        return redis.Redis.from_url(BENCH_REDIS_URL)
+    return make_redis()
+
+
+def claim_with_watch(client, token, pipeline_id):
+    """Прежнее снятие запроса: WATCH + GET + MULTI/SET/EXEC"""
+    key = state_key(pipeline_id)
+    with client.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(key)
+                state = json.loads(pipe.get(key))
+                state["pending"] = None
+                pipe.multi()
+                pipe.set(key, json.dumps(state), ex=STATE_TTL)
+                pipe.execute()
+                return state
+            except redis.WatchError:
+                continue
+
+
+def cycle_per_prompt(trips, _):
+    client = trips.attach(new_client())
+    pipeline_id = str(uuid.uuid4())
+    token = prompt_token(pipeline_id, 0, 0)
+    state = new_state(pipeline_id, 100)
+    state["pending"] = {"task_id": token}
+    save_state(client, state)
+
+    key = input_key(token)
+    client.rpush(key, json.dumps("0.5"))
+    client.expire(key, 300)
+    client.blpop([key], timeout=1)
+    claim_with_watch(client, token, pipeline_id)
+    client.close()
+
+
+def cycle_pooled(trips, client):
+    pipeline_id = str(uuid.uuid4())
+    token = prompt_token(pipeline_id, 0, 0)
+    state = new_state(pipeline_id, 100)
+    state["pending"] = {"task_id": token}
+    save_state(client, state)
+
+    push_input(client, token, "0.5")
+    pop_input(client, token, 1)
+    claim_prompt(client, token)
+
+
+def run(mode, prompts, concurrency):
+    trips = RoundTrips()
+    shared = None
+    if mode == "pooled":
+        client = redis_pool.create_client(BENCH_REDIS_URL) if BENCH_REDIS_URL else make_redis()
+        shared = trips.attach(client)
+    cycle = cycle_pooled if mode == "pooled" else cycle_per_prompt
+
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(prompts))
+
+    def worker():
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            start = time.perf_counter()
+            cycle(trips, shared)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    report = summarize(latencies)
+    report.update({
+        "mode": mode,
+        "concurrency": concurrency,
+        "prompts_per_sec": round(prompts / elapsed, 1),
+        "roundtrips_per_prompt": round(trips.count / prompts, 2),
+    })
+    if shared is not None and BENCH_REDIS_URL:
+        report["pool_connections"] = len([c for c in shared.connection_pool._connections if c is not None])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--prompts", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    for concurrency in args.concurrency:
+        for mode in ("per-prompt", "pooled"):
+            print(json.dumps(run(mode, args.prompts, concurrency)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Бенчмарк отчетов: время до первых данных на диске, полное время, пиковая память и TTFB скачивания.
+
+Для каждого размера --rows готовится артефакт набора (как на шаге 1), по нему строится
+«Детальный отчет» с графиками (CSV всех строк + report.html).
+
+streaming — reports.build_report: блоки движка сразу пишутся в файл. in-memory —
+прежний подход «собрать все, потом записать»: строки и документ целиком в памяти,
+первый байт появляется на диске в самом конце. Пиковая память — tracemalloc (Python
+и NumPy), в отдельном прогоне, чтобы не искажать время.
+
+Скачивание: web/app.py в этом процессе (Werkzeug). stream — /reports/<id>/data.csv
+(send_file, файл отдается частями), buffered — тот же файл, прочитанный в память
+перед ответом. range — запрос 1 МиБ из середины файла.
+
+    python bench/bench_reports.py --rows 100000 1000000 5000000
+"""
+import argparse
+import http.client
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+
+os.environ.setdefault("ARTIFACT_DIR", tempfile.mkdtemp(prefix="bench_reports_"))
+os.environ.setdefault("CELERY_BROKER_URL", "memory://")
+os.environ.setdefault("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
+os.environ.setdefault("WEB_ASYNC_MODE", "threading")
+os.environ.setdefault("WORKER_METRICS_PORT", "0")
+
+from common import make_redis  # noqa: E402
+
+import app as web_app  # noqa: E402
+import artifacts  # noqa: E402
+import engine  # noqa: E402
+import numpy as np  # noqa: E402
+import reports  # noqa: E402
+from flask import Response  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+LEVEL = "basic"
+QUALITY = 0.9
+METHOD = "Комбинированный подход"
+
+
+@web_app.app.route("/bench/buffered/<report_id>/<name>")
+def buffered_download(report_id, name):
+    path, content_type = reports.report_file(report_id, name)
+    with open(path, "rb") as f:
+        return Response(f.read(), content_type=content_type)
+
+
+def prepare_dataset(rows):
+    spec = engine.dataset_spec(rows)
+    writer = artifacts.ColumnWriter(f"bench-{rows}", "prepared", engine.COLUMNS, rows)
+    summary = engine.prepare(spec, LEVEL, output=writer)
+    dataset = engine.dataset_spec(summary["valid"], artifact=writer.close())
+    return dataset, engine.process(dataset, LEVEL, QUALITY)
+
+
+def meta(report_id):
+    return {"report_id": report_id, "format": "Детальный отчет", "includes_charts": True,
+            "analysis_method": METHOD, "complexity_level": 3, "insights": 0, "anomalies": 0, "pipeline_id": None}
+
+
+def build_streaming(dataset, stats, report_id):
+    first = {}
+    start = time.perf_counter()
+
+    def progress(done, stage):
+        first.setdefault("at", time.perf_counter() - start)
+
+    reports.build_report(meta(report_id), dataset, LEVEL, QUALITY, stats, progress)
+    return first.get("at", 0.0)
+
+
+def build_in_memory(dataset, stats, report_id):
+    """Все строки в памяти, форматирование целиком, запись в конце"""
+    chunks = list(engine.annotated_chunks(dataset, LEVEL, QUALITY, stats, METHOD, 3))
+    merged = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+    lo, hi = reports.histogram_range(stats)
+    edges = np.linspace(lo, hi, reports.REPORT_HISTOGRAM_BINS + 1)
+    histogram = np.histogram(np.clip(merged["value"], lo, hi), bins=edges)[0]
+
+    data = io.StringIO()
+    data.write(reports.DATA_FILES["csv"][2])
+    np.savetxt(data, reports.rows_of(merged), fmt=reports.DATA_FILES["csv"][3])
+    anomalies = io.StringIO()
+    flagged = {name: column[merged["anomaly"]] for name, column in merged.items()}
+    np.savetxt(anomalies, reports.rows_of(flagged, with_anomaly=False), fmt=reports.ANOMALY_FORMAT)
+    path = os.path.join(tempfile.gettempdir(), f"{report_id}.anomalies")
+    with open(path, "w") as f:
+        f.write(anomalies.getvalue())
+    document = io.StringIO()
+    reports.write_document(document, dict(meta(report_id), created_at=""), engine.summarize(stats), histogram,
+                           edges, stats, reports.REPORT_FORMATS["Детальный отчет"], path, "data.csv")
+    os.remove(path)
+
+    target = reports.report_path(report_id)
+    os.makedirs(target, exist_ok=True)
+    first_byte = time.perf_counter()
+    with open(os.path.join(target, "data.csv"), "w") as f:
+        f.write(data.getvalue())
+    with open(os.path.join(target, reports.DOCUMENT), "w") as f:
+        f.write(document.getvalue())
+    return first_byte
+
+
+def measure_build(mode, dataset, stats):
+    report_id = reports.new_report_id()
+    start = time.perf_counter()
+    if mode == "streaming":
+        first = build_streaming(dataset, stats, report_id)
+    else:
+        first = build_in_memory(dataset, stats, report_id) - start
+    total = time.perf_counter() - start
+
+    tracemalloc.start()
+    (build_streaming if mode == "streaming" else build_in_memory)(dataset, stats, reports.new_report_id())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return report_id, {"first_data_s": round(first, 3), "build_s": round(total, 3),
+                       "peak_mb": round(peak / 2 ** 20, 1)}
+
+
+def fetch(port, path, headers=None):
+    """(время до первого байта тела, полное время, байт)"""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=600)
+    start = time.perf_counter()
+    connection.request("GET", path, headers=headers or {})
+    response = connection.getresponse()
+    first = response.read(1)
+    ttfb = time.perf_counter() - start
+    size = len(first)
+    while True:
+        block = response.read(1 << 20)
+        if not block:
+            break
+        size += len(block)
+    total = time.perf_counter() - start
+    connection.close()
+    return {"ttfb_ms": round(ttfb * 1000, 2), "total_ms": round(total * 1000, 1), "bytes": size,
+            "status": response.status}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    args = parser.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    web_app.redis_client = make_redis()
+    server = make_server("127.0.0.1", 0, web_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    for rows in args.rows:
+        dataset, stats = prepare_dataset(rows)
+        result = {"rows": rows}
+        for mode in ("streaming", "in-memory"):
+            report_id, result[mode] = measure_build(mode, dataset, stats)
+            if mode == "streaming":
+                streamed = report_id
+        size = reports.load_manifest(streamed)["files"]["data.csv"]["size"]
+        middle = size // 2
+        result["download"] = {
+            "stream": fetch(port, f"/reports/{streamed}/data.csv"),
+            "buffered": fetch(port, f"/bench/buffered/{streamed}/data.csv"),
+            "range_1mb": fetch(port, f"/reports/{streamed}/data.csv",
+                               {"Range": f"bytes={middle}-{middle + 2 ** 20 - 1}"}),
+        }
+        print(json.dumps(result, ensure_ascii=False), flush=True)
+        artifacts.delete_artifacts(f"bench-{rows}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Бенчмарк возобновляемого пайплайна: сколько одновременных пайплайнов держат N воркеров.
+
+Слоты воркера моделируются пулом из N потоков, пользователи отвечают на каждый
+запрос ввода через --think секунд. В режиме blocking шаг держит слот, пока ждет
+ответ (BLPOP); в режиме resumable шаг сохраняет чекпоинт и освобождает слот.
+Работа шагов ускорена через PIPELINE_TIME_SCALE, Redis — fakeredis или BENCH_REDIS_URL.
+
+    python bench/bench_resumable.py --workers 4 --pipelines 4 16 64 --think 0.5
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("PIPELINE_TIME_SCALE", "0.01")
+os.environ.setdefault("CELERY_BROKER_URL", "memory://")
+os.environ.setdefault("CELERY_RESULT_BACKEND", "cache+memory://")
+
+from common import make_redis, summarize  # noqa: E402
+
+import tasks  # noqa: E402
+from input_channel import push_input  # noqa: E402
+
+STEP_TASKS = [tasks.step1_data_preparation, tasks.step2_data_processing,
+              tasks.step3_data_analysis, tasks.step4_generate_report]
+
+
+def answer_for(request_input):
+    if request_input["input_type"] == "select":
+        return request_input["options"][0]
+    return "0.5"
+
+
+def run(mode, workers, pipelines, think):
+    redis_client = make_redis()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    started, finished = {}, {}
+    done = threading.Event()
+    lock = threading.Lock()
+
+    def deliver(request_input):
+        time.sleep(think)
+        value = answer_for(request_input)
+        if mode == "resumable":
+            pool.submit(tasks.resume_pipeline.apply, args=(request_input["task_id"], value))
+        else:
+            push_input(redis_client, request_input["task_id"], value)
+
+    def on_notification(task_name, result, status="success", error=None, request_input=None,
+                        progress_info=None, pipeline_id=None):
+        if status == "input_required":
+            threading.Thread(target=deliver, args=(request_input,), daemon=True).start()
+        elif status == "completed":
+            with lock:
+                finished[pipeline_id] = time.perf_counter()
+                if len(finished) == pipelines:
+                    done.set()
+        elif status == "error":
+            print(f"Ошибка в {task_name}: {result}")
+
+    def run_chain(prev_result, index=0):
+        # Каждый шаг цепочки — отдельная задача, занимающая слот до своего завершения
+        result = STEP_TASKS[index].apply(args=(prev_result,) if index else
+                                         (prev_result["data_size"], prev_result["pipeline_id"])).get()
+        if index + 1 < len(STEP_TASKS):
+            pool.submit(run_chain, result, index + 1)
+
+    tasks.send_notification = on_notification
+    tasks.get_redis_client = lambda: redis_client
+    tasks.schedule_input_timeout = lambda token, timeout: None
+    tasks.PIPELINE_MODE = mode
+
+    start = time.perf_counter()
+    for _ in range(pipelines):
+        pipeline_id = str(uuid.uuid4())
+        started[pipeline_id] = time.perf_counter()
+        if mode == "resumable":
+            pool.submit(tasks.run_interactive_pipeline.apply, args=(100, pipeline_id))
+        else:
+            pool.submit(run_chain, {"data_size": 100, "pipeline_id": pipeline_id})
+    done.wait(timeout=600)
+    elapsed = time.perf_counter() - start
+    pool.shutdown(wait=False)
+
+    report = summarize([finished[p] - started[p] for p in finished])
+    report.update({
+        "mode": mode,
+        "workers": workers,
+        "pipelines": pipelines,
+        "completed": len(finished),
+        "wall_s": round(elapsed, 2),
+        "pipelines_per_min": round(len(finished) / elapsed * 60, 1),
+    })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--pipelines", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--think", type=float, default=0.5)
+    args = parser.parse_args()
+
+    for mode in ("blocking", "resumable"):
+        for pipelines in args.pipelines:
+            print(json.dumps(run(mode, args.workers, pipelines, args.think), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Бенчмарк адресной рассылки: сообщения и CPU при сотнях клиентов и пайплайнов.
+
+Сравнивает прежнюю рассылку всем клиентам с отправкой в комнату пайплайна.
+Клиенты — тестовые клиенты Flask-SocketIO внутри одного процесса.
+
+    python bench/bench_rooms.py --clients 300 --pipelines 100 --events 20
+"""
+import argparse
+import contextlib
+import io
+import json
+import time
+
+from common import add_paths
+
+add_paths()
+
+import app as web  # noqa: E402
+
+
+def make_event(pipeline_id, i):
+    return {"task_name": "Обработка данных", "pipeline_id": pipeline_id, "result": f"{i}%",
+            "status": "progress", "progress_info": {"pipeline_id": pipeline_id, "current_step": 2,
+                                                    "total_steps": 4, "step_progress": i,
+                                                    "overall_progress": 25 + i / 4}}
+
+
+def run(mode, clients, pipelines, events):
+    pipeline_ids = [f"pipeline-{i}" for i in range(pipelines)]
+    test_clients = []
+    for i in range(clients):
+        client = web.socketio.test_client(web.app)
+        client.emit("subscribe", {"pipeline_id": pipeline_ids[i % pipelines]})
+        client.get_received()
+        test_clients.append(client)
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for i in range(events):
+        for pipeline_id in pipeline_ids:
+            event = make_event(pipeline_id, i)
+            if mode == "broadcast":
+                web.socketio.emit("task_update", event)
+            else:
+                web.dispatch_task_event(event)
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+    delivered = sum(sum(1 for m in c.get_received() if m["name"] == "task_update") for c in test_clients)
+    for client in test_clients:
+        client.disconnect()
+    return {
+        "mode": mode,
+        "clients": clients,
+        "pipelines": pipelines,
+        "events": events * pipelines,
+        "messages_sent": delivered,
+        "messages_per_event": round(delivered / (events * pipelines), 2),
+        "cpu_s": round(cpu, 3),
+        "wall_s": round(wall, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=300)
+    parser.add_argument("--pipelines", type=int, default=100)
+    parser.add_argument("--events", type=int, default=10)
+    args = parser.parse_args()
+
+    for mode in ("broadcast", "rooms"):
+        # Подавляем журнал подключений веб-приложения
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = run(mode, args.clients, args.pipelines, args.events)
+        print(json.dumps(report, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Бенчмарк очередей: задержка коротких задач, пока идут интерактивные пайплайны.
+
+Запускает --pipelines блокирующих пайплайнов, пользователи которых отвечают на
+каждый запрос через --think секунд, и во время их работы отправляет --tasks задач
+add, замеряя время от отправки до результата.
+
+shared — одна очередь celery и один воркер на --slots потоков: шаги, ждущие ввода,
+занимают слоты, и add стоит в очереди за ними. routed — TASK_ROUTING: шаги и запуск
+в своих очередях на --slots - --simple-slots потоков, add в очереди simple на
+--simple-slots потоков (число слотов то же). Потоки имитируют пул gevent; брокер
+memory://, Redis — fakeredis или BENCH_REDIS_URL.
+
+    python bench/bench_routing.py --pipelines 8 --slots 8 --simple-slots 2 --tasks 200
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+
+os.environ.setdefault("CELERY_BROKER_URL", "memory://")
+os.environ.setdefault("CELERY_RESULT_BACKEND", "cache+memory://")
+os.environ.setdefault("PIPELINE_TIME_SCALE", "0.01")
+os.environ.setdefault("WORKER_METRICS_PORT", "0")
+
+from common import make_redis, summarize  # noqa: E402
+
+import routing  # noqa: E402
+import tasks  # noqa: E402
+import tasks_simple  # noqa: E402
+from celery.contrib.testing.worker import start_worker  # noqa: E402
+from input_channel import push_input  # noqa: E402
+
+tasks.app.conf.broker_transport_options = {"polling_interval": 0.01}
+# Короткая задача регистрируется в приложении пайплайна под своим именем,
+# чтобы общий воркер режима shared мог ее выполнить
+add = tasks.app.task(name=tasks_simple.add.name)(tasks_simple.add.run)
+
+
+def answer_for(request_input):
+    if request_input["input_type"] == "select":
+        return request_input["options"][0]
+    return "0.5"
+
+
+def workers(mode, slots, simple_slots):
+    """Воркеры режима: один общий или по воркеру на группу очередей"""
+    common = {"pool": "threads", "perform_ping_check": False, "loglevel": "WARNING"}
+    if mode == "shared":
+        return [start_worker(tasks.app, concurrency=slots, **common)]
+    return [
+        start_worker(tasks.app, concurrency=slots - simple_slots, hostname="interactive@bench",
+                     queues=[routing.QUEUE_INTERACTIVE, routing.QUEUE_PIPELINES, routing.QUEUE_COMPUTE], **common),
+        start_worker(tasks.app, concurrency=simple_slots, hostname="simple@bench",
+                     queues=[routing.QUEUE_SIMPLE], **common),
+    ]
+
+
+def run(mode, pipelines, think, slots, simple_slots, count, interval):
+    redis_client = make_redis()
+    finished = threading.Event()
+    completed = []
+    lock = threading.Lock()
+
+    def deliver(request_input):
+        time.sleep(think)
+        push_input(redis_client, request_input["task_id"], answer_for(request_input))
+
+    def on_notification(task_name, result, status="success", error=None, request_input=None,
+                        progress_info=None, pipeline_id=None):
+        if status == "input_required":
+            threading.Thread(target=deliver, args=(request_input,), daemon=True).start()
+        elif status in ("completed", "error"):
+            with lock:
+                completed.append(pipeline_id)
+                if len(completed) == pipelines:
+                    finished.set()
+
+    tasks.send_notification = on_notification
+    tasks.get_redis_client = lambda: redis_client
+    tasks.PIPELINE_MODE = "blocking"
+    tasks.app.conf.task_routes = None
+    tasks.app.conf.task_annotations = None
+    routing.configure(tasks.app, enabled=(mode == "routed"))
+
+    with ExitStack() as stack:
+        for worker in workers(mode, slots, simple_slots):
+            stack.enter_context(worker)
+
+        start = time.perf_counter()
+        for _ in range(pipelines):
+            tasks.run_interactive_pipeline.delay(100, str(uuid.uuid4()))
+        time.sleep(think / 2)
+
+        latencies = []
+        for i in range(count):
+            sent = time.perf_counter()
+            add.delay(i, i).get(timeout=600, interval=0.005)
+            latencies.append(time.perf_counter() - sent)
+            time.sleep(interval)
+
+        finished.wait(timeout=600)
+        wall = time.perf_counter() - start
+
+    report = summarize(latencies)
+    report.update({"mode": mode, "pipelines": pipelines, "slots": slots,
+                   "pipelines_completed": len(completed), "pipelines_wall_s": round(wall, 2)})
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pipelines", type=int, default=8)
+    parser.add_argument("--think", type=float, default=1.0)
+    parser.add_argument("--slots", type=int, default=8)
+    parser.add_argument("--simple-slots", type=int, default=2)
+    parser.add_argument("--tasks", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=0.02, help="пауза между задачами add, с")
+    args = parser.parse_args()
+
+    for mode in ("shared", "routed"):
+        print(json.dumps(run(mode, args.pipelines, args.think, args.slots, args.simple_slots,
+                             args.tasks, args.interval), ensure_ascii=False), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Бенчмарк планировщика пайплайнов: пропускная способность и честность при многих пользователях.
+
+Один «тяжелый» пользователь в начале запускает --heavy пайплайнов одним пакетом,
+--tenants «легких» пользователей в течение --spread секунд запускают по --per-tenant
+пайплайнов. --slots потоков имитируют слоты воркеров: пайплайн занимает слот
+--duration секунд (±50%).
+
+fifo — прежний /start_pipeline: каждый запуск сразу уходит в очередь Celery, и легкие
+пользователи ждут, пока разберут пакет тяжелого. scheduler — app/scheduler.py с
+SCHEDULER_MAX_ACTIVE=--slots и лимитом --per-user на пользователя: допуск по честной
+очереди, освобождение места — по завершении. Для каждой группы выводятся ожидание
+запуска и полное время p50/p99 и общая пропускная способность. Лимит на пользователя
+меньше числа слотов оставляет слоты пустыми, когда работает один тяжелый пользователь,
+и снижает пропускную способность; при --per-user, равном --slots, очередь остается
+честной без простоя.
+Redis — fakeredis или BENCH_REDIS_URL.
+
+    python bench/bench_scheduler.py --heavy 200 --tenants 20 --per-tenant 5 --slots 8
+"""
+import argparse
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+
+from common import make_redis, summarize
+
+import scheduler  # noqa: E402
+
+
+class Cluster:
+    """Слоты воркеров, выполняющие пайплайны из очереди брокера в порядке FIFO"""
+
+    def __init__(self, slots, on_finish):
+        self.broker = queue.Queue()
+        self.on_finish = on_finish
+        self.threads = [threading.Thread(target=self.work, daemon=True) for _ in range(slots)]
+        for thread in self.threads:
+            thread.start()
+
+    def work(self):
+        while True:
+            job = self.broker.get()
+            if job is None:
+                return
+            job["started"] = time.perf_counter()
+            time.sleep(job["duration"])
+            job["finished"] = time.perf_counter()
+            self.on_finish(job)
+
+    def stop(self):
+        for _ in self.threads:
+            self.broker.put(None)
+        for thread in self.threads:
+            thread.join()
+
+
+def workload(heavy, tenants, per_tenant, spread, duration):
+    """Запуски (время отправки, пользователь, пайплайны)"""
+    def jobs(count):
+        return [{"pipeline_id": str(uuid.uuid4()), "data_size": 100,
+                 "duration": duration * random.uniform(0.5, 1.5)} for _ in range(count)]
+
+    submissions = [(0.0, "heavy", jobs(heavy))]
+    for tenant in range(tenants):
+        for _ in range(per_tenant):
+            submissions.append((random.uniform(0, spread), f"tenant-{tenant}", jobs(1)))
+    return sorted(submissions, key=lambda item: item[0])
+
+
+def run(mode, submissions, slots, per_user):
+    redis_client = make_redis()
+    redis_client.delete(*scheduler.KEYS)
+    scheduler.SCHEDULER_MAX_ACTIVE = slots
+    scheduler.SCHEDULER_MAX_PER_USER = per_user
+
+    jobs = {}
+    done = []
+    total = sum(len(batch) for _, _, batch in submissions)
+    finished = threading.Event()
+    lock = threading.Lock()
+
+    def start(admitted):
+        for item in admitted:
+            cluster.broker.put(jobs[item["pipeline_id"]])
+
+    def on_finish(job):
+        if mode == "scheduler":
+            start(scheduler.release(redis_client, job["pipeline_id"]))
+        with lock:
+            done.append(job)
+            if len(done) == total:
+                finished.set()
+
+    cluster = Cluster(slots, on_finish)
+    begin = time.perf_counter()
+    for offset, user, batch in submissions:
+        delay = begin + offset - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        for job in batch:
+            job = dict(job, user=user, submitted=time.perf_counter())
+            jobs[job["pipeline_id"]] = job
+            if mode == "fifo":
+                cluster.broker.put(job)
+        if mode == "scheduler":
+            start(scheduler.submit(redis_client, user, [jobs[job["pipeline_id"]] for job in batch]))
+
+    finished.wait(timeout=3600)
+    wall = time.perf_counter() - begin
+    cluster.stop()
+
+    report = {"mode": mode, "slots": slots, "per_user": per_user, "pipelines": total,
+              "pipelines_per_sec": round(total / wall, 2), "wall_s": round(wall, 2)}
+    for group in ("heavy", "tenants"):
+        selected = [job for job in done if (job["user"] == "heavy") == (group == "heavy")]
+        wait = summarize([job["started"] - job["submitted"] for job in selected])
+        report[group] = {"start_wait_p50_ms": wait["p50_ms"], "start_wait_p99_ms": wait["p99_ms"],
+                         "latency_p99_ms": summarize([job["finished"] - job["submitted"]
+                                                      for job in selected])["p99_ms"]}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--heavy", type=int, default=200)
+    parser.add_argument("--tenants", type=int, default=20)
+    parser.add_argument("--per-tenant", type=int, default=5)
+    parser.add_argument("--spread", type=float, default=2.0, help="секунд, за которые приходят легкие запуски")
+    parser.add_argument("--duration", type=float, default=0.1, help="средняя длительность пайплайна, с")
+    parser.add_argument("--slots", type=int, default=8)
+    parser.add_argument("--per-user", type=int, nargs="+", default=[4, 8])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    submissions = workload(args.heavy, args.tenants, args.per_tenant, args.spread, args.duration)
+    print(json.dumps(run("fifo", submissions, args.slots, args.slots), ensure_ascii=False), flush=True)
+    for per_user in args.per_user:
+        print(json.dumps(run("scheduler", submissions, args.slots, per_user), ensure_ascii=False), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Микробенчмарк форматов данных: байты и время кодирования/декодирования типичных данных.
+
+Данные: одно событие прогресса, пачка из --batch событий уведомлений, результаты
+шагов 2 и 3 (статистика движка по --rows строкам) в виде тела сообщения Celery,
+ответ пользователя из канала ввода и набор данных из --rows строк списками (так шаги
+передавали данные до артефактов) — на нем видно сжатие.
+
+Форматы: json (по умолчанию), msgpack и msgpack-zlib (сжатие от SERIALIZER_COMPRESS_MIN
+байт). Уведомления и ввод кодируются serialization.dumps, тела сообщений — через реестр
+kombu, как это делает Celery.
+
+    python bench/bench_serialization.py --batch 50 --rows 10000 --repeats 2000
+"""
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime
+
+from common import add_paths
+
+add_paths()
+
+import engine  # noqa: E402
+import serialization  # noqa: E402
+from celery import Celery  # noqa: E402
+from kombu import serialization as kombu_serialization  # noqa: E402
+
+FORMATS = {
+    "json": ("json", "none"),
+    "msgpack": ("msgpack", "none"),
+    "msgpack-zlib": ("msgpack", "zlib"),
+}
+
+
+def progress_event(pipeline_id, step, percent):
+    return {"task_name": f"Шаг {step}", "pipeline_id": pipeline_id, "result": f"Шаг {step}: {percent}%",
+            "status": "progress", "timestamp": datetime.now().isoformat(), "error": None, "request_input": None,
+            "progress_info": {"pipeline_id": pipeline_id, "current_step": step, "step_progress": percent,
+                              "overall_progress": (step - 1 + percent / 100) * 25, "delta": True}}
+
+
+def step_message(prev_result):
+    """Тело сообщения Celery: (args, kwargs, embed)"""
+    return [[prev_result], {}, {"callbacks": None, "errbacks": None, "chain": None, "chord": None}]
+
+
+def payloads(batch, rows):
+    pipeline_id = str(uuid.uuid4())
+    spec = engine.dataset_spec(rows)
+    stats = engine.process(spec, engine.cleaning_level("Быстрая обработка"), 0.9)
+    processed = {"processed": stats["count"], "original": rows, "quality_factor": 0.9,
+                 "processing_type": "Быстрая обработка", "dataset": spec, "stats": stats,
+                 "pipeline_id": pipeline_id}
+    analyzed = {"insights": 7, "anomalies": 12, "processed": stats["count"], "analysis_method": "Статистический",
+                "complexity_level": 0.5, "statistics": engine.summarize(stats), "pipeline_id": pipeline_id}
+    columns = {name: [] for name in engine.COLUMNS}
+    for chunk in engine.iter_chunks(spec):
+        for name in engine.COLUMNS:
+            columns[name].extend(chunk[name].tolist())
+
+    events = [progress_event(pipeline_id, 1 + i // 11, (i % 11) * 10) for i in range(batch)]
+    return [
+        ("progress_event", "notify", {"events": events[:1]}),
+        (f"notify_batch_{batch}", "notify", {"events": events}),
+        ("step2_message", "celery", step_message(processed)),
+        ("step3_message", "celery", step_message(analyzed)),
+        ("user_input", "notify", "Детальный отчет"),
+        (f"inline_dataset_{rows}", "celery", step_message({"dataset": columns, "pipeline_id": pipeline_id})),
+    ]
+
+
+def codec(kind, fmt):
+    serializer, compression = FORMATS[fmt]
+    if kind == "notify":
+        return (lambda obj: serialization.dumps(obj, serializer, compression)), serialization.loads
+
+    name = {"json": "json", "msgpack": "msgpack", "msgpack-zlib": serialization.COMPRESSED_SERIALIZER}[fmt]
+
+    def encode(obj):
+        return kombu_serialization.dumps(obj, serializer=name)
+
+    def decode(message):
+        content_type, encoding, data = message
+        return kombu_serialization.loads(data, content_type, encoding, accept={content_type})
+    return encode, decode
+
+
+def size(kind, encoded):
+    data = encoded[2] if kind == "celery" else encoded
+    return len(data.encode() if isinstance(data, str) else data)
+
+
+def measure(kind, fmt, payload, repeats):
+    encode, decode = codec(kind, fmt)
+    encoded = encode(payload)
+    assert json.dumps(decode(encoded), sort_keys=True) == json.dumps(json.loads(json.dumps(payload)), sort_keys=True)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        encode(payload)
+    encode_us = (time.perf_counter() - start) / repeats * 1e6
+    start = time.perf_counter()
+    for _ in range(repeats):
+        decode(encoded)
+    decode_us = (time.perf_counter() - start) / repeats * 1e6
+    return {"bytes": size(kind, encoded), "encode_us": round(encode_us, 2), "decode_us": round(decode_us, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch", type=int, default=50)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeats", type=int, default=2000)
+    args = parser.parse_args()
+
+    # Регистрирует сериализатор msgpack-zlib в kombu
+    serialization.configure(Celery("bench_serialization", broker="memory://"))
+    for name, kind, payload in payloads(args.batch, args.rows):
+        # Большие данные кодируются долго: меньше повторов
+        repeats = max(5, args.repeats // 200) if name.startswith("inline") else args.repeats
+        report = {"payload": name}
+        for fmt in FORMATS:
+            report[fmt] = measure(kind, fmt, payload, repeats)
+        print(json.dumps(report, ensure_ascii=False), flush=True)
+
+
+if __name__ == "__main__":
+    main()
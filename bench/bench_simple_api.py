@@ -0,0 +1,145 @@
+"""Бенчмарк API app_simple: пропускная способность и занятость потоков сервера.
+
+Сравнивает синхронный /execute_task (поток ждет result.get) с асинхронным API:
+POST /tasks + long-polling GET /tasks/<id>?wait=N и пакетной отправкой /tasks/batch.
+Воркер Celery запускается в том же процессе (пул потоков); брокер — BENCH_REDIS_URL
+или memory://.
+
+    python bench/bench_simple_api.py --clients 20 --tasks 100 --sleep 1
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+
+from common import BENCH_REDIS_URL, make_redis
+
+os.environ.setdefault("CELERY_BROKER_URL", BENCH_REDIS_URL or "memory://")
+os.environ.setdefault("CELERY_RESULT_BACKEND", BENCH_REDIS_URL or "cache+memory://")
+# Одинаковые запросы здесь — разные задачи: дедупликация мерится в bench_idempotency.py
+os.environ.setdefault("IDEMPOTENCY", "false")
+
+import tasks_simple  # noqa: E402
+
+# Приложение Celery уже создано с cache+memory://; веб-приложению нужен URL Redis
+# только для клиента, который сразу заменяется на fakeredis
+backend = os.environ["CELERY_RESULT_BACKEND"]
+os.environ["CELERY_RESULT_BACKEND"] = BENCH_REDIS_URL or "redis://localhost:6379/0"
+import app_simple  # noqa: E402
+os.environ["CELERY_RESULT_BACKEND"] = backend
+from celery.contrib.testing.worker import start_worker  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+
+class Occupancy:
+    """WSGI-обертка: суммарное время, которое потоки сервера провели в обработчиках"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.busy = 0.0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        start = time.perf_counter()
+        try:
+            return self.wsgi_app(environ, start_response)
+        finally:
+            with self.lock:
+                self.busy += time.perf_counter() - start
+                self.requests += 1
+
+
+def call(url, path, payload=None):
+    data = json.dumps(payload).encode() if payload is not None else None
+    request = urllib.request.Request(url + path, data=data, headers={"Content-Type": "application/json"})
+    return json.loads(urllib.request.urlopen(request, timeout=120).read())
+
+
+def client_sync(url, payload):
+    call(url, "/execute_task", payload)
+
+
+def client_async(url, payload):
+    task_id = call(url, "/tasks", payload)["task_id"]
+    while not call(url, f"/tasks/{task_id}?wait=25")["ready"]:
+        pass
+
+
+def client_poll(url, payload):
+    # Короткий опрос без ожидания на сервере: потоки не заняты между запросами
+    task_id = call(url, "/tasks", payload)["task_id"]
+    while not call(url, f"/tasks/{task_id}")["ready"]:
+        time.sleep(0.2)
+
+
+CLIENTS = {"sync": client_sync, "async": client_async, "poll": client_poll}
+
+
+def run(mode, url, occupancy, clients, tasks, payload):
+    occupancy.busy, occupancy.requests = 0.0, 0
+    counter = iter(range(tasks))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            CLIENTS[mode](url, payload)
+
+    start = time.perf_counter()
+    if mode == "batch":
+        task_ids = call(url, "/tasks/batch", {"tasks": [payload] * tasks})["task_ids"]
+        while not all(r["ready"] for r in call(url, "/tasks/results?wait=25", {"task_ids": task_ids})["results"]):
+            pass
+    else:
+        threads = [threading.Thread(target=worker) for _ in range(clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "mode": mode,
+        "task": payload["task"],
+        "tasks": tasks,
+        "tasks_per_sec": round(tasks / elapsed, 1),
+        "http_requests": occupancy.requests,
+        "thread_seconds_per_task": round(occupancy.busy / tasks, 4),
+        "avg_busy_threads": round(occupancy.busy / elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--tasks", type=int, default=60)
+    parser.add_argument("--sleep", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    app_simple.redis_client = make_redis()
+    occupancy = Occupancy(app_simple.app.wsgi_app)
+    app_simple.app.wsgi_app = occupancy
+    server = make_server("127.0.0.1", 0, app_simple.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    workloads = [{"task": "sleep", "seconds": args.sleep}, {"task": "add", "x": 2, "y": 3}]
+    with start_worker(tasks_simple.app, pool="threads", concurrency=args.concurrency,
+                      perform_ping_check=False, loglevel="WARNING"):
+        for payload in workloads:
+            for mode in ("sync", "async", "poll", "batch"):
+                print(json.dumps(run(mode, url, occupancy, args.clients, args.tasks, payload),
+                                 ensure_ascii=False))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Нагрузочный тест Socket.IO-сервера: удерживаемые сокеты, память на соединение, задержка emit.
+
+Запускает web/app.py в старом режиме (Werkzeug, потоки) и в новом (gunicorn + gevent),
+подключает N клиентов по WebSocket и рассылает события через POST /task_result.
+Нужны пакеты python-socketio[asyncio_client], gunicorn и gevent.
+
+    python bench/bench_sockets.py --clients 1000 --emits 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+from common import ROOT, summarize
+
+MODES = {
+    "threading": [sys.executable, "app.py"],
+    "gevent": [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+}
+
+
+def tree_rss_kb(pid):
+    """RSS процесса и его потомков (воркеры gunicorn) в КБ"""
+    total = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pids.extend(int(p) for p in f.read().split())
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def wait_ready(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"{url}/socket.io/?EIO=4&transport=polling", timeout=1)
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError("Сервер не запустился")
+
+
+def post_event(url, payload):
+    request = urllib.request.Request(f"{url}/task_result", data=json.dumps(payload).encode(),
+                                     headers={"Content-Type": "application/json"})
+    urllib.request.urlopen(request, timeout=30).read()
+
+
+async def drive(url, clients, emits, server_pid):
+    import socketio
+
+    received = {}
+    sockets = []
+
+    async def connect_one():
+        sio = socketio.AsyncClient(reconnection=False)
+
+        @sio.on("task_update")
+        async def on_update(data):
+            received.setdefault(data["result"], []).append(time.time())
+
+        await sio.connect(url, transports=["websocket"], wait_timeout=30)
+        sockets.append(sio)
+
+    idle_rss = tree_rss_kb(server_pid)
+
+    # Подключаемся порциями, чтобы не упереться в backlog сервера
+    for start in range(0, clients, 100):
+        batch = range(start, min(clients, start + 100))
+        results = await asyncio.gather(*(connect_one() for _ in batch), return_exceptions=True)
+        if all(isinstance(r, Exception) for r in results):
+            break
+
+    connected = len(sockets)
+    loaded_rss = tree_rss_kb(server_pid)
+
+    latencies = []
+    loop = asyncio.get_running_loop()
+    for i in range(emits):
+        key = f"emit-{i}"
+        sent = time.time()
+        payload = {"task_name": "bench", "result": key, "status": "progress"}
+        await loop.run_in_executor(None, post_event, url, payload)
+        deadline = time.time() + 30
+        while len(received.get(key, [])) < connected and time.time() < deadline:
+            await asyncio.sleep(0.01)
+        latencies.extend(t - sent for t in received.get(key, []))
+
+    await asyncio.gather(*(s.disconnect() for s in sockets), return_exceptions=True)
+
+    report = summarize(latencies)
+    report.update({
+        "sockets_held": connected,
+        "server_rss_mb": round(loaded_rss / 1024, 1),
+        "kb_per_connection": round((loaded_rss - idle_rss) / max(connected, 1), 1),
+    })
+    return report
+
+
+def run(mode, clients, emits, port):
+    env = dict(os.environ, WEB_ASYNC_MODE=mode, WEB_PORT=str(port), WEB_DEBUG="false")
+    server = subprocess.Popen(MODES[mode], cwd=os.path.join(ROOT, "web"), env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(url)
+        report = {"mode": mode, "clients_requested": clients}
+        report.update(asyncio.run(drive(url, clients, emits, server.pid)))
+        return report
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--emits", type=int, default=10)
+    parser.add_argument("--modes", nargs="+", default=["threading", "gevent"])
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        print(json.dumps(run(mode, args.clients, args.emits, args.port), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Бенчмарк запуска: время импорта и время до готовности веб-приложений и воркеров.
+
+Импорт — python -X importtime -c "import <модуль>" в отдельном процессе: общее время
+модуля, самые дорогие прямые импорты и какие тяжелые модули (NumPy, код задач)
+загружаются при старте. Готовность веб-приложения — от запуска процесса до первого
+ответа GET /, воркера — до строки «ready» в логе Celery (брокер memory://, пул solo).
+Берется медиана --repeats прогонов.
+
+Порог регрессии: с --baseline отчет сравнивается с прошлым (--output); если время
+выросло больше чем на --tolerance или веб-приложение снова загружает модули из
+WEB_FORBIDDEN, скрипт завершается с кодом 1.
+
+    python bench/bench_startup.py --repeats 5 --output startup.json
+    python bench/bench_startup.py --repeats 5 --baseline startup.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+from common import ROOT
+
+APP_DIR = os.path.join(ROOT, "app")
+WEB_DIR = os.path.join(ROOT, "web")
+
+# (каталог, модуль, команда запуска, как понять готовность)
+TARGETS = {
+    "web": (WEB_DIR, "app", ["app.py"], "http"),
+    "web_simple": (WEB_DIR, "app_simple", ["app_simple.py"], "http"),
+    "worker": (APP_DIR, "tasks", ["-m", "celery", "-A", "tasks", "worker"], "log"),
+    "worker_simple": (APP_DIR, "tasks_simple", ["-m", "celery", "-A", "tasks_simple", "worker"], "log"),
+}
+WORKER_ARGS = ["--pool", "solo", "--loglevel", "INFO", "--without-mingle", "--without-gossip",
+               "--without-heartbeat"]
+# Модули, которые стоит видеть в отчете
+WATCHED = ("numpy", "engine", "reports", "tasks", "tasks_simple", "requests", "redis", "msgpack", "celery",
+           "flask_socketio", "prometheus_client")
+# Веб-приложения отправляют задачи по имени и не должны загружать их код и NumPy
+WEB_FORBIDDEN = ("numpy", "engine", "tasks", "tasks_simple")
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def environment(port):
+    env = dict(os.environ, CELERY_BROKER_URL="memory://", CELERY_RESULT_BACKEND="redis://localhost:6379/0",
+               WORKER_METRICS_PORT="0", WEB_ASYNC_MODE="threading", WEB_HOST="127.0.0.1", WEB_PORT=str(port),
+               NOTIFY_TRANSPORT="http", PYTHONUNBUFFERED="1")
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    return env
+
+
+def free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def import_profile(target):
+    """(общее время импорта в мс, {прямой импорт: мс}, загруженные модули из WATCHED)"""
+    cwd, module, _, _ = TARGETS[target]
+    # Путь к app/ веб-приложение добавляет само (sys.path.append('../app'))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=cwd,
+                            env=environment(0), capture_output=True, text=True, check=True)
+    total, children, loaded = 0, {}, set()
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        cumulative, depth, name = int(match[2]), len(match[3]) // 2, match[4]
+        if name.split(".")[0] in WATCHED:
+            loaded.add(name.split(".")[0])
+        if depth == 0 and name == module:
+            total = cumulative
+        elif depth == 1:
+            children[name] = children.get(name, 0) + cumulative
+    return total / 1000, {name: us / 1000 for name, us in children.items()}, loaded
+
+
+def time_to_ready(target, timeout=60):
+    cwd, _, command, probe = TARGETS[target]
+    port = free_port()
+    args = [sys.executable] + command + (WORKER_ARGS if probe == "log" else [])
+    start = time.perf_counter()
+    process = subprocess.Popen(args, cwd=cwd, env=environment(port), stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, text=True)
+    try:
+        if probe == "log":
+            for line in process.stdout:
+                if "ready." in line:
+                    return time.perf_counter() - start
+            raise RuntimeError(f"{target}: процесс завершился, не дождавшись готовности")
+        while time.perf_counter() - start < timeout:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1).read()
+                return time.perf_counter() - start
+            except OSError:
+                if process.poll() is not None:
+                    raise RuntimeError(f"{target}: процесс завершился с кодом {process.returncode}")
+                time.sleep(0.01)
+        raise RuntimeError(f"{target}: нет ответа за {timeout} с")
+    finally:
+        process.kill()
+        process.wait()
+
+
+def measure(target, repeats):
+    imports, ready, children, loaded = [], [], {}, set()
+    for _ in range(repeats):
+        total, direct, modules = import_profile(target)
+        imports.append(total)
+        for name, ms in direct.items():
+            children.setdefault(name, []).append(ms)
+        loaded |= modules
+        ready.append(time_to_ready(target))
+    heaviest = sorted(((statistics.median(v), k) for k, v in children.items()), reverse=True)[:8]
+    return {
+        "import_ms": round(statistics.median(imports), 1),
+        "ready_s": round(statistics.median(ready), 3),
+        "heaviest_imports_ms": {name: round(ms, 1) for ms, name in heaviest},
+        "loaded": sorted(loaded),
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Метрики, выросшие больше чем на tolerance, и запрещенные модули веб-приложений"""
+    regressions = []
+    for target, current in report["targets"].items():
+        old = baseline.get("targets", {}).get(target)
+        for metric in ("import_ms", "ready_s"):
+            if old and old.get(metric) and current[metric] > old[metric] * (1 + tolerance):
+                regressions.append({"metric": f"{target}.{metric}", "baseline": old[metric],
+                                    "current": current[metric],
+                                    "change": round(current[metric] / old[metric] - 1, 3)})
+    for target in ("web", "web_simple"):
+        forbidden = sorted(set(report["targets"].get(target, {}).get("loaded", [])) & set(WEB_FORBIDDEN))
+        if forbidden:
+            regressions.append({"metric": f"{target}.loaded", "current": forbidden})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--targets", nargs="+", choices=list(TARGETS), default=list(TARGETS))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="файл для отчета (JSON)")
+    parser.add_argument("--baseline", help="отчет прошлого прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    report = {"python": sys.version.split()[0], "repeats": args.repeats, "targets": {}}
+    for target in args.targets:
+        report["targets"][target] = measure(target, args.repeats)
+        print(json.dumps({"target": target, **report["targets"][target]}, ensure_ascii=False), flush=True)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report["regressions"] = compare(report, baseline, args.tolerance)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if report["regressions"]:
+        print(json.dumps({"regressions": report["regressions"]}, ensure_ascii=False))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Общие утилиты бенчмарков: подключение к Redis и подсчет команд."""
+import os
+import sys
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def add_paths():
+    """Добавляет app и web в sys.path (повторный вызов ничего не меняет)"""
+    for name in ('app', 'web'):
+        path = os.path.join(ROOT, name)
+        if path not in sys.path:
+            sys.path.append(path)
+
+
+add_paths()
+
+BENCH_REDIS_URL = os.environ.get("BENCH_REDIS_URL")
+
+
+class CommandCounter:
+    """Считает команды, отправленные в Redis (включая команды в pipeline)"""
+
+    def __init__(self):
+        self.count = 0
+        self.by_command = {}
+
+    def add(self, name, n=1):
+        name = str(name).upper()
+        self.count += n
+        self.by_command[name] = self.by_command.get(name, 0) + n
+
+
+def make_redis(counter=None):
+    """Создает клиент Redis: локальный сервер из BENCH_REDIS_URL или fakeredis.
+
+    Все клиенты, созданные в одном процессе, разделяют один fakeredis-сервер.
+    """
+    if BENCH_REDIS_URL:
+        import redis
+        base = redis.Redis
+        kwargs = {}
+    else:
+        import fakeredis
+        base = fakeredis.FakeRedis
+        kwargs = {"server": _fake_server()}
+
+    if counter is None:
+        return base.from_url(BENCH_REDIS_URL) if BENCH_REDIS_URL else base(**kwargs)
+
+    class CountingRedis(base):
+        def execute_command(self, *args, **options):
+            counter.add(args[0])
+            return super().execute_command(*args, **options)
+
+        def pipeline(self, *args, **kw):
+            pipe = super().pipeline(*args, **kw)
+            original = pipe.execute
+
+            def execute(*a, **k):
+                for cmd_args, _ in pipe.command_stack:
+                    counter.add(cmd_args[0])
+                return original(*a, **k)
+
+            pipe.execute = execute
+            return pipe
+
+    if BENCH_REDIS_URL:
+        return CountingRedis.from_url(BENCH_REDIS_URL)
+    return CountingRedis(**kwargs)
+
+
+_server = None
+
+
+def _fake_server():
+    global _server
+    if _server is None:
+        import fakeredis
+        _server = fakeredis.FakeServer()
+    return _server
+
+
+def percentile(values, p):
+    """Перцентиль p (0-100) методом ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def summarize(values):
+    """p50/p95/p99/mean в миллисекундах для списка длительностей в секундах"""
+    ms = [v * 1000 for v in values]
+    return {
+        "count": len(ms),
+        "mean_ms": round(statistics.fmean(ms), 3) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+    }
@@ -0,0 +1,455 @@
+"""Сквозной нагрузочный тест web + воркер: пайплайны, всплески add/echo, клиенты Socket.IO.
+
+Поднимает web/app.py, web/app_simple.py и воркер Celery и гоняет три нагрузки:
+
+*   pipelines — одновременные интерактивные пайплайны: клиент Socket.IO запускает
+    пайплайн через /start_pipeline и отвечает на каждый request_input через --think секунд;
+*   burst — всплеск задач add/echo через POST /tasks + GET /tasks/<id>?wait;
+*   sockets — много клиентов Socket.IO в комнате одного пайплайна, события через /task_results.
+
+С BENCH_REDIS_URL веб-приложения и воркер запускаются отдельными процессами против
+этого Redis (--web-mode threading или gevent). Без него все работает в одном процессе:
+брокер memory://, Redis — fakeredis, sweeper таймаутов ввода не запускается.
+
+Отчет (пропускная способность, p50/p95/p99, операции Redis, RSS) пишется в JSON
+(--output). С --baseline отчет сравнивается с прошлым прогоном: если метрика хуже
+больше чем на --tolerance, скрипт завершается с кодом 1.
+
+    python bench/loadtest.py --pipelines 20 --burst 500 --sockets 200 --output run.json
+    python bench/loadtest.py --baseline run.json --tolerance 0.25
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from common import BENCH_REDIS_URL, ROOT, CommandCounter, make_redis, summarize
+from bench_sockets import MODES, tree_rss_kb, wait_ready
+
+os.environ.setdefault("PIPELINE_TIME_SCALE", "0.01")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def call(url, path, payload=None, timeout=120):
+    data = json.dumps(payload).encode() if payload is not None else None
+    request = urllib.request.Request(url + path, data=data, headers={"Content-Type": "application/json"})
+    return json.loads(urllib.request.urlopen(request, timeout=timeout).read())
+
+
+def own_rss_kb(field="VmRSS"):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def answer_for(request_input):
+    if request_input["input_type"] == "select":
+        return request_input["options"][0]
+    return "0.5"
+
+
+# Стенд
+
+class ProcessStack:
+    """Веб-приложения и воркеры — отдельные процессы против BENCH_REDIS_URL"""
+
+    def __init__(self, web_mode, concurrency):
+        self.web_mode = web_mode
+        self.concurrency = concurrency
+        self.redis = make_redis()
+        self.processes = {}
+        self.web_url = f"http://127.0.0.1:{free_port()}"
+        self.simple_url = f"http://127.0.0.1:{free_port()}"
+        self.env = dict(os.environ, CELERY_BROKER_URL=BENCH_REDIS_URL, CELERY_RESULT_BACKEND=BENCH_REDIS_URL,
+                        WEB_APP_URL=self.web_url, WEB_ASYNC_MODE=web_mode, WEB_DEBUG="false")
+
+    def _spawn(self, name, command, cwd, **env):
+        self.processes[name] = subprocess.Popen(command, cwd=os.path.join(ROOT, cwd), env=dict(self.env, **env),
+                                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def start(self):
+        self._spawn("web", MODES[self.web_mode], "web", WEB_PORT=self.web_url.rsplit(":", 1)[1])
+        self._spawn("web_simple", [sys.executable, "app_simple.py"], "web",
+                    WEB_PORT=self.simple_url.rsplit(":", 1)[1])
+        wait_ready(self.web_url)
+        for _ in range(150):
+            try:
+                urllib.request.urlopen(self.simple_url + "/", timeout=1)
+                break
+            except Exception:
+                time.sleep(0.2)
+
+    def worker(self, module):
+        stack = self
+
+        class Worker:
+            def __enter__(self):
+                stack._spawn("worker", [sys.executable, "-m", "celery", "-A", module, "worker", "--pool", "threads",
+                                        "--concurrency", str(stack.concurrency), "--loglevel", "WARNING"], "app")
+                time.sleep(3)
+
+            def __exit__(self, *exc):
+                process = stack.processes.pop("worker")
+                process.terminate()
+                process.wait(timeout=30)
+
+        return Worker()
+
+    def redis_ops(self):
+        return self.redis.info("stats")["total_commands_processed"]
+
+    def rss_mb(self):
+        return {name: round(tree_rss_kb(p.pid) / 1024, 1) for name, p in self.processes.items()}
+
+    def stop(self):
+        for process in self.processes.values():
+            process.terminate()
+            process.wait(timeout=30)
+
+
+class InProcessStack:
+    """Все в одном процессе: memory://, fakeredis, серверы Werkzeug в потоках"""
+
+    def __init__(self, web_mode, concurrency):
+        self.concurrency = concurrency
+        self.counter = CommandCounter()
+        web_port, simple_port = free_port(), free_port()
+        self.web_url = f"http://127.0.0.1:{web_port}"
+        self.simple_url = f"http://127.0.0.1:{simple_port}"
+        os.environ.update(CELERY_BROKER_URL="memory://", CELERY_RESULT_BACKEND="cache+memory://",
+                          WEB_APP_URL=self.web_url, WEB_ASYNC_MODE="threading")
+        self.ports = (web_port, simple_port)
+        self.servers = []
+
+    def start(self):
+        import tasks
+        import tasks_simple
+        from werkzeug.serving import make_server
+
+        # Приложения Celery уже созданы с cache+memory://; веб-приложению нужен URL Redis
+        # только для клиента, который сразу заменяется на fakeredis
+        os.environ["CELERY_RESULT_BACKEND"] = "redis://localhost:6379/0"
+        import app as web_app
+        import app_simple
+        os.environ["CELERY_RESULT_BACKEND"] = "cache+memory://"
+
+        redis_client = make_redis(self.counter)
+        web_app.redis_client = redis_client
+        app_simple.redis_client = redis_client
+        tasks.get_redis_client = lambda: redis_client
+        for celery_app in (tasks.app, tasks_simple.app):
+            celery_app.conf.broker_transport_options = {"polling_interval": 0.01}
+        self.apps = {"tasks": tasks.app, "tasks_simple": tasks_simple.app}
+
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        for wsgi_app, port in zip((web_app.app, app_simple.app), self.ports):
+            server = make_server("127.0.0.1", port, wsgi_app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self.servers.append(server)
+
+    def worker(self, module):
+        from celery.contrib.testing.worker import start_worker
+        return start_worker(self.apps[module], pool="threads", concurrency=self.concurrency,
+                            perform_ping_check=False, loglevel="WARNING")
+
+    def redis_ops(self):
+        return self.counter.count
+
+    def rss_mb(self):
+        return {"process": round(own_rss_kb() / 1024, 1), "process_peak": round(own_rss_kb("VmHWM") / 1024, 1)}
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+
+
+# Нагрузки
+
+def run_pipeline(url, data_size, think, metrics, lock):
+    import socketio
+
+    sio = socketio.Client(reconnection=False)
+    connected, done = threading.Event(), threading.Event()
+    state = {"answered_at": None, "status": None}
+
+    def answer(request_input):
+        time.sleep(think)
+        start = time.perf_counter()
+        state["answered_at"] = start
+        call(url, "/submit_input", {"task_id": request_input["task_id"], "input": answer_for(request_input)})
+        with lock:
+            metrics["submit"].append(time.perf_counter() - start)
+
+    @sio.on("connected")
+    def on_connected(data):
+        state["session_id"] = data["session_id"]
+        connected.set()
+
+    @sio.on("task_update")
+    def on_update(data):
+        now = time.perf_counter()
+        with lock:
+            if state["answered_at"] is not None:
+                metrics["resume"].append(now - state["answered_at"])
+            if data.get("timestamp"):
+                metrics["event_age"].append(max(0.0, time.time() - datetime.fromisoformat(data["timestamp"]).timestamp()))
+        state["answered_at"] = None
+        status = data.get("status")
+        if status == "input_required":
+            threading.Thread(target=answer, args=(data["request_input"],), daemon=True).start()
+        elif status in ("completed", "error"):
+            state["status"] = status
+            done.set()
+
+    sio.connect(url, wait_timeout=30)
+    try:
+        connected.wait(30)
+        start = time.perf_counter()
+        call(url, "/start_pipeline", {"data_size": data_size, "session_id": state["session_id"]})
+        done.wait(600)
+        with lock:
+            if state["status"] == "completed":
+                metrics["pipeline"].append(time.perf_counter() - start)
+            else:
+                metrics["failed"] += 1
+    finally:
+        sio.disconnect()
+
+
+def workload_pipelines(stack, pipelines, data_size, think):
+    metrics = {"pipeline": [], "submit": [], "resume": [], "event_age": [], "failed": 0}
+    lock = threading.Lock()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=pipelines) as pool:
+        for future in [pool.submit(run_pipeline, stack.web_url, data_size, think, metrics, lock)
+                       for _ in range(pipelines)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    report = summarize(metrics["pipeline"])
+    report.update({
+        "pipelines": pipelines,
+        "failed": metrics["failed"],
+        "pipelines_per_sec": round(len(metrics["pipeline"]) / elapsed, 3),
+        "submit_input": summarize(metrics["submit"]),
+        "input_to_next_event": summarize(metrics["resume"]),
+        "event_age": summarize(metrics["event_age"]),
+    })
+    return report, len(metrics["pipeline"])
+
+
+def workload_burst(stack, tasks, clients):
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(tasks))
+
+    def client():
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            payload = {"task": "add", "x": index, "y": 1} if index % 2 else {"task": "echo", "message": str(index)}
+            start = time.perf_counter()
+            task_id = call(stack.simple_url, "/tasks", payload)["task_id"]
+            while not call(stack.simple_url, f"/tasks/{task_id}?wait=25")["ready"]:
+                pass
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    report = summarize(latencies)
+    report.update({"tasks": tasks, "clients": clients, "tasks_per_sec": round(len(latencies) / elapsed, 1)})
+    return report, len(latencies)
+
+
+def workload_sockets(stack, clients, emits):
+    return asyncio.run(drive_sockets(stack.web_url, clients, emits))
+
+
+async def drive_sockets(url, clients, emits):
+    import socketio
+
+    room = "loadtest-room"
+    received = {}
+    sockets = []
+
+    async def connect_one():
+        sio = socketio.AsyncClient(reconnection=False)
+        subscribed = asyncio.Event()
+
+        @sio.on("task_update")
+        async def on_update(data):
+            received.setdefault(data["result"], []).append(time.perf_counter())
+
+        @sio.on("subscribed")
+        async def on_subscribed(data):
+            subscribed.set()
+
+        await sio.connect(url, wait_timeout=30)
+        await sio.emit("subscribe", {"pipeline_id": room})
+        await asyncio.wait_for(subscribed.wait(), 30)
+        sockets.append(sio)
+
+    start = time.perf_counter()
+    for first in range(0, clients, 100):
+        await asyncio.gather(*(connect_one() for _ in range(first, min(clients, first + 100))),
+                             return_exceptions=True)
+    connect_s = time.perf_counter() - start
+
+    latencies = []
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    for i in range(emits):
+        key = f"emit-{i}"
+        sent = time.perf_counter()
+        event = {"task_name": "loadtest", "pipeline_id": room, "result": key, "status": "progress"}
+        await loop.run_in_executor(None, call, url, "/task_results", {"events": [event]})
+        deadline = time.perf_counter() + 30
+        while len(received.get(key, [])) < len(sockets) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.005)
+        latencies.extend(t - sent for t in received.get(key, []))
+    elapsed = time.perf_counter() - start
+
+    await asyncio.gather(*(s.disconnect() for s in sockets), return_exceptions=True)
+    report = summarize(latencies)
+    report.update({
+        "clients": clients,
+        "connected": len(sockets),
+        "connects_per_sec": round(len(sockets) / connect_s, 1),
+        "deliveries_per_sec": round(len(latencies) / elapsed, 1),
+    })
+    return report, len(latencies)
+
+
+def measured(stack, name, func, *args):
+    ops_before = stack.redis_ops()
+    start = time.perf_counter()
+    report, operations = func(stack, *args)
+    report["wall_s"] = round(time.perf_counter() - start, 2)
+    report["redis_ops"] = stack.redis_ops() - ops_before
+    report["redis_ops_per_op"] = round(report["redis_ops"] / max(operations, 1), 2)
+    report["rss_mb"] = stack.rss_mb()
+    print(json.dumps({name: report}, ensure_ascii=False), flush=True)
+    return report
+
+
+# Сравнение с прошлым прогоном
+
+def flatten(report, prefix=""):
+    for key, value in report.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+
+def direction(metric):
+    """1 — больше лучше, -1 — меньше лучше, 0 — метрика не сравнивается"""
+    name = metric.rsplit(".", 1)[-1]
+    if name.endswith("_per_sec"):
+        return 1
+    if name in ("p50_ms", "p95_ms", "p99_ms", "redis_ops_per_op") or ".rss_mb." in metric:
+        return -1
+    return 0
+
+
+def compare(report, baseline, tolerance):
+    """Список метрик, ухудшившихся больше чем на tolerance (доля)"""
+    current = dict(flatten(report["workloads"]))
+    regressions = []
+    for metric, old in flatten(baseline["workloads"]):
+        sign = direction(metric)
+        if not sign or metric not in current or not old:
+            continue
+        change = (current[metric] - old) / old * sign
+        if change < -tolerance:
+            regressions.append({"metric": metric, "baseline": old, "current": current[metric],
+                                "change": round(change, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pipelines", type=int, default=10)
+    parser.add_argument("--data-size", type=int, default=10000)
+    parser.add_argument("--think", type=float, default=0.1)
+    parser.add_argument("--burst", type=int, default=300)
+    parser.add_argument("--burst-clients", type=int, default=20)
+    parser.add_argument("--sockets", type=int, default=100)
+    parser.add_argument("--emits", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16, help="потоков воркера")
+    parser.add_argument("--web-mode", choices=sorted(MODES), default="threading")
+    parser.add_argument("--workloads", nargs="+", default=["burst", "sockets", "pipelines"])
+    parser.add_argument("--output", help="файл JSON-отчета")
+    parser.add_argument("--baseline", help="отчет прошлого прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    stack = (ProcessStack if BENCH_REDIS_URL else InProcessStack)(args.web_mode, args.concurrency)
+    stack.start()
+    workloads = {}
+    try:
+        # Задачи пайплайна и простые задачи зарегистрированы в разных приложениях Celery,
+        # поэтому воркер каждой нагрузки свой
+        if "burst" in args.workloads:
+            with stack.worker("tasks_simple"):
+                workloads["burst"] = measured(stack, "burst", workload_burst, args.burst, args.burst_clients)
+        if "sockets" in args.workloads:
+            workloads["sockets"] = measured(stack, "sockets", workload_sockets, args.sockets, args.emits)
+        if "pipelines" in args.workloads:
+            with stack.worker("tasks"):
+                workloads["pipelines"] = measured(stack, "pipelines", workload_pipelines, args.pipelines,
+                                                  args.data_size, args.think)
+    finally:
+        stack.stop()
+
+    report = {
+        "meta": {
+            "started": datetime.now().isoformat(),
+            "stack": "processes" if BENCH_REDIS_URL else "in-process",
+            "web_mode": args.web_mode if BENCH_REDIS_URL else "threading",
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "workloads": workloads,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if report.get("regressions"):
+        print(json.dumps({"regressions": report["regressions"]}, ensure_ascii=False))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,59 @@
-from flask import Flask, render_template, request, jsonify
-from flask_socketio import SocketIO, emit
-import redis
-import json
+import serving
+serving.monkey_patch()
+
+from flask import Flask, render_template, request, jsonify, g, Response, send_file, abort
+from flask_socketio import SocketIO, emit, join_room, leave_room
 import sys
 import os
+import socket
 import threading
 import time
+import uuid
 
 sys.path.append('../app')
-from tasks import run_interactive_pipeline
+# Задачи отправляются по имени: код задач, NumPy и движок веб-приложению не нужны
+from celery_client import send_pipeline_task, RUN_PIPELINE, RESUME_PIPELINE
+from input_channel import push_input, DISCONNECTED
+from pipeline_state import is_prompt_token
+from notifications import NOTIFY_TRANSPORT, NOTIFY_CHANNEL, decode_batch, encode_batch, relay_stream
+from step_cache import StepCache
+import idempotency
+import metrics
+import prompt_registry
+import redis_pool
+import reports
+import scheduler
+import serialization
+import snapshots
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key'
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=serving.WEB_ASYNC_MODE)
 
-# Redis для хранения пользовательского ввода
-redis_client = redis.Redis.from_url(os.environ.get("CELERY_RESULT_BACKEND", "redis://localhost:6379/0"))
+# Redis для пользовательского ввода, шины событий и статистики (общий пул соединений)
+redis_client = redis_pool.get_client(os.environ.get("CELERY_RESULT_BACKEND", "redis://localhost:6379/0"))
 
 # Хранилище активных сессий
 active_sessions = {}
+# Задача пайплайна, которая сейчас ждет ввода (pipeline_id -> task_id)
+pipeline_inputs = {}
 session_lock = threading.Lock()
+# Сколько секунд ждать переподключения, прежде чем отменить ожидающий ввод
+DISCONNECT_GRACE = float(os.environ.get("DISCONNECT_GRACE", "30"))
+# Скольким первым ожидающим пайплайнам рассылать место в очереди после каждого изменения
+QUEUE_POSITION_UPDATES = int(os.environ.get("QUEUE_POSITION_UPDATES", "100"))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    started = g.pop('request_started', None)
+    if started is not None and metrics.METRICS_ENABLED:
+        metrics.HTTP_REQUESTS.labels(request.endpoint or 'unknown', response.status_code).observe(
+            time.perf_counter() - started)
+    return response
 
 @app.route('/')
 def index():
@@ -31,38 +65,406 @@ def start_pipeline():
     try:
         data = request.json
         data_size = int(data.get('data_size', 100))
+        pipeline_id = str(uuid.uuid4())
+        session_id = data.get('session_id')
+        
+        # Повторный запрос (двойной клик, ретрай клиента) получает уже запущенный пайплайн
+        key, existing = claim_pipeline(data, data_size, pipeline_id)
+        if existing:
+            return jsonify(duplicate_pipeline(existing, session_id))
+        
+        # Подписываем сессию на комнату пайплайна до запуска, чтобы не потерять первые события
+        if session_id:
+            subscribe_session(session_id, pipeline_id)
+        
+        if not scheduler.PIPELINE_SCHEDULER:
+            try:
+                task_id = str(send_pipeline_task(RUN_PIPELINE, (data_size, pipeline_id)))
+            except Exception:
+                release_pipeline(key, pipeline_id)
+                raise
+            update_pipeline_claim(key, pipeline_id, task_id)
+            return jsonify({
+                'success': True,
+                'task_id': task_id,
+                'pipeline_id': pipeline_id,
+                'message': 'Интерактивный пайплайн запущен'
+            })
+        
+        job = {'pipeline_id': pipeline_id, 'data_size': data_size, 'priority': data.get('priority')}
+        started = schedule_pipelines(pipeline_user(data), [job])
+        if pipeline_id in started:
+            return jsonify({
+                'success': True,
+                'task_id': started[pipeline_id],
+                'pipeline_id': pipeline_id,
+                'queued': False,
+                'message': 'Интерактивный пайплайн запущен'
+            })
+        position = scheduler.position(redis_client, pipeline_id)
+        if position is None:
+            release_pipeline(key, pipeline_id)
+            return jsonify({'success': False, 'error': 'Не удалось запустить пайплайн'})
+        return jsonify({
+            'success': True,
+            'task_id': None,
+            'pipeline_id': pipeline_id,
+            'queued': True,
+            'position': position,
+            'message': 'Пайплайн поставлен в очередь'
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+def claim_pipeline(data, data_size, pipeline_id):
+    """Занимает ключ идемпотентности запуска; возвращает (ключ, запись уже запущенного или None)"""
+    user = pipeline_user(data)
+    client_key = idempotency.client_key(request)
+    key = idempotency.request_key('start_pipeline', client_key,
+                                  {'data_size': data_size, 'priority': data.get('priority')}, owner=user)
+    if key is None:
+        return None, None
+    # Выведенный ключ объединяет только запуски подряд, ключ клиента — все повторы
+    if client_key:
+        ttl, done_ttl = idempotency.IDEMPOTENCY_INFLIGHT_TTL, idempotency.IDEMPOTENCY_TTL
+    else:
+        ttl = done_ttl = idempotency.IDEMPOTENCY_DERIVED_WINDOW
+    record = {'pipeline_id': pipeline_id, 'task_id': None}
+    return key, idempotency.claim(redis_client, 'start_pipeline', key, pipeline_id, record, ttl, done_ttl)
+
+def update_pipeline_claim(key, pipeline_id, task_id):
+    if key:
+        idempotency.update(redis_client, key, pipeline_id, {'pipeline_id': pipeline_id, 'task_id': task_id})
+
+def release_pipeline(key, pipeline_id):
+    if key:
+        idempotency.release(redis_client, key, pipeline_id)
+
+def duplicate_pipeline(existing, session_id):
+    """Ответ на повторный запуск: тот же пайплайн, его очередь или завершение"""
+    pipeline_id = existing['record']['pipeline_id']
+    if session_id:
+        subscribe_session(session_id, pipeline_id)
+    response = {
+        'success': True,
+        'task_id': existing['record']['task_id'],
+        'pipeline_id': pipeline_id,
+        'deduplicated': True,
+        'completed': existing['state'] == 'done',
+        'message': 'Пайплайн уже запущен'
+    }
+    if scheduler.PIPELINE_SCHEDULER and not response['completed']:
+        position = scheduler.position(redis_client, pipeline_id)
+        response['queued'] = position is not None
+        if position is not None:
+            response['position'] = position
+    return response
+
+@app.route('/start_pipelines', methods=['POST'])
+def start_pipelines():
+    """Пакетный запуск: {"user_id", "priority", "pipelines": [{"data_size", "priority"}, ...]}"""
+    try:
+        data = request.json
+        items = data.get('pipelines') or []
+        if not items or len(items) > scheduler.MAX_BULK_START:
+            return jsonify({'success': False,
+                            'error': f'Нужно от 1 до {scheduler.MAX_BULK_START} пайплайнов'})
         
-        task_id = run_interactive_pipeline.delay(data_size)
+        jobs = [{'pipeline_id': str(uuid.uuid4()),
+                 'data_size': int(item.get('data_size', 100)),
+                 'priority': item.get('priority', data.get('priority'))} for item in items]
+        if scheduler.PIPELINE_SCHEDULER:
+            started = schedule_pipelines(pipeline_user(data), jobs)
+        else:
+            started = {job['pipeline_id']: str(send_pipeline_task(RUN_PIPELINE, (job['data_size'], job['pipeline_id'])))
+                       for job in jobs}
         
         return jsonify({
             'success': True,
-            'task_id': str(task_id),
-            'message': 'Интерактивный пайплайн запущен'
+            'pipelines': [{'pipeline_id': job['pipeline_id'],
+                           'task_id': started.get(job['pipeline_id']),
+                           'queued': job['pipeline_id'] not in started} for job in jobs],
+            'started': len(started),
+            'queued': len(jobs) - len(started)
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/scheduler')
+def scheduler_status():
+    """Заполненность планировщика и место пайплайна в очереди (?pipeline_id=)"""
+    try:
+        status = scheduler.stats(redis_client)
+        pipeline_id = request.args.get('pipeline_id')
+        if pipeline_id:
+            status['position'] = scheduler.position(redis_client, pipeline_id)
+        return jsonify({'success': True, 'scheduler': status})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+def pipeline_user(data):
+    """Владелец запуска для лимитов и честной очереди"""
+    return str(data.get('user_id') or request.headers.get('X-User-Id') or data.get('session_id')
+               or request.remote_addr or 'anonymous')
+
+def schedule_pipelines(user, jobs):
+    """Ставит пайплайны в планировщик и запускает допущенные; возвращает pipeline_id -> task_id"""
+    started = launch_pipelines(scheduler.submit(redis_client, user, jobs))
+    broadcast_queue_positions()
+    return started
+
+def launch_pipelines(jobs):
+    """Отправляет допущенные планировщиком пайплайны воркерам с их приоритетом"""
+    started = {}
+    for job in jobs:
+        metrics.observe_admission(job)
+        try:
+            result = send_pipeline_task(RUN_PIPELINE, (job['data_size'], job['pipeline_id']),
+                                        priority=scheduler.broker_priority(job['priority']))
+            started[job['pipeline_id']] = str(result)
+        except Exception as e:
+            print(f"Ошибка запуска пайплайна {job['pipeline_id']}: {e}")
+            scheduler.release(redis_client, job['pipeline_id'], admit=False)
+            finish_launch_claim(job['pipeline_id'], None)
+            continue
+        finish_launch_claim(job['pipeline_id'], started[job['pipeline_id']])
+    emit_to_pipelines('queue_position', [{'pipeline_id': pipeline_id, 'queued': False, 'position': 0}
+                                         for pipeline_id in started])
+    return started
+
+def finish_launch_claim(pipeline_id, task_id):
+    """Запуск из очереди: повторы получат task_id, а неудачная отправка освобождает ключ"""
+    if not idempotency.IDEMPOTENCY:
+        return
+    try:
+        if task_id:
+            idempotency.update_bound(redis_client, pipeline_id, {'pipeline_id': pipeline_id, 'task_id': task_id})
+        else:
+            idempotency.finish(redis_client, pipeline_id, False)
+    except Exception as e:
+        print(f"Ошибка ключа идемпотентности пайплайна: {e}")
+
+def broadcast_queue_positions():
+    """Сообщает ожидающим пайплайнам их место в очереди"""
+    emit_to_pipelines('queue_position', [{'pipeline_id': pipeline_id, 'queued': True, 'position': index + 1}
+                                         for index, pipeline_id in
+                                         enumerate(scheduler.queued(redis_client, QUEUE_POSITION_UPDATES))])
+
+def emit_to_pipelines(event, payloads):
+    """Рассылает сообщения в комнаты пайплайнов (payload['pipeline_id']).
+    
+    В режиме шины сообщения публикуются в канал и рассылаются всеми репликами:
+    клиенты пайплайна могут быть подключены к любой из них.
+    """
+    if not payloads:
+        return
+    if NOTIFY_TRANSPORT == 'redis':
+        redis_client.publish(NOTIFY_CHANNEL, encode_batch([{'socket_event': event, 'payload': payload}
+                                                           for payload in payloads]))
+        return
+    for payload in payloads:
+        socketio.emit(event, payload, to=payload['pipeline_id'])
+
+def update_scheduler(data):
+    """Освобождает место завершившегося пайплайна и продлевает аренду ждущего ввода"""
+    pipeline_id = data.get('pipeline_id')
+    status = data.get('status')
+    if not scheduler.PIPELINE_SCHEDULER or not pipeline_id:
+        return
+    if status in ('completed', 'error'):
+        launch_pipelines(scheduler.release(redis_client, pipeline_id))
+        broadcast_queue_positions()
+    elif status == 'input_required':
+        scheduler.renew(redis_client, pipeline_id)
+
+def finish_pipeline_claim(data):
+    """Завершение пайплайна: повторы его запуска получат результат, после ошибки — новый запуск"""
+    status = data.get('status')
+    if idempotency.IDEMPOTENCY and data.get('pipeline_id') and status in ('completed', 'error'):
+        idempotency.finish(redis_client, data['pipeline_id'], status == 'completed')
+
+def subscribe_session(session_id, pipeline_id):
+    """Добавляет сессию в комнату пайплайна"""
+    with session_lock:
+        session_data = active_sessions.get(session_id)
+        if session_data is None:
+            return False
+        previous = session_data.get('pipeline_id')
+        session_data['pipeline_id'] = pipeline_id
+        session_data['current_task_id'] = pipeline_inputs.get(pipeline_id)
+    if previous and previous != pipeline_id:
+        leave_room(previous, sid=session_id, namespace='/')
+    join_room(pipeline_id, sid=session_id, namespace='/')
+    return True
+
+def track_pending_input(data):
+    """Запоминает задачу, ожидающую ввода, у сессий пайплайна"""
+    pipeline_id = data.get('pipeline_id')
+    if not pipeline_id:
+        return
+    status = data.get('status')
+    if status == 'input_required':
+        task_id = (data.get('request_input') or {}).get('task_id')
+    elif status in ('timeout', 'warning', 'error', 'completed'):
+        task_id = None
+    else:
+        return
+    with session_lock:
+        if task_id:
+            pipeline_inputs[pipeline_id] = task_id
+        else:
+            pipeline_inputs.pop(pipeline_id, None)
+        for session_data in active_sessions.values():
+            if session_data.get('pipeline_id') == pipeline_id:
+                session_data['current_task_id'] = task_id
+
+def clear_pending_input(task_id):
+    """Сбрасывает ожидание ввода после ответа пользователя"""
+    cleared = []
+    with session_lock:
+        for pipeline_id, pending_task_id in list(pipeline_inputs.items()):
+            if pending_task_id == task_id:
+                pipeline_inputs.pop(pipeline_id)
+                cleared.append(pipeline_id)
+        for session_data in active_sessions.values():
+            if session_data.get('current_task_id') == task_id:
+                session_data['current_task_id'] = None
+    for pipeline_id in cleared:
+        snapshots.clear_pending(redis_client, pipeline_id)
+
+def dispatch_task_event(data):
+    """Обрабатывает событие задачи и пересылает его клиентам, подписанным на пайплайн"""
+    track_pending_input(data)
+    # Сначала снимок, потом рассылка: подписавшийся клиент не пропустит событие
+    emit_task_event(data, apply_task_event(data))
+
+def apply_task_event(data):
+    """Побочные эффекты события: снимок, планировщик и ключ идемпотентности.
+    
+    Выполняются один раз на событие (в режиме шины — репликой, прочитавшей пачку
+    из потока); возвращает версию снимка.
+    """
+    try:
+        version = snapshots.record_event(redis_client, data)
+    except Exception as e:
+        print(f"Ошибка обновления снимка пайплайна: {e}")
+        version = None
+    
+    try:
+        update_scheduler(data)
+    except Exception as e:
+        print(f"Ошибка планировщика пайплайнов: {e}")
+    
+    try:
+        finish_pipeline_claim(data)
+    except Exception as e:
+        print(f"Ошибка ключа идемпотентности пайплайна: {e}")
+    return version
+
+def apply_task_events(events):
+    """Обработчик пачки из потока: версия снимка уходит репликам вместе с событием"""
+    for data in events:
+        data['version'] = apply_task_event(data)
+    return events
+
+def emit_task_event(data, version):
+    """Рассылает событие задачи клиентам этой реплики"""
+    # События без pipeline_id (например, от старых воркеров) рассылаются всем
+    pipeline_id = data.get('pipeline_id')
+    socketio.emit('task_update', {
+        'task_name': data.get('task_name'),
+        'pipeline_id': pipeline_id,
+        'result': data.get('result'),
+        'status': data.get('status'),
+        'timestamp': data.get('timestamp'),
+        'error': data.get('error'),
+        'request_input': data.get('request_input'),
+        'progress_info': data.get('progress_info'),
+        'version': version
+    }, to=pipeline_id)
+    metrics.observe_event_latency(data.get('timestamp'), data.get('status'))
+
 @app.route('/task_result', methods=['POST'])
 def receive_task_result():
     """Получает результаты от Celery задач и отправляет через WebSocket"""
     try:
         data = request.json
         
-        # Отправляем результат всем подключенным клиентам
-        socketio.emit('task_update', {
-            'task_name': data.get('task_name'),
-            'result': data.get('result'),
-            'status': data.get('status'),
-            'timestamp': data.get('timestamp'),
-            'error': data.get('error'),
-            'request_input': data.get('request_input'),
-            'progress_info': data.get('progress_info')
-        })
+        # Отправляем результат клиентам пайплайна
+        dispatch_task_event(data)
         
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/task_results', methods=['POST'])
+def receive_task_results():
+    """Получает пачку событий от транспорта уведомлений воркера"""
+    try:
+        # Воркер с SERIALIZER=msgpack присылает пачку в двоичном виде
+        if request.mimetype == serialization.BINARY_CONTENT_TYPE:
+            events = decode_batch(request.get_data())
+        else:
+            events = request.json.get('events', [])
+        
+        for data in events:
+            dispatch_task_event(data)
+        
+        return jsonify({'success': True, 'received': len(events)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+def listen_event_bus():
+    """Пересылает клиентам события из шины Redis (каждая реплика — своим клиентам)"""
+    while True:
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(NOTIFY_CHANNEL)
+            for message in pubsub.listen():
+                if message['type'] != 'message':
+                    continue
+                for data in decode_batch(message['data']):
+                    if 'socket_event' in data:
+                        socketio.emit(data['socket_event'], data['payload'], to=data['payload']['pipeline_id'])
+                        continue
+                    # Побочные эффекты уже выполнила реплика, прочитавшая пачку из потока
+                    track_pending_input(data)
+                    emit_task_event(data, data.get('version'))
+        except Exception as e:
+            print(f"Ошибка подписки на шину событий: {e}")
+            time.sleep(1)
+
+def consume_event_stream():
+    """Читает поток событий воркеров в группе реплик и публикует обработанные пачки в канал"""
+    consumer = f"{socket.gethostname()}:{os.getpid()}"
+    while True:
+        try:
+            relay_stream(redis_client, apply_task_events, consumer)
+        except Exception as e:
+            print(f"Ошибка чтения потока событий: {e}")
+            time.sleep(1)
+
+def deliver_input(task_id, user_input, outcome="answered"):
+    """Передает ввод задаче: в блокирующем режиме — в канал ввода (воркер ждет на BLPOP),
+    в возобновляемом — ставит в очередь продолжение пайплайна.
+    
+    Ввод доставляется, только если запрос еще ждет в реестре (prompt_registry);
+    возвращает False для истекшего или уже отвеченного запроса. Если доставить
+    не удалось, запрос возвращается в реестр: повтор ответа или таймаут его закроют.
+    """
+    deadline = prompt_registry.take(redis_client, task_id, outcome)
+    if deadline is None:
+        return False
+    try:
+        if is_prompt_token(task_id):
+            send_pipeline_task(RESUME_PIPELINE, (task_id, user_input))
+        else:
+            push_input(redis_client, task_id, user_input)
+    except Exception:
+        prompt_registry.restore(redis_client, task_id, deadline, outcome)
+        raise
+    return True
+
 @app.route('/submit_input', methods=['POST'])
 def submit_input():
     """Принимает пользовательский ввод и передает его задаче"""
@@ -71,14 +473,82 @@ def submit_input():
         task_id = data.get('task_id')
         user_input = data.get('input')
         
-        # Сохраняем ввод пользователя в Redis
-        input_key = f"user_input:{task_id}"
-        redis_client.set(input_key, json.dumps(user_input), ex=300)  # 5 минут TTL
+        delivered = deliver_input(task_id, user_input)
+        clear_pending_input(task_id)
         
+        if not delivered:
+            return jsonify({'success': False, 'error': 'Запрос ввода уже закрыт (таймаут или другой ответ)'})
         return jsonify({'success': True, 'message': 'Ввод принят'})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/cache_stats')
+def cache_stats():
+    """Статистика кэша результатов шагов: попадания, промахи, вытеснения"""
+    try:
+        return jsonify({'success': True, 'stats': StepCache(redis_client).stats()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/pending_prompts')
+def pending_prompts():
+    """Запросы ввода: ожидающие и просроченные по режимам, итоги снятых"""
+    try:
+        return jsonify({'success': True, 'prompts': prompt_registry.counts(redis_client)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/idempotency_stats')
+def idempotency_stats():
+    """Повторные запуски: новые, присоединенные к идущей работе и получившие готовый результат"""
+    try:
+        return jsonify({'success': True, 'stats': idempotency.stats(redis_client)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/reports/<report_id>')
+def report_manifest(report_id):
+    """Описание готового отчета: формат, файлы и их размеры"""
+    manifest = reports.load_manifest(report_id)
+    if manifest is None:
+        return jsonify({'success': False, 'error': 'Отчет не найден'}), 404
+    return jsonify({'success': True, 'report': manifest})
+
+@app.route('/reports/<report_id>/<name>')
+def report_download(report_id, name):
+    """Отдает файл отчета потоком с диска; поддерживает Range и условные запросы"""
+    path, content_type = reports.report_file(report_id, name)
+    if path is None:
+        abort(404)
+    return send_file(path, mimetype=content_type, conditional=True,
+                     as_attachment=request.args.get('download') == '1', download_name=name)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Метрики в формате Prometheus"""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+@app.route('/traces/<pipeline_id>')
+def pipeline_trace(pipeline_id):
+    """Интервалы пайплайна (очередь, выполнение задач, ожидание ввода), если TRACE_PIPELINES=true"""
+    try:
+        return jsonify({'success': True, 'pipeline_id': pipeline_id,
+                        'spans': metrics.load_trace(redis_client, pipeline_id)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+def send_snapshot(session_id, pipeline_id):
+    """Отправляет клиенту текущее состояние пайплайна одним сообщением"""
+    if not snapshots.PIPELINE_SNAPSHOTS:
+        return
+    try:
+        snapshot = snapshots.load_snapshot(redis_client, pipeline_id)
+    except Exception as e:
+        print(f"Ошибка чтения снимка пайплайна: {e}")
+        return
+    emit('snapshot', snapshot or {'pipeline_id': pipeline_id, 'version': 0}, to=session_id)
+
 @socketio.on('connect')
 def handle_connect():
     session_id = request.sid
@@ -86,10 +556,29 @@ def handle_connect():
         active_sessions[session_id] = {
             'connected_at': time.time(),
             'last_activity': time.time(),
+            'pipeline_id': None,
             'current_task_id': None
         }
+    metrics.ACTIVE_SESSIONS.inc()
     print(f'Клиент подключился: {session_id}')
     emit('connected', {'message': 'Подключение установлено', 'session_id': session_id})
+    
+    # Клиент может сразу указать пайплайн: io({query: {pipeline_id}})
+    pipeline_id = request.args.get('pipeline_id')
+    if pipeline_id:
+        subscribe_session(session_id, pipeline_id)
+        send_snapshot(session_id, pipeline_id)
+
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Подписывает клиента на события пайплайна (например, после переподключения)"""
+    pipeline_id = (data or {}).get('pipeline_id')
+    if not pipeline_id:
+        emit('subscribed', {'success': False, 'error': 'Не указан pipeline_id'})
+        return
+    subscribe_session(request.sid, pipeline_id)
+    emit('subscribed', {'success': True, 'pipeline_id': pipeline_id})
+    send_snapshot(request.sid, pipeline_id)
 
 @socketio.on('disconnect')
 def handle_disconnect():
@@ -97,24 +586,45 @@ def handle_disconnect():
     with session_lock:
         if session_id in active_sessions:
             session_data = active_sessions.pop(session_id)
+            metrics.ACTIVE_SESSIONS.dec()
             current_task_id = session_data.get('current_task_id')
+            pipeline_id = session_data.get('pipeline_id')
+            
+            # Не отменяем ввод, пока пайплайн открыт в другой вкладке
+            watched = any(s.get('pipeline_id') == pipeline_id for s in active_sessions.values())
             
-            if current_task_id:
-                # Отправляем сигнал об отключении в Redis
-                cancel_user_input(current_task_id)
-                print(f'Клиент отключился, отменяем задачу: {current_task_id}')
+            if current_task_id and not watched:
+                # Даем время переподключиться, прежде чем отменять ввод
+                socketio.start_background_task(cancel_after_grace, pipeline_id, current_task_id)
     
     print(f'Клиент отключился: {session_id}')
 
+def cancel_after_grace(pipeline_id, task_id):
+    """Отменяет ввод, если за DISCONNECT_GRACE никто не вернулся к пайплайну"""
+    if DISCONNECT_GRACE > 0:
+        socketio.sleep(DISCONNECT_GRACE)
+    with session_lock:
+        watched = any(s.get('pipeline_id') == pipeline_id for s in active_sessions.values())
+        pending = pipeline_inputs.get(pipeline_id) == task_id
+    if pending and not watched:
+        # Отправляем сигнал об отключении в Redis
+        cancel_user_input(task_id)
+        print(f'Клиент не вернулся, отменяем задачу: {task_id}')
+
 def cancel_user_input(task_id):
     """Отменяет ожидание пользовательского ввода"""
     try:
-        # Отправляем значение по умолчанию в Redis
-        input_key = f"user_input:{task_id}"
-        default_response = "DISCONNECTED"
-        redis_client.set(input_key, json.dumps(default_response), ex=10)
+        # Будим ожидающую задачу сигналом отключения
+        deliver_input(task_id, DISCONNECTED, outcome="disconnected")
     except Exception as e:
         print(f"Ошибка при отмене ввода: {e}")
 
+# В режиме шины события приходят из Redis, HTTP-эндпоинты остаются запасным путем
+if NOTIFY_TRANSPORT == 'redis':
+    socketio.start_background_task(listen_event_bus)
+    socketio.start_background_task(consume_event_stream)
+
 if __name__ == '__main__':
-    socketio.run(app, host='0.0.0.0', port=8000, debug=True, allow_unsafe_werkzeug=True)
+    # Запуск для разработки; в продакшне: gunicorn -c gunicorn.conf.py app:app (см. WEB_ASYNC_MODE)
+    socketio.run(app, host=serving.WEB_HOST, port=serving.WEB_PORT, debug=serving.WEB_DEBUG,
+                 allow_unsafe_werkzeug=True)
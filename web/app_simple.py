@@ -1,69 +1,211 @@
+import serving
+serving.monkey_patch()
+
 from flask import Flask, render_template, request, jsonify
+from celery import group, states
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+from celery.result import AsyncResult, ResultSet
+import os
 import sys
+import uuid
 
 sys.path.append('../app')
 
-from tasks_simple import add, sleep, echo, error
+# Задачи отправляются по имени: код задач (tasks_simple) веб-приложению не нужен
+from batching import CallBatcher, BATCHABLE_TASKS
+import celery_client
+import idempotency
+import redis_pool
 
 app = Flask(__name__, static_folder='static')
 
+# Верхняя граница long-polling одного запроса и размера пакета задач
+TASK_MAX_WAIT = float(os.environ.get("TASK_MAX_WAIT", "25"))
+TASK_MAX_BATCH = int(os.environ.get("TASK_MAX_BATCH", "1000"))
+
+# Пакетный режим для дешевых задач (add, echo): один Celery-вызов на окно TASK_BATCH_WINDOW
+TASK_BATCHING = os.environ.get("TASK_BATCHING", "false").lower() in ("1", "true", "yes")
+batcher = CallBatcher(celery_client.get_app().signature(celery_client.RUN_BATCH)) if TASK_BATCHING else None
+
+# Сколько секунд /execute_task ждет результат задачи
+EXECUTE_TIMEOUTS = {'sleep': 60}
+
+# Redis для ключей идемпотентности (общий пул соединений)
+redis_client = redis_pool.get_client(os.environ.get("CELERY_RESULT_BACKEND", "redis://localhost:6379/0"))
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/execute_task', methods=['POST'])
 def execute_task():
-    data = request.json
+    """Выполняет задачу и ждет результат; повтор того же запроса не запускает ее заново"""
+    try:
+        data = request.json
+        signature = build_signature(data)
+        task_id = str(uuid.uuid4())
+        
+        # Ключ клиента или хеш задачи с аргументами
+        client_key = idempotency.client_key(request)
+        key = idempotency.request_key('execute_task', client_key,
+                                      [signature.task, list(signature.args), signature.kwargs])
+        # Выведенный ключ объединяет только запросы подряд, ключ клиента — все повторы
+        if client_key:
+            ttl, done_ttl = idempotency.IDEMPOTENCY_INFLIGHT_TTL, idempotency.IDEMPOTENCY_TTL
+        else:
+            ttl = done_ttl = idempotency.IDEMPOTENCY_DERIVED_WINDOW
+        existing = idempotency.claim(redis_client, 'execute_task', key, task_id, {'task_id': task_id},
+                                     ttl, done_ttl) if key else None
+        if existing and existing['state'] == 'done':
+            return jsonify({'success': True, **existing['record'], 'deduplicated': True})
+        
+        if existing:
+            # Такая же задача уже выполняется: ждем ее результат, а не ставим новую
+            task_id = existing['record']['task_id']
+            result = AsyncResult(task_id, app=celery_client.get_app())
+        else:
+            try:
+                result = signature.apply_async(task_id=task_id)
+            except Exception:
+                # Задача не отправлена (брокер недоступен): повтор должен поставить ее заново
+                if key:
+                    idempotency.release(redis_client, key, task_id)
+                raise
+        
+        try:
+            task_result = result.get(timeout=EXECUTE_TIMEOUTS.get(data.get('task'), 30))
+        except CeleryTimeoutError:
+            # Задача еще идет: ключ остается за ней, повтор подождет ее же
+            raise
+        except Exception:
+            if key and not existing:
+                idempotency.release(redis_client, key, task_id)
+            raise
+        
+        if data.get('task') == 'sleep':
+            task_result = f'Задача завершена после {int(data.get("seconds", 1))} секунд'
+        response = {'result': task_result, 'task_id': task_id}
+        if key and not existing:
+            idempotency.complete(redis_client, key, task_id, response, done_ttl)
+        return jsonify({'success': True, **response, 'deduplicated': bool(existing)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+def build_signature(data):
+    """Собирает сигнатуру задачи по имени из параметров запроса"""
     task_name = data.get('task')
     
+    if task_name == 'add':
+        args = (int(data.get('x', 0)), int(data.get('y', 0)))
+    elif task_name == 'sleep':
+        args = (int(data.get('seconds', 1)),)
+    elif task_name == 'echo':
+        args = (data.get('message', 'Hello World'), data.get('timestamp', False))
+    elif task_name == 'error':
+        args = (data.get('error_message', 'Test error'),)
+    else:
+        raise ValueError('Неизвестная задача')
+    
+    return celery_client.get_app().signature(celery_client.SIMPLE_TASK.format(task_name), args=args)
+
+def submit_signature(signature):
+    """Отправляет задачу: дешевые вызовы через пакетный режим, остальные напрямую"""
+    if batcher is not None and signature.task in BATCHABLE_TASKS:
+        return batcher.submit(signature)
+    return signature.apply_async()
+
+def describe_result(result):
+    """Состояние задачи в формате ответа API"""
+    state = result.state
+    info = {'task_id': result.id, 'state': state, 'ready': state in states.READY_STATES}
+    if state == states.SUCCESS:
+        info['result'] = result.result
+    elif state in states.PROPAGATE_STATES:
+        info['error'] = str(result.result)
+    return info
+
+def requested_wait():
+    """Время long-polling из ?wait=, ограниченное TASK_MAX_WAIT"""
     try:
-        if task_name == 'add':
-            x = int(data.get('x', 0))
-            y = int(data.get('y', 0))
-            result = add.delay(x, y)
-            task_result = result.get(timeout=30)
-            return jsonify({
-                'success': True, 
-                'result': task_result,
-                'task_id': result.id
-            })
-            
-        elif task_name == 'sleep':
-            seconds = int(data.get('seconds', 1))
-            result = sleep.delay(seconds)
-            task_result = result.get(timeout=60)
-            return jsonify({
-                'success': True, 
-                'result': f'Задача завершена после {seconds} секунд',
-                'task_id': result.id
-            })
-            
-        elif task_name == 'echo':
-            msg = data.get('message', 'Hello World')
-            timestamp = data.get('timestamp', False)
-            result = echo.delay(msg, timestamp)
-            task_result = result.get(timeout=30)
-            return jsonify({
-                'success': True, 
-                'result': task_result,
-                'task_id': result.id
-            })
-            
-        elif task_name == 'error':
-            msg = data.get('error_message', 'Test error')
-            result = error.delay(msg)
-            task_result = result.get(timeout=30)
-            return jsonify({
-                'success': True, 
-                'result': task_result,
-                'task_id': result.id
-            })
-            
-        else:
-            return jsonify({'success': False, 'error': 'Неизвестная задача'})
-            
+        return max(0.0, min(float(request.args.get('wait', 0)), TASK_MAX_WAIT))
+    except ValueError:
+        return 0.0
+
+@app.route('/tasks', methods=['POST'])
+def submit_task():
+    """Ставит задачу в очередь и сразу возвращает ее идентификатор"""
+    try:
+        result = submit_signature(build_signature(request.json))
+        return jsonify({'success': True, 'task_id': result.id}), 202
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/idempotency_stats')
+def idempotency_stats():
+    """Повторные запросы: новые, присоединенные к идущей задаче и получившие готовый результат"""
+    try:
+        return jsonify({'success': True, 'stats': idempotency.stats(redis_client)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/tasks/<task_id>', methods=['GET'])
+def task_status(task_id):
+    """Состояние и результат задачи; ?wait=N ждет готовности не дольше N секунд"""
+    try:
+        result = AsyncResult(task_id, app=celery_client.get_app())
+        wait = requested_wait()
+        if wait and not result.ready():
+            try:
+                result.get(timeout=wait, propagate=False)
+            except CeleryTimeoutError:
+                pass
+        return jsonify({'success': True, **describe_result(result)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/tasks/batch', methods=['POST'])
+def submit_batch():
+    """Ставит в очередь пакет задач одной группой Celery"""
+    try:
+        items = request.json.get('tasks', [])
+        if not items or len(items) > TASK_MAX_BATCH:
+            return jsonify({'success': False, 'error': f'Пакет должен содержать от 1 до {TASK_MAX_BATCH} задач'})
+        
+        signatures = [build_signature(item) for item in items]
+        
+        # Пакет из одних дешевых задач уходит через run_batch, а не отдельными сообщениями
+        if batcher is not None and all(sig.task in BATCHABLE_TASKS for sig in signatures):
+            results = [batcher.submit(sig) for sig in signatures]
+            return jsonify({'success': True, 'group_id': None, 'task_ids': [r.id for r in results]}), 202
+        
+        group_result = group(signatures).apply_async()
+        return jsonify({
+            'success': True,
+            'group_id': group_result.id,
+            'task_ids': [result.id for result in group_result.results]
+        }), 202
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/tasks/results', methods=['POST'])
+def batch_results():
+    """Результаты нескольких задач за один запрос; ?wait=N ждет готовности всех"""
+    try:
+        task_ids = request.json.get('task_ids', [])[:TASK_MAX_BATCH]
+        results = ResultSet([AsyncResult(task_id, app=celery_client.get_app()) for task_id in task_ids])
+        wait = requested_wait()
+        if wait and not results.ready():
+            try:
+                if results.supports_native_join:
+                    results.join_native(timeout=wait, propagate=False)
+                else:
+                    results.join(timeout=wait, propagate=False)
+            except CeleryTimeoutError:
+                pass
+        return jsonify({'success': True, 'results': [describe_result(r) for r in results.results]})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8000, debug=True)
+    # В режиме gevent ожидание result.get не занимает поток ОС
+    serving.run_wsgi(app)
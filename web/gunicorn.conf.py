@@ -0,0 +1,23 @@
+import os
+
+# Продакшн-запуск: gunicorn -c gunicorn.conf.py app:app
+# Socket.IO-серверу нужен один воркер на процесс (или sticky sessions перед несколькими
+# репликами); масштабирование соединений обеспечивают зеленые потоки gevent.
+
+bind = f"{os.environ.get('WEB_HOST', '0.0.0.0')}:{os.environ.get('WEB_PORT', '8000')}"
+async_mode = os.environ.get("WEB_ASYNC_MODE", "gevent")
+worker_class = {"threading": "gthread", "gevent": "gevent"}.get(async_mode)
+if worker_class is None:
+    raise ValueError("WEB_ASYNC_MODE должен быть threading или gevent")
+workers = int(os.environ.get("WEB_WORKERS", "1"))
+worker_connections = int(os.environ.get("WEB_WORKER_CONNECTIONS", "10000"))
+timeout = int(os.environ.get("WEB_TIMEOUT", "120"))
+keepalive = 5
+accesslog = os.environ.get("WEB_ACCESS_LOG") or None
+
+
+def child_exit(server, worker):
+    """Убирает файлы метрик завершившегося воркера (PROMETHEUS_MULTIPROC_DIR)"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
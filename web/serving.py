@@ -0,0 +1,30 @@
+import os
+
+# Параметры запуска веб-приложений.
+# WEB_ASYNC_MODE выбирает модель конкурентности: threading (Werkzeug, для разработки),
+# gevent (зеленые потоки: тысячи WebSocket-соединений в одном процессе, а синхронные
+# клиенты Redis и Celery становятся неблокирующими после monkey patching).
+
+WEB_ASYNC_MODES = ("threading", "gevent")
+WEB_ASYNC_MODE = os.environ.get("WEB_ASYNC_MODE", "threading")
+if WEB_ASYNC_MODE not in WEB_ASYNC_MODES:
+    raise ValueError(f"WEB_ASYNC_MODE должен быть одним из: {', '.join(WEB_ASYNC_MODES)}")
+WEB_HOST = os.environ.get("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.environ.get("WEB_PORT", "8000"))
+WEB_DEBUG = os.environ.get("WEB_DEBUG", "false").lower() in ("1", "true", "yes")
+
+
+def monkey_patch():
+    """Патчит стандартную библиотеку под выбранный режим; вызывается до остальных импортов"""
+    if WEB_ASYNC_MODE == "gevent":
+        from gevent import monkey
+        monkey.patch_all()
+
+
+def run_wsgi(app):
+    """Запускает обычное Flask-приложение согласно WEB_ASYNC_MODE"""
+    if WEB_ASYNC_MODE == "gevent":
+        from gevent.pywsgi import WSGIServer
+        WSGIServer((WEB_HOST, WEB_PORT), app).serve_forever()
+    else:
+        app.run(host=WEB_HOST, port=WEB_PORT, debug=WEB_DEBUG, threaded=True)
@@ -0,0 +1,82 @@
+import json
+import os
+
+# Снимок состояния пайплайна для переподключившихся клиентов.
+# Веб-приложение по мере прихода событий обновляет хэш pipeline_snapshot:{pipeline_id}:
+# поля прогресса (p:overall_progress, p:current_step, ...), последнее событие каждой
+# задачи (t:{task_name}), ожидающий запрос ввода (pending), общий статус и номер
+# версии. Обновление — одна pipeline-запись только изменившихся полей, без чтения.
+# При подключении или подписке клиент получает снимок одним сообщением, а затем
+# обычные события; по номеру версии клиент отбрасывает то, что уже есть в снимке.
+
+PIPELINE_SNAPSHOTS = os.environ.get("PIPELINE_SNAPSHOTS", "true").lower() in ("1", "true", "yes")
+SNAPSHOT_TTL = int(os.environ.get("SNAPSHOT_TTL", str(24 * 3600)))
+
+SNAPSHOT_KEY = "pipeline_snapshot:{}"
+PROGRESS_PREFIX = "p:"
+TASK_PREFIX = "t:"
+
+# События, после которых запрос ввода больше не ожидает ответа
+RESOLVED_STATUSES = ("timeout", "warning", "error", "completed")
+
+
+def snapshot_key(pipeline_id):
+    return SNAPSHOT_KEY.format(pipeline_id)
+
+
+def record_event(redis_client, data):
+    """Вносит событие в снимок пайплайна; возвращает новую версию или None"""
+    pipeline_id = data.get("pipeline_id")
+    if not PIPELINE_SNAPSHOTS or not pipeline_id:
+        return None
+
+    status = data.get("status")
+    fields = {"status": status, "updated_at": data.get("timestamp") or ""}
+    for name, value in (data.get("progress_info") or {}).items():
+        if name not in ("delta", "pipeline_id"):
+            fields[PROGRESS_PREFIX + name] = json.dumps(value)
+    if data.get("task_name"):
+        fields[TASK_PREFIX + data["task_name"]] = json.dumps({"status": status, "result": data.get("result"),
+                                                              "error": data.get("error")})
+    if status == "input_required":
+        fields["pending"] = json.dumps(data.get("request_input"))
+
+    key = snapshot_key(pipeline_id)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hset(key, mapping=fields)
+    if status in RESOLVED_STATUSES:
+        pipe.hdel(key, "pending")
+    pipe.hincrby(key, "version", 1)
+    pipe.expire(key, SNAPSHOT_TTL)
+    return pipe.execute()[-2]
+
+
+def clear_pending(redis_client, pipeline_id):
+    """Убирает запрос ввода из снимка после ответа пользователя"""
+    if PIPELINE_SNAPSHOTS and pipeline_id:
+        redis_client.hdel(snapshot_key(pipeline_id), "pending")
+
+
+def load_snapshot(redis_client, pipeline_id):
+    """Снимок пайплайна в виде сообщения клиенту или None, если его нет"""
+    raw = redis_client.hgetall(snapshot_key(pipeline_id))
+    if not raw:
+        return None
+
+    fields = {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+              for k, v in raw.items()}
+    snapshot = {
+        "pipeline_id": pipeline_id,
+        "version": int(fields.get("version", 0)),
+        "status": fields.get("status"),
+        "updated_at": fields.get("updated_at"),
+        "pending": json.loads(fields["pending"]) if "pending" in fields else None,
+        "progress_info": {"pipeline_id": pipeline_id},
+        "tasks": {},
+    }
+    for name, value in fields.items():
+        if name.startswith(PROGRESS_PREFIX):
+            snapshot["progress_info"][name[len(PROGRESS_PREFIX):]] = json.loads(value)
+        elif name.startswith(TASK_PREFIX):
+            snapshot["tasks"][name[len(TASK_PREFIX):]] = json.loads(value)
+    return snapshot